@@ -0,0 +1,12 @@
+# === VARIACIONES DE AUMENTACIÓN ===
+# Nombres de las variaciones, en el orden en que se generan con el presupuesto completo. Los usan
+# la test-time augmentation de la API (aplicar_aumentacion en main.py y lote_tensorial en
+# reconocimiento.py) y el entrenamiento con --aumentar (entrenar_modelo.py). Sin dependencias,
+# para no importar PyTorch con main.py.
+VARIACIONES = ("original", "rotacion-5", "rotacion5", "rotacion-10", "rotacion10",
+               "brillo0.8", "brillo1.2", "contraste0.9", "contraste1.1", "suavizado", "nitidez")
+PRESUPUESTOS_TTA = {
+    "completa": VARIACIONES,
+    "media": ("original", "rotacion-5", "rotacion5", "brillo0.8", "brillo1.2"),
+    "minima": ("original",),
+}
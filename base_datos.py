@@ -0,0 +1,98 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from mysql.connector import pooling
+
+# === POOL DE CONEXIONES MYSQL ===
+# Las conexiones se reutilizan entre solicitudes (sin handshake por solicitud). El pool se crea
+# en la primera consulta, así la API arranca aunque la base no esté disponible todavía.
+
+class PoolMySQL:
+    """Pool de conexiones con verificación de salud y un ejecutor propio para usarlo desde async"""
+
+    def __init__(self, config: dict, tamano: int = 5, nombre: str = "percepcion",
+                 observar_espera: Optional[Callable[[float], None]] = None):
+        self.config = config
+        self.tamano = tamano
+        self.nombre = nombre
+        self.observar_espera = observar_espera  # recibe los segundos esperados por cada conexión
+        self.reconexiones = 0
+        self.en_uso = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        # MySQLConnectionPool falla si no hay conexiones libres; el semáforo hace esperar en su lugar
+        self._libres = threading.BoundedSemaphore(tamano)
+        self._ejecutor = ThreadPoolExecutor(max_workers=tamano, thread_name_prefix="db")
+
+    def _obtener_pool(self) -> pooling.MySQLConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name=self.nombre, pool_size=self.tamano, pool_reset_session=True, **self.config)
+            return self._pool
+
+    def _verificar(self, conn):
+        """Reconecta las conexiones que el servidor cerró (wait_timeout, reinicios, red)"""
+        if not conn.is_connected():
+            conn.reconnect(attempts=3, delay=1)
+            with self._lock:
+                self.reconexiones += 1
+            print(f"🔌 Conexión MySQL restablecida ({self.reconexiones} reconexiones)")
+
+    def tipo_columna(self, cursor, tabla: str, columna: str) -> Optional[str]:
+        """Tipo de la columna en minúsculas (p. ej. "longblob"), o None si no existe"""
+        cursor.execute("""SELECT DATA_TYPE FROM information_schema.COLUMNS
+                          WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s""",
+                       (tabla, columna))
+        fila = cursor.fetchone()
+        if fila is None:
+            return None
+        tipo = fila[0]
+        return (tipo.decode() if isinstance(tipo, (bytes, bytearray)) else tipo).lower()
+
+    def columna_obligatoria(self, cursor, tabla: str, columna: str) -> Optional[bool]:
+        """True si la columna es NOT NULL, False si admite NULL, o None si no existe"""
+        cursor.execute("""SELECT IS_NULLABLE FROM information_schema.COLUMNS
+                          WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s""",
+                       (tabla, columna))
+        fila = cursor.fetchone()
+        if fila is None:
+            return None
+        nula = fila[0]
+        return (nula.decode() if isinstance(nula, (bytes, bytearray)) else nula).upper() == "NO"
+
+    @contextmanager
+    def conexion(self):
+        """Conexión del pool; se devuelve al salir (con rollback si hubo un error)"""
+        inicio = time.perf_counter()
+        with self._libres:
+            conn = self._obtener_pool().get_connection()
+            if self.observar_espera is not None:
+                self.observar_espera(time.perf_counter() - inicio)
+            with self._lock:
+                self.en_uso += 1
+            try:
+                self._verificar(conn)
+                yield conn
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise
+            finally:
+                conn.close()
+                with self._lock:
+                    self.en_uso -= 1
+
+    async def ejecutar(self, funcion, *args, **kwargs):
+        """Ejecuta ``funcion`` (que usa conexion()) en el ejecutor del pool sin bloquear el event loop"""
+        contexto = contextvars.copy_context()  # conserva los tiempos por etapa de la solicitud
+        llamada = functools.partial(contexto.run, funcion, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._ejecutor, llamada)
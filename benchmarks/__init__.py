@@ -0,0 +1,4 @@
+"""Benchmarks y verificaciones de rendimiento que se ejecutan sin conexión.
+
+Ejecutar desde la raíz del proyecto, por ejemplo: ``python -m benchmarks.bench_similitud``
+"""
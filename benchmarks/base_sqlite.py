@@ -0,0 +1,115 @@
+"""Base SQLite con la interfaz de PoolMySQL, para correr la API completa sin un servidor MySQL"""
+import re
+import sqlite3
+
+from base_datos import PoolMySQL
+
+# Misma tabla usuario que la base MySQL (usuario_foto y galeria_version las crea main.asegurar_tablas)
+SQL_CREAR_USUARIO = """CREATE TABLE IF NOT EXISTS usuario (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT,
+    apellido TEXT,
+    codigo TEXT UNIQUE,
+    correo TEXT,
+    requisitoriado INTEGER,
+    foto BLOB,
+    kp BLOB
+)"""
+
+# Sentencias de MySQL que usa main.py y que SQLite escribe distinto
+TRADUCCIONES = [
+    (re.compile(r"^\s*TRUNCATE\s+TABLE\s+(\w+)", re.IGNORECASE), r"DELETE FROM \1"),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE), "INSERT OR IGNORE"),
+]
+
+def traducir(sql: str) -> str:
+    sql = sql.replace("%s", "?")
+    for patron, reemplazo in TRADUCCIONES:
+        sql = patron.sub(reemplazo, sql)
+    return sql
+
+class CursorSQLite:
+    """Cursor con la parte de la interfaz de mysql.connector que usa la API (incluido dictionary=True)"""
+
+    def __init__(self, conn: sqlite3.Connection, dictionary: bool = False):
+        self._cursor = conn.cursor()
+        self.dictionary = dictionary
+
+    def execute(self, sql: str, parametros=()):
+        self._cursor.execute(traducir(sql), tuple(parametros))
+
+    def executemany(self, sql: str, filas):
+        self._cursor.executemany(traducir(sql), list(filas))
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def _fila(self, fila):
+        if fila is None or not self.dictionary:
+            return fila
+        return dict(zip((columna[0] for columna in self._cursor.description), fila))
+
+    def fetchone(self):
+        return self._fila(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._fila(fila) for fila in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+class ConexionSQLite:
+    def __init__(self, ruta: str):
+        # timeout: espera a que se libere el bloqueo de escritura en lugar de fallar de inmediato
+        self._conn = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+
+    def cursor(self, dictionary: bool = False) -> CursorSQLite:
+        return CursorSQLite(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def is_connected(self) -> bool:
+        return True
+
+class PoolSQLite(PoolMySQL):
+    """PoolMySQL sobre un archivo SQLite: mismo semáforo, mismo ejecutor y mismo manejo de errores.
+
+    Se instala con ``main.db = PoolSQLite(ruta)`` antes de la primera consulta.
+    """
+
+    def __init__(self, ruta: str, tamano: int = 5, observar_espera=None):
+        super().__init__({}, tamano=tamano, nombre="sqlite", observar_espera=observar_espera)
+        self.ruta = ruta
+        conn = sqlite3.connect(ruta)
+        conn.execute("PRAGMA journal_mode=WAL")  # lecturas concurrentes mientras otro hilo escribe
+        conn.execute(SQL_CREAR_USUARIO)
+        conn.commit()
+        conn.close()
+
+    def _obtener_pool(self):
+        return self
+
+    def tipo_columna(self, cursor, tabla: str, columna: str):
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        tipos = {fila[1]: fila[2].lower() for fila in cursor.fetchall()}
+        return tipos.get(columna)
+
+    def columna_obligatoria(self, cursor, tabla: str, columna: str):
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        obligatorias = {fila[1]: bool(fila[3]) for fila in cursor.fetchall()}
+        return obligatorias.get(columna)
+
+    def get_connection(self) -> ConexionSQLite:
+        return ConexionSQLite(self.ruta)
@@ -0,0 +1,51 @@
+"""Recall@1 y latencia de la búsqueda ANN (IVF) frente a la búsqueda exacta"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.comun import consultas_sinteticas, galeria_sintetica, medir, resumen
+from galeria import GaleriaEmbeddings
+from indice_ann import IndiceIVF
+
+def mejor_usuario(galeria: GaleriaEmbeddings, consultas: np.ndarray) -> int:
+    ids, puntajes = galeria.puntuar(consultas)
+    return int(ids[np.argmax(puntajes)]) if puntajes.size else -1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--usuarios", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--sondeos", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--consultas", type=int, default=100)
+    args = parser.parse_args()
+
+    resultados = []
+    for n_usuarios in args.usuarios:
+        usuarios = galeria_sintetica(n_usuarios)
+        filas = [(i + 1, bloque) for i, bloque in enumerate(usuarios)]
+        elegidos, consultas = consultas_sinteticas(usuarios, min(args.consultas, n_usuarios))
+
+        exacta = GaleriaEmbeddings()
+        exacta.cargar(filas)
+        esperados = [mejor_usuario(exacta, q) for q in consultas]
+        t_exacta = resumen([t for q in consultas for t in medir(lambda: exacta.puntuar(q))])
+        resultados.append({"usuarios": n_usuarios, "modo": "exacta", "recall@1": 1.0, **t_exacta})
+        print(f"📊 {n_usuarios} usuarios | exacta | p50 {t_exacta['p50_ms']:.2f} ms")
+
+        indice = IndiceIVF(min_filas=0)
+        ann = GaleriaEmbeddings(indice=indice)
+        ann.cargar(filas)
+        for n_sondeos in args.sondeos:
+            indice.n_sondeos = n_sondeos
+            obtenidos = [mejor_usuario(ann, q) for q in consultas]
+            recall = float(np.mean([o == e for o, e in zip(obtenidos, esperados)]))
+            t_ann = resumen([t for q in consultas for t in medir(lambda: ann.puntuar(q))])
+            resultados.append({"usuarios": n_usuarios, "modo": "ann", "listas": len(ann.exportar()[3]),
+                               "sondeos": n_sondeos, "recall@1": recall, **t_ann})
+            print(f"📊 {n_usuarios} usuarios | ann sondeos={n_sondeos:<3} | recall@1 {recall:.3f} "
+                  f"| p50 {t_ann['p50_ms']:.2f} ms")
+
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Suite de rendimiento de la API: micro-benchmarks y pruebas de carga con galerías sintéticas, sin MySQL.
+
+Cada escenario corre en un proceso nuevo, en una carpeta temporal con una copia del modelo y una
+base SQLite (benchmarks/base_sqlite.py) en lugar de MySQL. Los resultados se guardan en JSON para
+comparar ejecuciones:
+
+    python -m benchmarks.bench_api --usuarios 1000 10000 --salida antes.json
+    python -m benchmarks.bench_api --usuarios 1000 10000 --salida despues.json --comparar antes.json
+    python -m benchmarks.bench_api --comparar antes.json despues.json   # solo comparar
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.comun import medir, resumen
+
+RAIZ = Path(__file__).resolve().parent.parent
+ARCHIVOS_MODELO = ("haarcascade_frontalface_default.xml", "cnn_model.pth", "clases.pkl", "modelos")
+# Configuración de la API que cambia los resultados; se guarda junto con ellos
+VARIABLES_CONFIGURACION = ("KP_FORMATO", "BUSQUEDA_MODO", "TTA_IDENTIFICACION", "TTA_REGISTRO", "CPU_HILOS",
+                           "TORCH_HILOS", "CPU_MAX_PENDIENTES", "MICROLOTE_VENTANA_MS", "DETECTOR_ROSTROS",
+                           "MOTOR_INFERENCIA", "AUMENTACION_TENSORIAL")
+LOTE_INSERCION = 5000
+
+# === MEMORIA ===
+def memoria_mb() -> float:
+    """RSS actual del proceso (Linux); sin /proc, el máximo que informa getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return memoria_maxima_mb()
+
+def memoria_maxima_mb() -> float:
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / 2**20 if sys.platform == "darwin" else maximo / 1024  # macOS informa bytes
+
+def redondear(datos: dict, decimales: int = 2) -> dict:
+    return {k: round(v, decimales) if isinstance(v, float) else v for k, v in datos.items()}
+
+# === PROCESO HIJO: API CON BASE SQLITE ===
+def importar_api():
+    """Importa main.py con la base SQLite de la carpeta actual, las tablas creadas y el modelo cargado"""
+    os.environ.setdefault("REENTRENAMIENTO_VENTANA_S", "86400")  # sin reentrenar mientras se mide
+    import main
+    from benchmarks.base_sqlite import PoolSQLite
+    main.db = PoolSQLite("usuarios.sqlite", tamano=main.db.tamano, observar_espera=main.db.observar_espera)
+    main.asegurar_tablas()
+    main.asegurar_modelo()
+    return main
+
+def leer_rostros(carpeta: str):
+    """(nombres, bytes, imágenes PIL) de las fotos de prueba"""
+    from PIL import Image
+    rutas = sorted(Path(carpeta).glob("*.jpg"))
+    datos = [ruta.read_bytes() for ruta in rutas]
+    imagenes = [Image.open(ruta).convert("RGB") for ruta in rutas]
+    return [ruta.stem for ruta in rutas], datos, imagenes
+
+def embeddings_reales(main, imagenes) -> np.ndarray:
+    """Embeddings de registro (todas las variaciones) de cada foto: personas x variaciones x 128"""
+    return np.stack([np.stack([e.numpy() for e in main.extraer_embeddings_robustos(imagen)])
+                     for imagen in imagenes])
+
+def poblar(main, nombres, reales: np.ndarray, n_usuarios: int, semilla: int = 0):
+    """Inserta las personas de rostros/ y completa hasta ``n_usuarios`` con identidades sintéticas.
+
+    Cada usuario sintético mezcla los embeddings de dos personas reales y suma ruido: queda en la
+    región de embeddings que produce el modelo sin repetir a ninguna persona real.
+    """
+    from formato_kp import codificar_kp
+    sql = """INSERT INTO usuario (nombre, apellido, codigo, correo, requisitoriado, kp)
+             VALUES (%s, %s, %s, %s, %s, %s)"""
+    rng = np.random.default_rng(semilla)
+    with main.db.conexion() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(sql, [(nombre, "Real", f"R{i}", f"r{i}@bench.local", 0,
+                                  codificar_kp(emb, main.KP_FORMATO))
+                                 for i, (nombre, emb) in enumerate(zip(nombres, reales))])
+        n_sinteticos = max(0, n_usuarios - len(reales))
+        for inicio in range(0, n_sinteticos, LOTE_INSERCION):
+            cantidad = min(LOTE_INSERCION, n_sinteticos - inicio)
+            a = rng.integers(len(reales), size=cantidad)
+            b = (a + rng.integers(1, len(reales), size=cantidad)) % len(reales)
+            peso = rng.uniform(0.3, 0.7, size=(cantidad, 1, 1)).astype(np.float32)
+            emb = peso * reales[a] + (1 - peso) * reales[b]
+            emb = np.maximum(emb + 0.05 * rng.standard_normal(emb.shape, dtype=np.float32), 0)
+            emb /= np.maximum(np.linalg.norm(emb, axis=2, keepdims=True), 1e-12)
+            cursor.executemany(sql, [(f"Sintetico{inicio + j}", "Bench", f"S{inicio + j}",
+                                      f"s{inicio + j}@bench.local", 0, codificar_kp(e, main.KP_FORMATO))
+                                     for j, e in enumerate(emb)])
+        conn.commit()
+        cursor.close()
+
+async def prueba_carga(app, ruta: str, imagenes, formulario, solicitudes: int, concurrencia: int) -> dict:
+    """``concurrencia`` clientes envían ``solicitudes`` en total a la app ASGI, sin red de por medio"""
+    import httpx
+    latencias, respuestas = [], Counter()
+    pendientes = iter(range(solicitudes))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=None) as cliente:
+        async def cliente_carga():
+            for i in pendientes:  # iterador compartido: cada solicitud la toma un solo cliente
+                inicio = time.perf_counter()
+                r = await cliente.post(ruta, data=formulario(i),
+                                       files={"imagen": ("foto.jpg", imagenes[i % len(imagenes)], "image/jpeg")})
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                respuestas[str(r.status_code)] += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente_carga() for _ in range(concurrencia)))
+        total = time.perf_counter() - inicio
+    return {"solicitudes": solicitudes, "concurrencia": concurrencia, "por_s": solicitudes / total,
+            **resumen(latencias), "respuestas": dict(respuestas)}
+
+def formulario_registro(i: int) -> dict:
+    return {"nombre": "Carga", "apellido": f"Usuario{i}", "codigo": f"C{i}", "correo": f"c{i}@bench.local",
+            "requisitoriado": "false"}
+
+def hijo_micro(args) -> dict:
+    main = importar_api()
+    from reconocimiento import comparar_embeddings_robustos
+    import torch
+    _, _, imagenes = leer_rostros(args.rostros)
+    rostros = [main.detectar_y_recortar_rostro(imagen) for imagen in imagenes]
+    reales = [torch.from_numpy(e) for e in embeddings_reales(main, imagenes)]
+    n = len(imagenes)
+    casos = {
+        "detectar_y_recortar_rostro": lambda i: main.detectar_y_recortar_rostro(imagenes[i]),
+        "aplicar_aumentacion": lambda i: main.aplicar_aumentacion(rostros[i]),
+        "variaciones_de_rostro": lambda i: main.variaciones_de_rostro(rostros[i]),  # camino usado por la API
+        "extraer_embeddings_robustos": lambda i: main.extraer_embeddings_robustos(imagenes[i]),
+        # Un usuario: la consulta original contra las variaciones guardadas de otra persona
+        "comparar_embeddings_robustos": lambda i: comparar_embeddings_robustos(reales[i][0], list(reales[(i + 1) % n])),
+    }
+    resultados = {}
+    for nombre, caso in casos.items():
+        tiempos = []
+        for _ in range(args.repeticiones):
+            for i in range(n):
+                tiempos += medir(lambda: caso(i))
+        resultados[nombre] = redondear(resumen(tiempos), 3)
+    resultados["memoria_mb"] = round(memoria_mb(), 1)
+    return resultados
+
+def hijo_galeria(args, n_usuarios: int) -> dict:
+    main = importar_api()
+    memoria_base = memoria_mb()
+    nombres, datos, imagenes = leer_rostros(args.rostros)
+    reales = embeddings_reales(main, imagenes)
+
+    inicio = time.perf_counter()
+    poblar(main, nombres, reales, n_usuarios)
+    poblar_s = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    main.asegurar_galeria()
+    carga_s = time.perf_counter() - inicio
+    fila = {"usuarios": len(main.galeria), "poblar_s": round(poblar_s, 2), "carga_galeria_s": round(carga_s, 3),
+            "memoria_base_mb": round(memoria_base, 1), "memoria_galeria_mb": round(memoria_mb(), 1)}
+
+    # Solo la búsqueda: una consulta (presupuesto mínimo) y la verificación de duplicados del registro
+    busquedas = {
+        "puntuar_1": lambda emb: main.galeria.puntuar(emb[:1]),
+        "duplicados": lambda emb: main.galeria.mas_similares(emb, main.DUPLICADOS_K, main.UMBRAL_DUPLICADO),
+    }
+    for nombre, busqueda in busquedas.items():
+        tiempos = []
+        for _ in range(args.repeticiones):
+            for emb in reales:
+                tiempos += medir(lambda: busqueda(emb))
+        fila[nombre] = redondear(resumen(tiempos), 3)
+
+    async def cargas():
+        # Calentamiento: la primera pasada de cada tamaño de lote no se mide
+        await prueba_carga(main.app, "/comparar_rostro", datos, lambda i: {}, 2, 1)
+        comparar = await prueba_carga(main.app, "/comparar_rostro", datos, lambda i: {},
+                                      args.solicitudes, args.concurrencia)
+        registrar = await prueba_carga(main.app, "/registrar_usuario", datos, formulario_registro,
+                                       args.registros, args.concurrencia)
+        return comparar, registrar
+
+    comparar, registrar = asyncio.run(cargas())
+    fila["comparar_rostro"] = redondear(comparar)
+    fila["registrar_usuario"] = redondear(registrar)
+    fila["memoria_final_mb"] = round(memoria_mb(), 1)
+    fila["memoria_maxima_mb"] = round(memoria_maxima_mb(), 1)
+    return fila
+
+# === COMPARACIÓN ENTRE EJECUCIONES ===
+def aplanar(datos: dict, prefijo: str = ""):
+    for clave, valor in datos.items():
+        ruta = f"{prefijo}{clave}"
+        if isinstance(valor, dict):
+            yield from aplanar(valor, ruta + ".")
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield ruta, valor
+
+def comparar(anterior: dict, nuevo: dict, tolerancia: float) -> int:
+    """Muestra las métricas que cambiaron más que ``tolerancia``; devuelve cuántas empeoraron"""
+    previos = dict(aplanar(anterior))
+    regresiones = mejoras = 0
+    for ruta, valor in aplanar(nuevo):
+        previo = previos.get(ruta)
+        if ruta.startswith("meta.") or not previo:
+            continue
+        if ruta.endswith("por_s"):
+            menor_es_mejor = False
+        elif ruta.endswith(("_ms", "_mb", "_s")):
+            menor_es_mejor = True
+        else:
+            continue
+        cambio = (valor - previo) / previo
+        if abs(cambio) <= tolerancia:
+            continue
+        empeoro = cambio > 0 if menor_es_mejor else cambio < 0
+        regresiones += empeoro
+        mejoras += not empeoro
+        print(f"{'🔴' if empeoro else '🟢'} {ruta:<55} {previo:>10.2f} -> {valor:>10.2f} ({cambio:+.0%})")
+    print(f"📋 {regresiones} regresiones y {mejoras} mejoras de más de {tolerancia:.0%}")
+    return regresiones
+
+# === PROCESO PRINCIPAL ===
+def metadatos(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"fecha": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count(),
+            "parametros": {"solicitudes": args.solicitudes, "registros": args.registros,
+                           "concurrencia": args.concurrencia, "repeticiones": args.repeticiones},
+            "configuracion": {v: os.environ[v] for v in VARIABLES_CONFIGURACION if v in os.environ}}
+
+def correr_hijo(escenario: str, args, base: Path) -> dict:
+    """Corre un escenario en un proceso nuevo, dentro de su propia carpeta de trabajo"""
+    carpeta = base / escenario
+    carpeta.mkdir()
+    for nombre in ARCHIVOS_MODELO:  # copias: un reentrenamiento no debe tocar los originales
+        origen = Path(nombre).resolve()
+        if origen.is_dir():
+            shutil.copytree(origen, carpeta / nombre)
+        elif origen.exists():
+            shutil.copy2(origen, carpeta / nombre)
+    salida = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_api", "--hijo", escenario,
+         "--rostros", str(Path(args.rostros).resolve()), "--solicitudes", str(args.solicitudes),
+         "--registros", str(args.registros), "--concurrencia", str(args.concurrencia),
+         "--repeticiones", str(args.repeticiones)],
+        cwd=carpeta, env={**os.environ, "PYTHONPATH": str(RAIZ)}, capture_output=True, text=True)
+    lineas = salida.stdout.strip().splitlines()
+    if salida.returncode != 0 or not lineas:
+        raise SystemExit(f"❌ El escenario {escenario} falló:\n{salida.stdout[-2000:]}\n{salida.stderr[-2000:]}")
+    return json.loads(lineas[-1])
+
+def mostrar_carga(nombre: str, fila: dict) -> str:
+    return (f"{nombre} {fila['por_s']:.2f} sol/s, p50 {fila['p50_ms']:.0f} / p95 {fila['p95_ms']:.0f} / "
+            f"p99 {fila['p99_ms']:.0f} ms {fila['respuestas']}")
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rostros", default="rostros")
+    parser.add_argument("--usuarios", type=int, nargs="*", default=[1000, 10000],
+                        help="tamaños de galería (100000 ocupa ~560 MB en la base SQLite temporal)")
+    parser.add_argument("--solicitudes", type=int, default=50, help="solicitudes a /comparar_rostro")
+    parser.add_argument("--registros", type=int, default=10, help="solicitudes a /registrar_usuario")
+    parser.add_argument("--concurrencia", type=int, default=4, help="clientes simultáneos")
+    parser.add_argument("--repeticiones", type=int, default=3, help="pasadas sobre las fotos en los micro-benchmarks")
+    parser.add_argument("--sin-micro", action="store_true")
+    parser.add_argument("--salida", default="bench_api.json")
+    parser.add_argument("--comparar", nargs="+", metavar="JSON",
+                        help="resultado anterior (y opcionalmente uno nuevo, sin correr la suite)")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo is not None:
+        fila = hijo_micro(args) if args.hijo == "micro" else hijo_galeria(args, int(args.hijo))
+        print(json.dumps(fila))
+        return
+    if args.comparar and len(args.comparar) == 2:
+        anterior, nuevo = (json.loads(Path(ruta).read_text(encoding="utf-8")) for ruta in args.comparar)
+        sys.exit(1 if comparar(anterior, nuevo, args.tolerancia) else 0)
+
+    resultados = {"meta": metadatos(args), "galerias": {}}
+    base = Path(tempfile.mkdtemp(prefix="bench_api_"))
+    try:
+        if not args.sin_micro:
+            resultados["micro"] = correr_hijo("micro", args, base)
+            for nombre, fila in resultados["micro"].items():
+                if isinstance(fila, dict):
+                    print(f"🔬 {nombre:<30} p50 {fila['p50_ms']:8.2f} ms | p95 {fila['p95_ms']:8.2f} ms "
+                          f"| p99 {fila['p99_ms']:8.2f} ms")
+        for n_usuarios in args.usuarios:
+            fila = correr_hijo(str(n_usuarios), args, base)
+            resultados["galerias"][str(n_usuarios)] = fila
+            print(f"🧪 {fila['usuarios']} usuarios | galería {fila['carga_galeria_s']:.2f} s, "
+                  f"RSS {fila['memoria_galeria_mb']:.0f} MB (máx. {fila['memoria_maxima_mb']:.0f}) "
+                  f"| puntuar p50 {fila['puntuar_1']['p50_ms']:.2f} ms")
+            print(f"   {mostrar_carga('comparar_rostro:', fila['comparar_rostro'])}")
+            print(f"   {mostrar_carga('registrar_usuario:', fila['registrar_usuario'])}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    Path(args.salida).write_text(json.dumps(resultados, indent=2), encoding="utf-8")
+    print(f"💾 Resultados en {args.salida}")
+    if args.comparar:
+        anterior = json.loads(Path(args.comparar[0]).read_text(encoding="utf-8"))
+        sys.exit(1 if comparar(anterior, resultados, args.tolerancia) else 0)
+
+if __name__ == "__main__":
+    main_bench()
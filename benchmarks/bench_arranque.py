@@ -0,0 +1,58 @@
+"""Arranque en frío: importación de main, carga del modelo y latencia de las primeras solicitudes"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+def hijo(ruta_imagen: str, precalentar: bool, espera: float):
+    """Corre en un proceso nuevo: mide lo que ve un worker recién iniciado"""
+    inicio = time.perf_counter()
+    import main
+    importacion = time.perf_counter() - inicio
+    fila = {"precalentar": precalentar, "importar_main_s": round(importacion, 3),
+            "torch_importado": "torch" in sys.modules}
+    if precalentar:  # lo mismo que hace el hilo de fondo de iniciar(), sin la galería (sin base)
+        threading.Thread(target=main.asegurar_modelo, daemon=True).start()
+    time.sleep(espera)
+    image_bytes = Path(ruta_imagen).read_bytes()
+    for nombre in ("primera_ms", "segunda_ms"):
+        inicio = time.perf_counter()
+        asyncio.run(main.extraer_embeddings_robustos_async(image_bytes))
+        fila[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+    fila["carga_modelo_s"] = main.carga["modelo_s"]
+    fila["proceso_s"] = round(time.perf_counter() - INICIO_PROCESO, 3)
+    print(json.dumps(fila))
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--imagen", default="rostros/AngelOncoy.jpg")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--espera", type=float, default=0.0,
+                        help="segundos entre la importación y la primera solicitud (tráfico que llega tarde)")
+    parser.add_argument("--hijo", choices=["0", "1"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.hijo is not None:
+        return hijo(args.imagen, args.hijo == "1", args.espera)
+
+    resultados = []
+    for precalentar in ("0", "1"):
+        for _ in range(args.repeticiones):
+            salida = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_arranque", "--hijo", precalentar,
+                 "--imagen", args.imagen, "--espera", str(args.espera)],
+                env={**os.environ, "PRECALENTAR": precalentar}, capture_output=True, text=True, check=True)
+            fila = json.loads(salida.stdout.strip().splitlines()[-1])
+            resultados.append(fila)
+            print(f"🚀 PRECALENTAR={precalentar} | import main {fila['importar_main_s']:.3f} s "
+                  f"(torch: {fila['torch_importado']}) | 1ª {fila['primera_ms']:.0f} ms | 2ª {fila['segunda_ms']:.0f} ms")
+    print(json.dumps(resultados, indent=2))
+
+INICIO_PROCESO = time.perf_counter()
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,94 @@
+"""Decodificación de las fotos subidas: tiempo y memoria máxima por solicitud, completa frente a acotada.
+
+Mide rostro_desde_bytes (decodificación + detección + recorte) con una foto de rostros/ y con la
+misma foto llevada a 12 MP y guardada girada con orientación EXIF, como la de un celular. Cada modo
+corre en un proceso nuevo para que el máximo de RSS sea solo el suyo:
+  anterior  el camino previo: Image.open(...).convert("RGB"), np.array y Image.fromarray del recorte
+  completa  decodificar_imagen sin reducir (IMAGEN_MAX_LADO=0)
+  acotada   decodificar_imagen con IMAGEN_MAX_LADO (--max-lado)
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_api import RAIZ, memoria_maxima_mb, memoria_mb
+from benchmarks.comun import medir, resumen
+
+MODOS = ("anterior", "completa", "acotada")
+
+def foto_celular(ruta: Path, destino: Path):
+    """La foto a 3024x4032 guardada como la deja el sensor (apaisada) con orientación EXIF 6"""
+    imagen = Image.open(ruta).convert("RGB").resize((3024, 4032), Image.Resampling.BICUBIC)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    imagen.transpose(Image.Transpose.ROTATE_90).save(destino, format="JPEG", quality=92, exif=exif.tobytes())
+
+def hijo(modo: str, ruta: str, repeticiones: int) -> dict:
+    import main
+    from tiempos import etapa
+
+    def anterior(datos: bytes):
+        with etapa("decodificacion"):
+            imagen = Image.open(io.BytesIO(datos)).convert("RGB")
+        img_array = np.array(imagen)
+        caras = main.detectar_rostros(main.detector_rostros, img_array, main.DETECTOR_MAX_LADO)
+        if len(caras):
+            return main.recortar_rostro(img_array, max(caras, key=lambda c: c[2] * c[3]))
+        return imagen
+
+    procesar = anterior if modo == "anterior" else main.rostro_desde_bytes
+    datos = Path(ruta).read_bytes()
+    memoria_base = memoria_mb()
+    decodificacion, total = [], []
+    for _ in range(repeticiones):
+        etapas = main.tiempos.iniciar()
+        total += medir(lambda: procesar(datos))
+        decodificacion.append(etapas["decodificacion"])
+    rostro = procesar(datos)
+    return {"decodificacion_p50_ms": resumen(decodificacion)["p50_ms"], "total_p50_ms": resumen(total)["p50_ms"],
+            "pico_mb": memoria_maxima_mb() - memoria_base, "rostro": list(rostro.size)}
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--foto", default="rostros/AngelOncoy.jpg")
+    parser.add_argument("--max-lado", type=int, default=1280)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--hijo", nargs=2, metavar=("MODO", "RUTA"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        print(json.dumps(hijo(*args.hijo, args.repeticiones)))
+        return
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        celular = Path(carpeta) / "celular.jpg"
+        foto_celular(Path(args.foto), celular)
+        for nombre, ruta in (("rostros", Path(args.foto).resolve()), ("celular_12mp", celular)):
+            for modo in MODOS:
+                lado = 0 if modo == "completa" else args.max_lado
+                salida = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_decodificacion", "--hijo", modo, str(ruta),
+                     "--repeticiones", str(args.repeticiones)],
+                    env={**os.environ, "PYTHONPATH": str(RAIZ), "IMAGEN_MAX_LADO": str(lado)},
+                    capture_output=True, text=True)
+                lineas = salida.stdout.strip().splitlines()
+                if salida.returncode != 0 or not lineas:
+                    raise SystemExit(f"❌ {nombre}/{modo} falló:\n{salida.stderr[-2000:]}")
+                fila = {"foto": nombre, "modo": modo, **json.loads(lineas[-1])}
+                resultados.append(fila)
+                print(f"🖼️ {nombre:<12} {modo:<8} | decodificación {fila['decodificacion_p50_ms']:.1f} ms "
+                      f"| total {fila['total_p50_ms']:.1f} ms | pico +{fila['pico_mb']:.0f} MB "
+                      f"| rostro {fila['rostro'][0]}x{fila['rostro'][1]}")
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,87 @@
+"""Throughput, latencia y bloqueo del event loop del pool de CPU según su tamaño"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import main
+from benchmarks.comun import resumen
+from ejecucion import EjecutorCPU, Saturado, configurar_hilos_torch
+from microlotes import AgrupadorInferencia
+
+async def carga(imagenes, clientes: int, solicitudes: int, en_linea: bool = False):
+    """Clientes concurrentes enviando fotos; mide latencias, 503 y el retraso máximo del event loop"""
+    latencias, rechazadas, retrasos = [], 0, []
+    activo = True
+
+    async def pulso():
+        # Un evento cada 10 ms: cuánto se atrasa indica cuánto tiempo estuvo bloqueado el loop
+        while activo:
+            inicio = time.perf_counter()
+            await asyncio.sleep(0.01)
+            retrasos.append((time.perf_counter() - inicio) * 1000 - 10)
+
+    async def cliente(indice: int):
+        nonlocal rechazadas
+        for n in range(solicitudes):
+            image_bytes = imagenes[(indice + n) % len(imagenes)]
+            inicio = time.perf_counter()
+            try:
+                if en_linea:  # comportamiento anterior: todo el cómputo dentro del event loop
+                    main.inferir_embeddings(main.preparar_variaciones_desde_bytes(image_bytes))
+                    await asyncio.sleep(0)
+                else:
+                    await main.extraer_embeddings_robustos_async(image_bytes)
+            except Saturado:
+                rechazadas += 1
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    tarea_pulso = asyncio.create_task(pulso())
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(i) for i in range(clientes)))
+    duracion = time.perf_counter() - inicio
+    activo = False
+    await tarea_pulso
+    return latencias, rechazadas, duracion, max(retrasos, default=0.0)
+
+def configurar(hilos: int, max_pendientes: int):
+    main.ejecutor_cpu = EjecutorCPU(hilos=hilos, max_pendientes=max_pendientes)
+    main.agrupador = AgrupadorInferencia(main.inferir_embeddings, ventana_ms=0, executor=main.ejecutor_cpu.executor)
+    return configurar_hilos_torch(hilos)
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--carpeta", default="rostros")
+    parser.add_argument("--hilos", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--solicitudes", type=int, default=4)
+    parser.add_argument("--max-pendientes", type=int, default=4,
+                        help="límite para la prueba de saturación (clientes > límite => 503)")
+    args = parser.parse_args()
+    imagenes = [ruta.read_bytes() for ruta in sorted(Path(args.carpeta).glob("*.jpg"))][:16]
+
+    resultados = []
+
+    def registrar(nombre, hilos, hilos_torch, latencias, rechazadas, duracion, retraso):
+        fila = {"modo": nombre, "hilos_pool": hilos, "hilos_torch": hilos_torch,
+                "solicitudes_por_s": round(len(latencias) / duracion, 2), "rechazadas_503": rechazadas,
+                "retraso_max_loop_ms": round(retraso, 1), **resumen(latencias or [0.0])}
+        resultados.append(fila)
+        print(f"📊 {nombre:<10} pool={hilos} torch={hilos_torch} | {fila['solicitudes_por_s']:>6} sol/s "
+              f"| p50 {fila['p50_ms']:.0f} ms p99 {fila['p99_ms']:.0f} ms | 503: {rechazadas} "
+              f"| loop bloqueado hasta {fila['retraso_max_loop_ms']:.0f} ms")
+
+    hilos_torch = configurar(1, 10 ** 6)
+    registrar("en_linea", 0, hilos_torch, *asyncio.run(carga(imagenes, args.clientes, args.solicitudes, en_linea=True)))
+    for hilos in args.hilos:
+        hilos_torch = configurar(hilos, 10 ** 6)
+        registrar("pool", hilos, hilos_torch, *asyncio.run(carga(imagenes, args.clientes, args.solicitudes)))
+    hilos_torch = configurar(args.hilos[0], args.max_pendientes)
+    registrar("saturacion", args.hilos[0], hilos_torch,
+              *asyncio.run(carga(imagenes, args.clientes * 4, args.solicitudes)))
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main_bench()
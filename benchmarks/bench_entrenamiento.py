@@ -0,0 +1,82 @@
+"""Duración de entrenar_modelo.py con y sin la caché de tensores (fría, caliente y con una persona nueva)"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+RAIZ = Path(__file__).resolve().parent.parent
+PREFIJO_REPORTE = "📊 Reporte:"
+
+def armar_dataset(origen: Path, destino: Path, copias: int, reservar: int = 1) -> Path:
+    """Copia el dataset con ``copias`` versiones levemente rotadas de cada foto (archivos distintos).
+
+    Las últimas ``reservar`` personas quedan aparte, para simular un registro entre dos entrenamientos.
+    """
+    personas = sorted(p for p in origen.iterdir() if p.is_dir())
+    reserva = destino.parent / "reserva"
+    for i, persona in enumerate(personas):
+        carpeta = (reserva if i >= len(personas) - reservar else destino) / persona.name
+        carpeta.mkdir(parents=True, exist_ok=True)
+        for foto in sorted(persona.iterdir()):
+            imagen = Image.open(foto).convert("RGB")
+            for copia in range(copias):
+                imagen.rotate(copia * 0.5).save(carpeta / f"{foto.stem}_{copia}.jpg", quality=95)
+    return reserva
+
+def entrenar(directorio: Path, epocas: int, *opciones: str) -> dict:
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, str(RAIZ / "entrenar_modelo.py"), "--modo", "completo", "--epocas", str(epocas), *opciones],
+        cwd=directorio, env={**os.environ, "PYTHONPATH": str(RAIZ)}, capture_output=True, text=True)
+    total = time.perf_counter() - inicio
+    lineas = [l for l in salida.stdout.splitlines() if l.startswith(PREFIJO_REPORTE)]
+    if salida.returncode != 0 or not lineas:
+        raise SystemExit(f"❌ entrenar_modelo.py falló:\n{salida.stdout[-2000:]}\n{salida.stderr[-2000:]}")
+    reporte = json.loads(lineas[-1][len(PREFIJO_REPORTE):])
+    return {"total_s": round(total, 2), "preparacion_s": reporte["preparacion_s"],
+            "entrenamiento_s": reporte["duracion_s"], "imagenes": reporte["imagenes"], "cache": reporte["cache"]}
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dataset", default="dataset_augmented")
+    parser.add_argument("--copias", type=int, default=10, help="versiones de cada foto en el dataset de prueba")
+    parser.add_argument("--epocas", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2])
+    args = parser.parse_args()
+
+    directorio = Path(tempfile.mkdtemp(prefix="entrenamiento_"))
+    try:
+        reserva = armar_dataset(Path(args.dataset).resolve(), directorio / "dataset_augmented", args.copias)
+        print(f"🧪 Dataset de prueba en {directorio} ({args.copias} copias por foto, {args.epocas} épocas)")
+        escenarios = [("sin caché (antes)", ["--sin-cache"], None)]
+        for workers in args.workers:
+            opciones = ["--workers", str(workers)]
+            escenarios += [(f"caché fría, {workers} workers", opciones, "borrar"),
+                           (f"caché caliente, {workers} workers", opciones, None)]
+        escenarios += [("caché + 1 persona nueva", [], "registrar")]
+
+        resultados = []
+        for nombre, opciones, preparar in escenarios:
+            if preparar == "borrar":
+                shutil.rmtree(directorio / "cache_entrenamiento", ignore_errors=True)
+            elif preparar == "registrar":
+                for persona in reserva.iterdir():
+                    shutil.move(str(persona), directorio / "dataset_augmented" / persona.name)
+            fila = {"escenario": nombre, **entrenar(directorio, args.epocas, *opciones)}
+            resultados.append(fila)
+            cache = fila["cache"] or {}
+            print(f"🏋️ {nombre:<26} | total {fila['total_s']:6.2f} s | preparación {fila['preparacion_s']:5.2f} s "
+                  f"| entrenamiento {fila['entrenamiento_s']:6.2f} s | nuevas en caché {cache.get('nuevas', '-')}")
+        print(json.dumps(resultados, indent=2))
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    main_bench()
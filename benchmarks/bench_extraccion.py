@@ -0,0 +1,55 @@
+"""Latencia de extraer_embeddings_robustos: bucle por variación vs. lote único vs. aumentación tensorial"""
+import argparse
+import json
+from pathlib import Path
+
+import torch
+from PIL import Image
+
+import main
+from benchmarks.comun import medir, resumen
+
+def extraer_por_variacion(imagen: Image.Image):
+    """Implementación anterior: una pasada de batch 1 por cada variación"""
+    reconocimiento = main.asegurar_modelo()
+    embeddings = []
+    for variacion in main.aplicar_aumentacion(main.detectar_y_recortar_rostro(imagen)):
+        with torch.no_grad():
+            embedding = main.extractor(reconocimiento.transform(variacion).unsqueeze(0)).float()
+            embeddings.append(reconocimiento.normalizar_embedding(embedding).squeeze())
+    return embeddings
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--imagenes", type=int, default=10)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    rutas = sorted(Path("rostros").glob("*.jpg"))[:args.imagenes]
+    imagenes = [Image.open(r).convert("RGB") for r in rutas]
+
+    variantes = {
+        "por_variacion": (False, extraer_por_variacion),
+        "lote_pil": (False, main.extraer_embeddings_robustos),
+        "lote_tensorial": (True, main.extraer_embeddings_robustos),
+    }
+    resultados, salidas = {}, {}
+    for nombre, (tensorial, funcion) in variantes.items():
+        main.AUMENTACION_TENSORIAL = tensorial
+        salidas[nombre] = [torch.stack(funcion(img)) for img in imagenes]
+        tiempos = [t for img in imagenes for t in medir(lambda: funcion(img), args.repeticiones)]
+        resultados[nombre] = resumen(tiempos)
+        print(f"⏱️ {nombre:<15} p50 {resultados[nombre]['p50_ms']:.1f} ms")
+    main.AUMENTACION_TENSORIAL = False
+
+    # Concordancia de los embeddings con la implementación anterior (coseno por variación)
+    for nombre in ("lote_pil", "lote_tensorial"):
+        coseno = torch.cat([(a * b).sum(dim=1) for a, b in zip(salidas["por_variacion"], salidas[nombre])])
+        resultados[nombre]["coseno_medio"] = float(coseno.mean())
+        resultados[nombre]["coseno_minimo"] = float(coseno.min())
+        print(f"📐 {nombre:<15} coseno vs. por_variacion: medio {coseno.mean():.5f} mínimo {coseno.min():.5f}")
+
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main_bench()
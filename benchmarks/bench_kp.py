@@ -0,0 +1,34 @@
+"""Tamaño y tiempo de decodificación de la columna kp: JSON vs. binario float32/float16"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.comun import galeria_sintetica, medir, resumen
+from formato_kp import codificar_kp, decodificar_kp
+from galeria import GaleriaEmbeddings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--usuarios", type=int, default=2000)
+    args = parser.parse_args()
+
+    usuarios = galeria_sintetica(args.usuarios)
+    resultados = {}
+    for formato in ("json", "f32", "f16"):
+        filas = [(i + 1, codificar_kp(bloque, formato)) for i, bloque in enumerate(usuarios)]
+        if formato == "json":
+            # Tal como llega de MySQL: texto del JSON guardado con json.dumps
+            filas = [(i, kp.encode("utf-8")) for i, kp in filas]
+        tamano = np.mean([len(kp) for _, kp in filas])
+        decodificacion = resumen([t for _, kp in filas[:500] for t in medir(lambda: decodificar_kp(kp))])
+        carga = resumen(medir(lambda: GaleriaEmbeddings().cargar(filas), 3))
+        error = float(np.abs(np.stack([decodificar_kp(kp) for _, kp in filas]) - usuarios).max())
+        resultados[formato] = {"bytes_por_usuario": float(tamano), "decodificar_ms": decodificacion["p50_ms"],
+                               "cargar_galeria_ms": carga["p50_ms"], "error_maximo": error}
+        print(f"📦 {formato:<4} | {tamano:>8.0f} B/usuario | decodificar p50 {decodificacion['p50_ms'] * 1000:.1f} µs "
+              f"| cargar galería ({args.usuarios}) {carga['p50_ms']:.1f} ms | error máx {error:.1e}")
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Throughput y latencia p50/p99 del agrupador de microlotes con distintas ventanas"""
+import argparse
+import asyncio
+import json
+import time
+
+import torch
+
+import main
+from benchmarks.comun import resumen
+from microlotes import AgrupadorInferencia
+
+async def carga(agrupador: AgrupadorInferencia, clientes: int, solicitudes: int, variaciones: int):
+    lote = torch.randn(variaciones, 3, 100, 100)
+    latencias = []
+
+    async def cliente():
+        for _ in range(solicitudes):
+            inicio = time.perf_counter()
+            await agrupador.inferir(lote)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(clientes)))
+    return latencias, time.perf_counter() - inicio
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ventanas-ms", type=float, nargs="+", default=[0, 1, 2, 5, 10])
+    parser.add_argument("--clientes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--solicitudes", type=int, default=20)
+    parser.add_argument("--max-lote", type=int, default=128)
+    args = parser.parse_args()
+
+    resultados = []
+    for clientes in args.clientes:
+        for ventana in args.ventanas_ms:
+            agrupador = AgrupadorInferencia(main.inferir_embeddings, ventana_ms=ventana, max_lote=args.max_lote)
+            latencias, duracion = asyncio.run(carga(agrupador, clientes, args.solicitudes, 11))
+            fila = {"clientes": clientes, "ventana_ms": ventana,
+                    "solicitudes_por_s": round(len(latencias) / duracion, 1),
+                    "solicitudes_por_lote": round(agrupador.solicitudes / max(agrupador.lotes, 1), 2),
+                    **resumen(latencias)}
+            resultados.append(fila)
+            print(f"📊 clientes={clientes:<3} ventana={ventana:>4} ms | {fila['solicitudes_por_s']:>7} sol/s "
+                  f"| p50 {fila['p50_ms']:.1f} ms p99 {fila['p99_ms']:.1f} ms "
+                  f"| {fila['solicitudes_por_lote']} sol/lote")
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,133 @@
+"""Prototipos por usuario frente a las 11 variaciones: precisión (rostros/), memoria y latencia.
+
+Cada foto se registra con el presupuesto completo y se comprime con cada esquema; las consultas
+son las versiones alteradas de bench_tta, con una vista (presupuesto mínimo) y con las 11. Se mide
+la identificación correcta, las falsas aceptaciones (mejor puntaje de otra persona por encima del
+umbral) y la verificación de duplicados del registro (umbral 0.75), con el umbral fijo y con el
+umbral de cada usuario según su dispersión (main.umbral_usuario). Memoria y latencia de búsqueda
+se miden con una galería sintética de --usuarios usuarios comprimida de la misma forma.
+"""
+import argparse
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import main
+from benchmarks.bench_tta import alteraciones
+from benchmarks.comun import consultas_sinteticas, galeria_sintetica, medir, resumen
+from formato_kp import codificar_kp
+from galeria import GaleriaEmbeddings
+from prototipos import comprimir_embeddings
+
+ESQUEMAS = [("todas", 0, None), ("medoides-1", 1, "medoides"), ("media-1", 1, "media"),
+            ("medoides-2", 2, "medoides"), ("media-2", 2, "media"),
+            ("medoides-3", 3, "medoides"), ("media-3", 3, "media")]
+
+def comprimir(usuarios, cantidad: int, metodo):
+    """[(prototipos, dispersión)] de cada usuario; sin cantidad se conservan todas las variaciones"""
+    if not cantidad:
+        return [(np.asarray(emb, dtype=np.float32), 0.0) for emb in usuarios]
+    return [comprimir_embeddings(emb, cantidad, metodo) for emb in usuarios]
+
+def releer(imagen: Image.Image) -> Image.Image:
+    salida = io.BytesIO()
+    imagen.save(salida, format="JPEG", quality=95)
+    return Image.open(io.BytesIO(salida.getvalue())).convert("RGB")
+
+def evaluar(galeria: GaleriaEmbeddings, consultas, umbrales=None) -> dict:
+    """consultas: [(usuario_id, embeddings de una vista, embeddings de las 11 variaciones)];
+    umbrales: umbral de identificación por usuario (por defecto UMBRAL_IDENTIFICACION para todos)"""
+    umbral = lambda usuario_id: umbrales[usuario_id] if umbrales else main.UMBRAL_IDENTIFICACION
+    aciertos = {"minima": 0, "completa": 0}
+    falsas = {"minima": 0, "completa": 0}
+    genuinos, impostores = [], []
+    duplicados_detectados = duplicados_falsos = 0
+    for usuario_id, vista, completa in consultas:
+        for presupuesto, embeddings in (("minima", vista), ("completa", completa)):
+            ids, puntajes = galeria.puntuar(embeddings)
+            mejor = int(np.argmax(puntajes))
+            aciertos[presupuesto] += int(ids[mejor] == usuario_id and puntajes[mejor] > umbral(int(ids[mejor])))
+            otros = ids != usuario_id
+            mas_parecido = int(np.argmax(np.where(otros, puntajes, -np.inf)))
+            impostor = float(puntajes[mas_parecido])
+            falsas[presupuesto] += int(impostor > umbral(int(ids[mas_parecido])))
+            if presupuesto == "completa":  # el registro usa las 11 variaciones
+                genuino = float(puntajes[ids == usuario_id].max())
+                genuinos.append(genuino)
+                impostores.append(impostor)
+                duplicados_detectados += int(genuino > main.UMBRAL_DUPLICADO)
+                duplicados_falsos += int(impostor > main.UMBRAL_DUPLICADO)
+    n = len(consultas)
+    return {
+        "correcta_minima": round(aciertos["minima"] / n, 4),
+        "correcta_completa": round(aciertos["completa"] / n, 4),
+        "falsa_aceptacion_minima": round(falsas["minima"] / n, 4),
+        "falsa_aceptacion_completa": round(falsas["completa"] / n, 4),
+        "duplicado_detectado": round(duplicados_detectados / n, 4),
+        "duplicado_falso": round(duplicados_falsos / n, 4),
+        "puntaje_genuino_p50": round(float(np.median(genuinos)), 4),
+        "puntaje_impostor_p50": round(float(np.median(impostores)), 4),
+    }
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--carpeta", default="rostros")
+    parser.add_argument("--usuarios", type=int, default=10000, help="tamaño de la galería sintética")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    rutas = sorted(Path(args.carpeta).glob("*.jpg"))
+    imagenes = [Image.open(ruta).convert("RGB") for ruta in rutas]
+    extraer = lambda imagen, nombres=main.VARIACIONES: main.inferir_embeddings(
+        main.preparar_variaciones(imagen, nombres)).numpy()
+    registros = [extraer(imagen) for imagen in imagenes]
+    consultas = []
+    for usuario_id, imagen in enumerate(imagenes, start=1):
+        for alterada in alteraciones(imagen).values():
+            alterada = releer(alterada)
+            consultas.append((usuario_id, extraer(alterada, ("original",)), extraer(alterada)))
+    print(f"📷 {len(imagenes)} personas, {len(consultas)} consultas alteradas, "
+          f"galería sintética de {args.usuarios} usuarios")
+
+    sinteticos = galeria_sintetica(args.usuarios)
+    _, consultas_sint = consultas_sinteticas(sinteticos, args.repeticiones)
+    resultados = []
+    for nombre, cantidad, metodo in ESQUEMAS:
+        comprimidos = comprimir(registros, cantidad, metodo)
+        galeria = GaleriaEmbeddings()
+        galeria.cargar((i, prototipos) for i, (prototipos, _) in enumerate(comprimidos, start=1))
+        formato = main.KP_FORMATO_CONFIGURADO or "f32"
+        kps = [codificar_kp(prototipos, formato, dispersion if cantidad else None)
+               for prototipos, dispersion in comprimidos]
+        umbrales = {i: main.umbral_usuario(kp) for i, kp in enumerate(kps, start=1)}
+        por_usuario = evaluar(galeria, consultas, umbrales)
+        fila = {"esquema": nombre, **evaluar(galeria, consultas),
+                "dispersion_media": round(float(np.mean([d for _, d in comprimidos])), 4),
+                "kp_bytes": len(kps[0]),
+                **{f"{clave}_umbral_usuario": por_usuario[clave] for clave in
+                   ("correcta_minima", "correcta_completa", "falsa_aceptacion_minima", "falsa_aceptacion_completa")}}
+
+        grande = GaleriaEmbeddings()
+        grande.cargar((i, prototipos) for i, (prototipos, _) in enumerate(comprimir(sinteticos, cantidad, metodo), 1))
+        fila["galeria_mb"] = round(grande.instantanea()[0].nbytes / 2**20, 2)
+        for etiqueta, filas in (("busqueda_1", slice(0, 1)), ("busqueda_11", slice(None))):
+            tiempos = []
+            for consulta in consultas_sint:
+                tiempos += medir(lambda: grande.puntuar(consulta[filas]))
+            fila[f"{etiqueta}_p50_ms"] = round(resumen(tiempos)["p50_ms"], 3)
+        resultados.append(fila)
+        print(f"🧬 {nombre:<11} | correcta {fila['correcta_minima']:.3f} / {fila['correcta_completa']:.3f} "
+              f"| falsa aceptación {fila['falsa_aceptacion_minima']:.3f} / {fila['falsa_aceptacion_completa']:.3f} "
+              f"| duplicados {fila['duplicado_detectado']:.3f} (falsos {fila['duplicado_falso']:.3f}) "
+              f"| dispersión {fila['dispersion_media']:.4f} | {fila['kp_bytes']} B/usuario "
+              f"| {fila['galeria_mb']:.1f} MB | búsqueda {fila['busqueda_1_p50_ms']:.2f} / {fila['busqueda_11_p50_ms']:.2f} ms")
+        print(f"   umbral por usuario | correcta {fila['correcta_minima_umbral_usuario']:.3f} / "
+              f"{fila['correcta_completa_umbral_usuario']:.3f} | falsa aceptación "
+              f"{fila['falsa_aceptacion_minima_umbral_usuario']:.3f} / {fila['falsa_aceptacion_completa_umbral_usuario']:.3f}")
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,54 @@
+"""Equivalencia y latencia del motor vectorizado frente a comparar_embeddings_robustos"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.comun import galeria_sintetica
+from galeria import GaleriaEmbeddings
+from reconocimiento import comparar_embeddings_robustos
+
+def referencia(consultas: torch.Tensor, usuarios: np.ndarray):
+    """Bucle original de comparar_rostro: mejor puntaje por usuario sobre todas las consultas"""
+    puntajes = []
+    for bloque in usuarios:
+        almacenados = [torch.tensor(e) for e in bloque]
+        puntajes.append(max(comparar_embeddings_robustos(q, almacenados)[0] for q in consultas))
+    return np.array(puntajes)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--tolerancia", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    usuarios = galeria_sintetica(args.usuarios)
+    # Caso borde: un usuario con un embedding nulo (ReLU totalmente apagada)
+    usuarios[-1, 0] = 0.0
+
+    galeria = GaleriaEmbeddings()
+    galeria.cargar((i + 1, bloque) for i, bloque in enumerate(usuarios))
+
+    # Consulta idéntica a un usuario almacenado: el peor caso numérico de la identidad de Gram
+    consultas = torch.from_numpy(usuarios[args.usuarios // 2].copy())
+
+    inicio = time.perf_counter()
+    esperado = referencia(consultas, usuarios)
+    t_ref = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    ids, obtenido = galeria.puntuar(consultas.numpy())
+    t_vec = time.perf_counter() - inicio
+
+    diferencia = float(np.abs(esperado - obtenido).max())
+    assert list(ids) == list(range(1, args.usuarios + 1)), "orden de usuarios distinto"
+    assert diferencia <= args.tolerancia, f"diferencia máxima {diferencia:.2e} > {args.tolerancia:.0e}"
+    assert int(np.argmax(esperado)) == int(np.argmax(obtenido)), "mejor usuario distinto"
+
+    print(f"✅ Equivalente: diferencia máxima {diferencia:.2e} sobre {args.usuarios} usuarios")
+    print(f"⏱️ Bucle original: {t_ref * 1000:.1f} ms | Vectorizado: {t_vec * 1000:.2f} ms "
+          f"({t_ref / t_vec:.0f}x)")
+
+if __name__ == "__main__":
+    main()
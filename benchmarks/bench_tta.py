@@ -0,0 +1,117 @@
+"""Precisión vs. latencia de los presupuestos de test-time augmentation sobre rostros/.
+
+Cada foto se registra con el presupuesto completo y se consulta con versiones alteradas
+(compresión, baja resolución, brillo, rotación, recorte, desenfoque). Con la persona en la
+galería se mide la identificación correcta; sin ella (galería sin esa persona), las falsas
+aceptaciones por encima del umbral.
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+import main
+from benchmarks.comun import resumen
+from galeria import GaleriaEmbeddings
+
+def alteraciones(imagen: Image.Image):
+    """Versiones de la foto como las que llegan desde una cámara"""
+    ancho, alto = imagen.size
+
+    def jpeg(calidad):
+        salida = io.BytesIO()
+        imagen.save(salida, format="JPEG", quality=calidad)
+        return Image.open(io.BytesIO(salida.getvalue())).convert("RGB")
+
+    return {
+        "jpeg35": jpeg(35),
+        "baja_resolucion": imagen.resize((ancho // 3, alto // 3)).resize((ancho, alto)),
+        "oscura": ImageEnhance.Brightness(imagen).enhance(0.6),
+        "rotada": imagen.rotate(8),
+        "recortada": imagen.crop((ancho // 12, alto // 12, ancho, alto)),
+        "desenfocada": imagen.filter(ImageFilter.GaussianBlur(radius=2)),
+    }
+
+def codificar(imagen: Image.Image) -> bytes:
+    salida = io.BytesIO()
+    imagen.save(salida, format="JPEG", quality=95)
+    return salida.getvalue()
+
+async def evaluar(presupuesto: str, consultas, galeria_completa, galerias_sin):
+    aciertos, falsas_aceptaciones, latencias, variaciones = 0, 0, [], []
+    genuinos, impostores = [], []
+    for usuario_id, datos in consultas:
+        main.galeria = galeria_completa
+        inicio = time.perf_counter()
+        resultado = await main.identificar_async(datos, presupuesto)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if resultado is None:  # imagen ilegible: cuenta como no identificada
+            continue
+        ids_usuarios, puntajes, usadas = resultado
+        variaciones.append(usadas)
+        mejor = int(np.argmax(puntajes))
+        genuinos.append(float(puntajes[ids_usuarios == usuario_id].max()))
+        aciertos += int(ids_usuarios[mejor] == usuario_id and puntajes[mejor] > main.UMBRAL_IDENTIFICACION)
+
+        main.galeria = galerias_sin[usuario_id]
+        _, puntajes, _ = await main.identificar_async(datos, presupuesto)
+        impostores.append(float(puntajes.max()))
+        falsas_aceptaciones += int(impostores[-1] > main.UMBRAL_IDENTIFICACION)
+    return {
+        "presupuesto": presupuesto,
+        "identificacion_correcta": round(aciertos / len(consultas), 4),
+        "falsa_aceptacion": round(falsas_aceptaciones / len(consultas), 4),
+        "puntaje_genuino_p50": round(float(np.median(genuinos or [0])), 4),
+        "puntaje_impostor_p50": round(float(np.median(impostores or [0])), 4),
+        "variaciones_medias": round(float(np.mean(variaciones or [0])), 2),
+        **resumen(latencias),
+    }
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--carpeta", default="rostros")
+    parser.add_argument("--presupuestos", nargs="+", default=["completa", "media", "minima", "adaptativa"])
+    parser.add_argument("--bandas", type=float, nargs="+", default=[main.TTA_BANDA],
+                        help="anchos de la banda dudosa a probar con el modo adaptativo")
+    args = parser.parse_args()
+
+    rutas = sorted(Path(args.carpeta).glob("*.jpg"))
+    imagenes = {i + 1: Image.open(ruta).convert("RGB") for i, ruta in enumerate(rutas)}
+
+    # Registro con el presupuesto completo, como /registrar_usuario
+    registros = {usuario_id: main.inferir_embeddings(main.preparar_variaciones(imagen)).numpy()
+                 for usuario_id, imagen in imagenes.items()}
+    galeria_completa = GaleriaEmbeddings()
+    galeria_completa.cargar(sorted(registros.items()))
+    galerias_sin = {}
+    for usuario_id in registros:
+        galerias_sin[usuario_id] = GaleriaEmbeddings()
+        galerias_sin[usuario_id].cargar([(i, e) for i, e in sorted(registros.items()) if i != usuario_id])
+
+    consultas = [(usuario_id, codificar(alterada))
+                 for usuario_id, imagen in imagenes.items() for alterada in alteraciones(imagen).values()]
+    print(f"📷 {len(imagenes)} personas, {len(consultas)} consultas alteradas")
+
+    resultados = []
+    for presupuesto in args.presupuestos:
+        for banda in (args.bandas if presupuesto == "adaptativa" else [None]):
+            if banda is not None:
+                main.TTA_BANDA = banda
+            fila = asyncio.run(evaluar(presupuesto, consultas, galeria_completa, galerias_sin))
+            if banda is not None:
+                fila["banda"] = banda
+            resultados.append(fila)
+            etiqueta = presupuesto + (f" ±{banda}" if banda is not None else "")
+            print(f"📊 {etiqueta:<17} | correcta {fila['identificacion_correcta']:.3f} "
+                  f"| falsa aceptación {fila['falsa_aceptacion']:.3f} (genuino {fila['puntaje_genuino_p50']:.3f} / "
+                  f"impostor {fila['puntaje_impostor_p50']:.3f}) | {fila['variaciones_medias']:>5} variaciones "
+                  f"| p50 {fila['p50_ms']:.1f} ms p95 {fila['p95_ms']:.1f} ms")
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,41 @@
+"""Utilidades compartidas por los benchmarks"""
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+def galeria_sintetica(n_usuarios: int, variaciones: int = 11, dim: int = 128, semilla: int = 0) -> np.ndarray:
+    """Embeddings no negativos (salida ReLU) y L2-normalizados, agrupados por usuario"""
+    rng = np.random.default_rng(semilla)
+    base = rng.random((n_usuarios, 1, dim), dtype=np.float32)
+    ruido = 0.1 * rng.random((n_usuarios, variaciones, dim), dtype=np.float32)
+    emb = base + ruido
+    emb /= np.linalg.norm(emb, axis=2, keepdims=True)
+    return emb
+
+def consultas_sinteticas(usuarios: np.ndarray, n: int, ruido: float = 0.05, semilla: int = 1):
+    """(índices de usuario, consultas) perturbando las variaciones de usuarios al azar"""
+    rng = np.random.default_rng(semilla)
+    elegidos = rng.choice(len(usuarios), size=n, replace=False)
+    consultas = usuarios[elegidos] + ruido * rng.random(usuarios[elegidos].shape, dtype=np.float32)
+    consultas /= np.linalg.norm(consultas, axis=2, keepdims=True)
+    return elegidos, consultas
+
+def medir(funcion: Callable[[], object], repeticiones: int = 1) -> List[float]:
+    """Latencias en milisegundos de ``repeticiones`` llamadas"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+def resumen(tiempos_ms: List[float]) -> Dict[str, float]:
+    """Media y percentiles p50/p95/p99 en milisegundos"""
+    t = np.asarray(tiempos_ms)
+    return {
+        "media_ms": float(t.mean()),
+        "p50_ms": float(np.percentile(t, 50)),
+        "p95_ms": float(np.percentile(t, 95)),
+        "p99_ms": float(np.percentile(t, 99)),
+    }
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# === CACHÉ DE TENSORES DE ENTRENAMIENTO ===
+# Cada imagen del dataset se decodifica y redimensiona a 100x100 una sola vez. El resultado se
+# guarda en imagenes.npy (uint8, N x 3 x 100 x 100: exactamente lo que ToTensor recibe, 4 veces
+# más chico que float32) y se abre con mmap en cada entrenamiento; la normalización se aplica
+# al leer. indice.json asocia el SHA-256 de cada archivo con su fila, así que un reentrenamiento
+# solo procesa las imágenes nuevas, y guarda (tamaño, mtime) de cada ruta para no volver a
+# calcular el hash de los archivos que no cambiaron.
+
+LADO = 100
+
+def hash_archivo(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def preprocesar(ruta: str, lado: int = LADO) -> np.ndarray:
+    """RGB redimensionado a lado x lado como uint8 [3, H, W] (igual que Resize + ToTensor * 255)"""
+    with Image.open(ruta) as imagen:
+        imagen = imagen.convert("RGB").resize((lado, lado), Image.BILINEAR)
+    return np.asarray(imagen, dtype=np.uint8).transpose(2, 0, 1)
+
+class CacheTensores:
+    """Imágenes preprocesadas en ``directorio``, reutilizadas entre épocas y entre ejecuciones"""
+
+    def __init__(self, directorio: str = "cache_entrenamiento", lado: int = LADO):
+        self.directorio = Path(directorio)
+        self.lado = lado
+        self.ruta_imagenes = self.directorio / "imagenes.npy"
+        self.ruta_indice = self.directorio / "indice.json"
+
+    def _leer_indice(self) -> dict:
+        try:
+            with open(self.ruta_indice, encoding="utf-8") as f:
+                indice = json.load(f)
+            if indice.get("lado") == self.lado and self.ruta_imagenes.exists():
+                return indice
+        except (FileNotFoundError, ValueError):
+            pass
+        return {"lado": self.lado, "filas": {}, "archivos": {}}
+
+    def preparar(self, rutas: List[str]) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Agrega a la caché las imágenes que falten y devuelve (fila de cada ruta, estadísticas)"""
+        indice = self._leer_indice()
+        filas, previos, archivos = indice["filas"], indice["archivos"], {}
+        hashes = []
+        for ruta in rutas:
+            info = os.stat(ruta)
+            firma = [info.st_size, info.st_mtime_ns]
+            previo = previos.get(ruta)
+            digest = previo[2] if previo and previo[:2] == firma else hash_archivo(ruta)
+            archivos[ruta] = firma + [digest]
+            hashes.append(digest)
+
+        nuevas = {}  # hash -> ruta de las imágenes que todavía no están en la caché
+        for ruta, digest in zip(rutas, hashes):
+            if digest not in filas and digest not in nuevas:
+                nuevas[digest] = ruta
+        reutilizadas = sum(digest in filas for digest in hashes)
+        existentes = len(filas)
+        usadas = set(hashes)
+        # Compactar cuando la mayoría de las filas son de imágenes que ya no están en el dataset
+        compactar = existentes and len(usadas & filas.keys()) < existentes / 2
+
+        if nuevas or compactar:
+            anteriores = np.load(self.ruta_imagenes, mmap_mode="r") if existentes else None
+            conservar = [d for d in filas if d in usadas] if compactar else list(filas)
+            total = len(conservar) + len(nuevas)
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            temporal = self.ruta_imagenes.with_name(f"imagenes.{os.getpid()}.tmp.npy")
+            salida = np.lib.format.open_memmap(temporal, mode="w+", dtype=np.uint8,
+                                               shape=(total, 3, self.lado, self.lado))
+            origen = np.array([filas[digest] for digest in conservar], dtype=np.int64)
+            for inicio in range(0, len(origen), 4096):  # copia por bloques, sin leer toda la caché
+                bloque = origen[inicio:inicio + 4096]
+                salida[inicio:inicio + len(bloque)] = anteriores[bloque]
+            nuevas_filas = {digest: i for i, digest in enumerate(conservar)}
+            for i, (digest, ruta) in enumerate(nuevas.items(), start=len(conservar)):
+                salida[i] = preprocesar(ruta, self.lado)
+                nuevas_filas[digest] = i
+            salida.flush()
+            del salida, anteriores
+            os.replace(temporal, self.ruta_imagenes)
+            filas = nuevas_filas
+
+        indice = {"lado": self.lado, "filas": filas, "archivos": archivos}
+        if nuevas or compactar or archivos != previos:
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            temporal = self.ruta_indice.with_name(f"indice.{os.getpid()}.tmp")
+            temporal.write_text(json.dumps(indice), encoding="utf-8")
+            os.replace(temporal, self.ruta_indice)
+
+        estadisticas = {"imagenes": len(rutas), "nuevas": len(nuevas), "reutilizadas": reutilizadas,
+                        "filas_cache": len(filas)}
+        return np.array([filas[digest] for digest in hashes], dtype=np.int64), estadisticas
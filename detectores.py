@@ -0,0 +1,88 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# === DETECTORES DE ROSTROS ===
+# Cada detector recibe una imagen RGB (ya reducida) y devuelve las cajas (x, y, w, h) en esa escala.
+# Los objetos de OpenCV no son seguros entre hilos, así que cada hilo carga su propia instancia una vez.
+
+class DetectorHaar:
+    """Clasificador Haar Cascade de OpenCV"""
+    nombre = "haar"
+
+    def __init__(self, ruta: str = "haarcascade_frontalface_default.xml"):
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(ruta)
+        self.ruta = ruta
+        self._local = threading.local()
+        self._clasificador()  # validar el archivo al crear el detector
+
+    def _clasificador(self) -> cv2.CascadeClassifier:
+        clasificador = getattr(self._local, "clasificador", None)
+        if clasificador is None:
+            clasificador = cv2.CascadeClassifier(self.ruta)
+            if clasificador.empty():
+                raise ValueError(f"No se pudo cargar el clasificador Haar: {self.ruta}")
+            self._local.clasificador = clasificador
+        return clasificador
+
+    def detectar(self, rgb: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        caras = self._clasificador().detectMultiScale(gray, 1.1, 4)
+        return np.asarray(caras, dtype=np.int64).reshape(-1, 4)
+
+class DetectorYuNet:
+    """Detector DNN YuNet de OpenCV (cv2.FaceDetectorYN) a partir de un modelo ONNX local"""
+    nombre = "yunet"
+
+    def __init__(self, ruta: str, umbral: float = 0.8):
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(ruta)
+        self.ruta = ruta
+        self.umbral = umbral
+        self._local = threading.local()
+
+    def _detector(self, tamano: Tuple[int, int]):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = cv2.FaceDetectorYN.create(self.ruta, "", tamano, self.umbral)
+            self._local.detector = detector
+        detector.setInputSize(tamano)
+        return detector
+
+    def detectar(self, rgb: np.ndarray) -> np.ndarray:
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        alto, ancho = bgr.shape[:2]
+        _, caras = self._detector((ancho, alto)).detect(bgr)
+        if caras is None:
+            return np.empty((0, 4), dtype=np.int64)
+        return np.round(caras[:, :4]).astype(np.int64)
+
+def crear_detector(nombre: str = "haar", ruta_yunet: str = "modelos/face_detection_yunet_2023mar.onnx"):
+    """Crea el detector configurado; si no está disponible usa Haar, y si tampoco, ninguno"""
+    if nombre == "yunet":
+        try:
+            return DetectorYuNet(ruta_yunet)
+        except Exception as e:
+            print(f"⚠️ Detector YuNet no disponible ({e}); se usa Haar")
+    try:
+        return DetectorHaar()
+    except Exception as e:
+        print(f"⚠️ Detector Haar no disponible ({e}); se usará la imagen completa")
+        return None
+
+def detectar_rostros(detector, rgb: np.ndarray, max_lado: Optional[int] = 640) -> np.ndarray:
+    """Detecta sobre una copia reducida (lado mayor <= max_lado) y devuelve las cajas a resolución completa"""
+    alto, ancho = rgb.shape[:2]
+    escala = 1.0
+    if max_lado and max(alto, ancho) > max_lado:
+        escala = max_lado / max(alto, ancho)
+        rgb = cv2.resize(rgb, (max(1, round(ancho * escala)), max(1, round(alto * escala))),
+                         interpolation=cv2.INTER_AREA)
+    caras = detector.detectar(rgb)
+    if escala != 1.0 and len(caras):
+        caras = np.round(caras / escala).astype(np.int64)
+    return caras
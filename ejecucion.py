@@ -0,0 +1,52 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# === EJECUCIÓN DEL TRABAJO DE CPU FUERA DEL EVENT LOOP ===
+# Decodificación, detección, aumentación e inferencia corren en un pool de hilos propio (PyTorch,
+# OpenCV y PIL liberan el GIL en sus partes pesadas). Las solicitudes admitidas se limitan para
+# responder 503 en lugar de acumular una cola sin fin cuando el servidor está saturado.
+
+class Saturado(Exception):
+    """No hay lugar para otra solicitud de cómputo; el cliente debe reintentar más tarde"""
+
+def configurar_hilos_torch(hilos_pool: int, hilos_torch: Optional[int] = None) -> int:
+    """Reparte los núcleos entre los hilos del pool para no sobre-suscribir la CPU"""
+    import torch  # solo al cargar el modelo: este módulo se importa antes que PyTorch
+
+    if not hilos_torch:
+        hilos_torch = max(1, (os.cpu_count() or 1) // max(hilos_pool, 1))
+    torch.set_num_threads(hilos_torch)
+    return hilos_torch
+
+class EjecutorCPU:
+    """Pool de hilos para el trabajo pesado con control de admisión por solicitud"""
+
+    def __init__(self, hilos: int = 2, max_pendientes: int = 8):
+        self.hilos = hilos
+        self.max_pendientes = max_pendientes
+        self.executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="cpu")
+        self.en_curso = 0
+        self.rechazadas = 0
+
+    @asynccontextmanager
+    async def turno(self):
+        """Admite la solicitud si hay lugar (en ejecución + en espera < max_pendientes) o lanza Saturado"""
+        if self.en_curso >= self.max_pendientes:
+            self.rechazadas += 1
+            raise Saturado(f"Servidor ocupado ({self.en_curso} solicitudes en proceso), reintente en unos segundos")
+        self.en_curso += 1
+        try:
+            yield
+        finally:
+            self.en_curso -= 1
+
+    async def ejecutar(self, funcion, *args, **kwargs):
+        """Ejecuta ``funcion`` en el pool conservando los tiempos por etapa de la solicitud"""
+        contexto = contextvars.copy_context()
+        llamada = functools.partial(contexto.run, funcion, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, llamada)
@@ -1,15 +1,31 @@
+import argparse
+import json
 import os
+import sys
+import time
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset
 import pickle
 
+from aumentacion import VARIACIONES
+from cache_tensores import CacheTensores
+from reconocimiento import aplicar_aumentacion_tensor
+
 # === Configuración de paths ===
 DATASET_DIR = "dataset_augmented"
 MODEL_PATH = "cnn_model.pth"
 CLASES_PATH = "clases.pkl"
+CACHE_DIR = os.environ.get("ENTRENAMIENTO_CACHE_DIR", "cache_entrenamiento")
+
+# === Configuración de entrenamiento ===
+EPOCAS_COMPLETO = 10
+EPOCAS_INCREMENTAL = 3
+LR = 0.001
+LR_BASE_INCREMENTAL = 0.0001  # features/fc1 heredados se ajustan con un paso más pequeño
 
 # === Verificar si hay imágenes válidas en el dataset ===
 def verificar_dataset():
@@ -17,18 +33,18 @@ def verificar_dataset():
     if not os.path.exists(DATASET_DIR):
         print("⚠️ Carpeta dataset_augmented no existe")
         return False
-    
+
     # Buscar imágenes válidas en subcarpetas
     imagenes_encontradas = []
     for root, dirs, files in os.walk(DATASET_DIR):
         for file in files:
             if file.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tiff')):
                 imagenes_encontradas.append(os.path.join(root, file))
-    
+
     if not imagenes_encontradas:
         print("⚠️ No se encontraron imágenes válidas en dataset_augmented")
         return False
-    
+
     print(f"✅ Encontradas {len(imagenes_encontradas)} imágenes válidas")
     return True
 
@@ -53,6 +69,10 @@ class CNNClasificador(nn.Module):
         x = self.relu(x)
         return self.output(x)
 
+    def embedding(self, x):
+        """Salida de fc1 + ReLU (lo mismo que ExtractorEmbeddings en reconocimiento.py)"""
+        return self.relu(self.fc1(self.flatten(self.features(x))))
+
 # === Transformaciones ===
 transform = transforms.Compose([
     transforms.Resize((100, 100)),
@@ -60,64 +80,205 @@ transform = transforms.Compose([
     transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
 ])
 
-# === Verificar dataset antes de entrenar ===
-if not verificar_dataset():
-    print("❌ No se puede entrenar el modelo sin imágenes válidas")
-    print("💡 Registra al menos un usuario con imagen antes de entrenar")
-    
-    # Crear clases vacías para evitar errores
-    clases = []
-    with open(CLASES_PATH, "wb") as f:
-        pickle.dump(clases, f)
-    
-    # Crear modelo vacío
-    model = CNNClasificador(num_classes=0)
-    torch.save(model.state_dict(), MODEL_PATH)
-    print("✅ Modelo vacío creado para evitar errores")
-    exit(0)
-
-# === Cargar dataset ===
-try:
-dataset = datasets.ImageFolder(DATASET_DIR, transform=transform)
-dataloader = DataLoader(dataset, batch_size=16, shuffle=True)
-
-# === Guardar clases ===
-clases = dataset.classes
-with open(CLASES_PATH, "wb") as f:
-    pickle.dump(clases, f)
-
-    print(f"✅ Dataset cargado con {len(clases)} clases: {clases}")
-    
-# === Entrenamiento del modelo ===
-model = CNNClasificador(num_classes=len(clases))
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=0.001)
-
-    print("🚀 Iniciando entrenamiento del modelo...")
-for epoch in range(10):
-    total_loss = 0
-    for images, labels in dataloader:
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
-        total_loss += loss.item()
-    print(f"🔁 Época {epoch+1}/10 - Pérdida total: {total_loss:.4f}")
-
-# === Guardar modelo entrenado ===
-torch.save(model.state_dict(), MODEL_PATH)
-print("✅ Modelo y clases guardados correctamente.")
-    
-except Exception as e:
-    print(f"❌ Error durante el entrenamiento: {e}")
-    print("💡 Verifica que las imágenes en dataset_augmented sean válidas")
-    
-    # Crear modelo básico para evitar errores
-    clases = []
-    with open(CLASES_PATH, "wb") as f:
-        pickle.dump(clases, f)
-    
-    model = CNNClasificador(num_classes=0)
-    torch.save(model.state_dict(), MODEL_PATH)
-    print("✅ Modelo básico creado para evitar errores")
+# === Dataset desde la caché de tensores ===
+# Mismas variaciones que aplicar_aumentacion (main.py, ver aumentacion.py); con --aumentar se elige
+# una al azar para cada imagen en cada época, con las operaciones de tensor de reconocimiento.py
+
+class DatasetTensores(Dataset):
+    """Imágenes uint8 de la caché (mapeadas en memoria), normalizadas como ``transform`` al leerlas"""
+
+    def __init__(self, ruta_imagenes, filas, etiquetas, aumentar=False):
+        self.ruta_imagenes = str(ruta_imagenes)
+        self.filas = filas
+        self.etiquetas = etiquetas
+        self.aumentar = aumentar
+        self._imagenes = None  # se abre en cada proceso del DataLoader
+
+    def __len__(self):
+        return len(self.filas)
+
+    def __getitem__(self, i):
+        if self._imagenes is None:
+            self._imagenes = np.load(self.ruta_imagenes, mmap_mode="r")
+        imagen = torch.from_numpy(np.array(self._imagenes[self.filas[i]])).float().div_(255)
+        if self.aumentar:
+            nombre = VARIACIONES[int(torch.randint(len(VARIACIONES), ()))]
+            imagen = aplicar_aumentacion_tensor(imagen, [nombre])[0]
+        return (imagen - 0.5) / 0.5, self.etiquetas[i]
+
+def dataset_en_cache(aumentar=False):
+    """(clases, dataset de entrenamiento, dataset sin aumentación, estadísticas de la caché)"""
+    carpetas = datasets.ImageFolder(DATASET_DIR)  # solo lista clases y archivos, no decodifica
+    cache = CacheTensores(CACHE_DIR)
+    filas, estadisticas = cache.preparar([ruta for ruta, _ in carpetas.samples])
+    etiquetas = [etiqueta for _, etiqueta in carpetas.samples]
+    print(f"🗂️ Caché de tensores: {estadisticas['nuevas']} imágenes nuevas, "
+          f"{estadisticas['reutilizadas']} reutilizadas ({CACHE_DIR})")
+    return (carpetas.classes, DatasetTensores(cache.ruta_imagenes, filas, etiquetas, aumentar),
+            DatasetTensores(cache.ruta_imagenes, filas, etiquetas), estadisticas)
+
+# === Guardado atómico (nunca se deja un archivo a medio escribir) ===
+def guardar_atomico(ruta, escribir):
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "wb") as f:
+        escribir(f)
+    os.replace(temporal, ruta)
+
+def guardar_modelo(model, clases):
+    guardar_atomico(MODEL_PATH, lambda f: torch.save(model.state_dict(), f))
+    guardar_atomico(CLASES_PATH, lambda f: pickle.dump(clases, f))
+
+# === Modelo previo (para warm-start y para medir la deriva) ===
+def cargar_modelo_previo():
+    """Devuelve (clases, modelo) del último entrenamiento, o (None, None) si no hay uno utilizable"""
+    try:
+        with open(CLASES_PATH, "rb") as f:
+            clases_previas = pickle.load(f)
+        if len(clases_previas) == 0:
+            return None, None
+        modelo = CNNClasificador(num_classes=len(clases_previas))
+        modelo.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
+        modelo.eval()
+        return clases_previas, modelo
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el modelo previo: {e}")
+        return None, None
+
+def iniciar_desde_previo(model, clases, clases_previas, modelo_previo):
+    """Copia features/fc1 y las filas de salida de las clases que ya existían"""
+    model.features.load_state_dict(modelo_previo.features.state_dict())
+    model.fc1.load_state_dict(modelo_previo.fc1.state_dict())
+    with torch.no_grad():
+        for i, clase in enumerate(clases):
+            if clase in clases_previas:
+                j = clases_previas.index(clase)
+                model.output.weight[i] = modelo_previo.output.weight[j]
+                model.output.bias[i] = modelo_previo.output.bias[j]
+    nuevas = [c for c in clases if c not in clases_previas]
+    print(f"♻️ Warm-start desde {len(clases_previas)} clases previas; {len(nuevas)} nuevas: {nuevas}")
+
+# === Deriva de embeddings entre el modelo previo y el nuevo ===
+def embeddings_sondeo(model, dataset):
+    """Embeddings L2-normalizados de todas las imágenes del dataset (sin augmentation)"""
+    loader = DataLoader(dataset, batch_size=64, shuffle=False)
+    salida = []
+    model.eval()
+    with torch.no_grad():
+        for images, _ in loader:
+            emb = model.embedding(images)
+            salida.append(emb / (emb.norm(dim=1, keepdim=True) + 1e-8))
+    return torch.cat(salida)
+
+def medir_deriva(antes, despues):
+    """Similitud coseno entre el embedding anterior y el nuevo de cada imagen"""
+    coseno = (antes * despues).sum(dim=1)
+    return {
+        "coseno_medio": round(coseno.mean().item(), 4),
+        "coseno_minimo": round(coseno.min().item(), 4),
+    }
+
+# === Entrenamiento ===
+def entrenar(model, dataloader, epocas, grupos_parametros):
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(grupos_parametros)
+    model.train()
+    for epoch in range(epocas):
+        total_loss = 0
+        for images, labels in dataloader:
+            outputs = model(images)
+            loss = criterion(outputs, labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+        print(f"🔁 Época {epoch+1}/{epocas} - Pérdida total: {total_loss:.4f}", flush=True)
+    model.eval()
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el clasificador CNN de rostros")
+    parser.add_argument("--modo", choices=["incremental", "completo"], default="completo",
+                        help="incremental: warm-start desde cnn_model.pth; completo: desde cero")
+    parser.add_argument("--epocas", type=int, default=None)
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="decodificar las imágenes en cada época (sin caché de tensores)")
+    parser.add_argument("--aumentar", action="store_true",
+                        default=os.environ.get("ENTRENAMIENTO_AUMENTACION", "0") == "1",
+                        help="una variación de aplicar_aumentacion al azar por imagen y época")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("ENTRENAMIENTO_WORKERS", 0)),
+                        help="procesos del DataLoader")
+    args = parser.parse_args()
+
+    # === Verificar dataset antes de entrenar ===
+    if not verificar_dataset():
+        print("❌ No se puede entrenar el modelo sin imágenes válidas")
+        print("💡 Registra al menos un usuario con imagen antes de entrenar")
+
+        # Crear clases vacías y modelo vacío para evitar errores
+        guardar_modelo(CNNClasificador(num_classes=0), [])
+        print("✅ Modelo vacío creado para evitar errores")
+        return 0
+
+    try:
+        # === Cargar dataset ===
+        inicio_preparacion = time.perf_counter()
+        cache = None
+        if args.sin_cache:
+            dataset = sondeo = datasets.ImageFolder(DATASET_DIR, transform=transform)
+            clases = dataset.classes
+        else:
+            clases, dataset, sondeo, cache = dataset_en_cache(args.aumentar)
+        preparacion = time.perf_counter() - inicio_preparacion
+        dataloader = DataLoader(dataset, batch_size=16, shuffle=True, num_workers=args.workers,
+                                persistent_workers=args.workers > 0)
+        print(f"✅ Dataset cargado con {len(clases)} clases: {clases}")
+
+        clases_previas, modelo_previo = cargar_modelo_previo()
+        modo = args.modo
+        if modo == "incremental" and modelo_previo is None:
+            print("💡 No hay modelo previo; se entrena desde cero")
+            modo = "completo"
+
+        # === Entrenamiento del modelo ===
+        inicio = time.perf_counter()
+        model = CNNClasificador(num_classes=len(clases))
+        if modo == "incremental":
+            iniciar_desde_previo(model, clases, clases_previas, modelo_previo)
+            epocas = args.epocas or EPOCAS_INCREMENTAL
+            # La API usa los embeddings de fc1, no la capa de salida: el extractor también se ajusta
+            # (con un paso más chico) y al recargar se recalculan los kp de todos los usuarios
+            grupos = [
+                {"params": list(model.features.parameters()) + list(model.fc1.parameters()),
+                 "lr": LR_BASE_INCREMENTAL},
+                {"params": model.output.parameters(), "lr": LR},
+            ]
+        else:
+            epocas = args.epocas or EPOCAS_COMPLETO
+            grupos = [{"params": model.parameters(), "lr": LR}]
+
+        print(f"🚀 Iniciando entrenamiento del modelo (modo {modo}, {epocas} épocas)...", flush=True)
+        entrenar(model, dataloader, epocas, grupos)
+        duracion = time.perf_counter() - inicio
+
+        # === Guardar modelo entrenado ===
+        guardar_modelo(model, clases)
+        print("✅ Modelo y clases guardados correctamente.")
+
+        reporte = {"modo": modo, "clases": len(clases), "imagenes": len(dataset),
+                   "epocas": epocas, "duracion_s": round(duracion, 2),
+                   "preparacion_s": round(preparacion, 2), "cache": cache, "deriva": None}
+        if modelo_previo is not None:
+            reporte["deriva"] = medir_deriva(embeddings_sondeo(modelo_previo, sondeo),
+                                             embeddings_sondeo(model, sondeo))
+        print(f"⏱️ Preparación: {preparacion:.2f} s | Entrenamiento: {duracion:.2f} s "
+              f"| Deriva de embeddings: {reporte['deriva']}")
+        print(f"📊 Reporte: {json.dumps(reporte)}")
+        return 0
+
+    except Exception as e:
+        print(f"❌ Error durante el entrenamiento: {e}")
+        print("💡 Verifica que las imágenes en dataset_augmented sean válidas")
+        print("💡 Se conserva el modelo anterior")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
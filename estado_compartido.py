@@ -0,0 +1,209 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: el bloqueo queda dentro del proceso (un solo worker)
+    fcntl = None
+
+# === ESTADO COMPARTIDO ENTRE WORKERS ===
+# Con ``uvicorn --workers N`` cada worker es un proceso con su propio modelo y su propia galería.
+# El modelo y la galería vigentes se publican en ESTADO_DIR como versiones inmutables:
+#   modelo_v<N>/     cnn_model.pth y clases.pkl de cada reentrenamiento
+#   galeria_v<G>/    matriz.npy, ids.npy (y listas.npy, centroides.npy con índice ANN)
+#   cambios/<D>.npz  usuarios cambiados por la versión D de la base, aplicados sobre la instantánea
+#   estado.json      versiones vigentes; se reemplaza de forma atómica al publicar
+# Cada worker compara el inodo y el mtime de estado.json (un stat) para detectar una versión
+# nueva, y abre la galería con np.load(mmap_mode="r"): los N workers comparten las mismas
+# páginas del archivo en lugar de tener N copias de la matriz.
+#
+# La tabla galeria_version guarda un contador que aumenta en la misma transacción que cada
+# cambio de usuario.kp. Cada cambio se publica como un delta pequeño (cambios/<D>.npz) en lugar
+# de reescribir la galería: estado.json registra la versión de la base que incluye la instantánea
+# (galeria_base_db) y la que alcanza con los deltas (galeria_db). La instantánea completa solo se
+# vuelve a escribir, fuera de la solicitud, cuando se acumulan suficientes deltas.
+
+SQL_CREAR_TABLA_VERSION = """CREATE TABLE IF NOT EXISTS galeria_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL
+)"""
+SQL_INICIAR_VERSION = "INSERT IGNORE INTO galeria_version (id, version) VALUES (1, 0)"
+
+def incrementar_version(cursor) -> int:
+    """Dentro de la transacción que cambia usuario.kp: aumenta y devuelve la versión de la galería"""
+    cursor.execute("UPDATE galeria_version SET version = version + 1 WHERE id = 1")
+    return leer_version(cursor)
+
+def leer_version(cursor) -> int:
+    cursor.execute("SELECT version FROM galeria_version WHERE id = 1")
+    fila = cursor.fetchone()
+    return int(fila[0]) if fila else 0
+
+# Versión 1 del modelo = cnn_model.pth y clases.pkl de la carpeta de trabajo (sin publicar)
+PUNTERO_INICIAL = {"modelo": 1, "galeria": 0, "galeria_db": -1, "galeria_base_db": -1, "galeria_modelo": 1}
+
+class EstadoCompartido:
+    """Versiones del modelo y de la galería publicadas en ``directorio`` para todos los workers"""
+
+    def __init__(self, directorio: str = "estado", conservar: int = 3):
+        self.directorio = Path(directorio)
+        self.conservar = conservar       # versiones anteriores que se mantienen en disco
+        self.ruta_puntero = self.directorio / "estado.json"
+        self._bloqueos = {}
+        self._lock = threading.Lock()
+        self._firma = None
+        self._puntero = dict(PUNTERO_INICIAL)
+
+    # --- Bloqueo entre procesos ---
+    @contextmanager
+    def bloqueo(self, nombre: str = "estado"):
+        """Exclusión entre workers (flock sobre <nombre>.lock) y entre hilos; reentrante en el mismo hilo"""
+        with self._lock:
+            if nombre not in self._bloqueos:
+                self._bloqueos[nombre] = {"lock": threading.RLock(), "profundidad": 0, "archivo": None}
+            bloqueo = self._bloqueos[nombre]
+        with bloqueo["lock"]:
+            if bloqueo["profundidad"] == 0:
+                self.directorio.mkdir(parents=True, exist_ok=True)
+                archivo = open(self.directorio / f"{nombre}.lock", "a+")
+                if fcntl is not None:
+                    fcntl.flock(archivo, fcntl.LOCK_EX)
+                bloqueo["archivo"] = archivo
+            bloqueo["profundidad"] += 1
+            try:
+                yield
+            finally:
+                bloqueo["profundidad"] -= 1
+                if bloqueo["profundidad"] == 0:
+                    bloqueo["archivo"].close()  # cerrar libera el flock
+                    bloqueo["archivo"] = None
+
+    # --- Versiones vigentes ---
+    def puntero(self) -> dict:
+        """Contenido de estado.json; solo se vuelve a leer si cambió (os.replace cambia el inodo)"""
+        try:
+            info = os.stat(self.ruta_puntero)
+        except FileNotFoundError:
+            return dict(PUNTERO_INICIAL)
+        firma = (info.st_ino, info.st_mtime_ns, info.st_size)
+        with self._lock:
+            if firma != self._firma:
+                with open(self.ruta_puntero, encoding="utf-8") as f:
+                    self._puntero = {**PUNTERO_INICIAL, **json.load(f)}
+                self._firma = firma
+            return dict(self._puntero)
+
+    def actualizar(self, **cambios) -> dict:
+        """Publica nuevas versiones (llamar con bloqueo() tomado)"""
+        puntero = {**self.puntero(), **cambios}
+        self._escribir_atomico(self.ruta_puntero, lambda f: f.write(json.dumps(puntero).encode()))
+        self._limpiar(puntero)
+        return puntero
+
+    def _escribir_atomico(self, ruta: Path, escribir):
+        temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")
+        with open(temporal, "wb") as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+
+    # --- Modelo ---
+    def ruta_modelo(self, version: int) -> Optional[Path]:
+        """Carpeta con los archivos de la versión; None para el modelo de la carpeta de trabajo"""
+        if version <= PUNTERO_INICIAL["modelo"]:
+            return None
+        return self.directorio / f"modelo_v{version}"
+
+    def guardar_modelo(self, ruta_pesos: str, ruta_clases: str) -> int:
+        """Copia el modelo recién entrenado como la versión siguiente (sin publicarla todavía)"""
+        version = self.puntero()["modelo"] + 1
+        destino = self.directorio / f"modelo_v{version}"
+        temporal = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        shutil.rmtree(temporal, ignore_errors=True)
+        temporal.mkdir(parents=True)
+        shutil.copy2(ruta_pesos, temporal / "cnn_model.pth")
+        shutil.copy2(ruta_clases, temporal / "clases.pkl")
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporal, destino)
+        return version
+
+    # --- Galería ---
+    def guardar_galeria(self, matriz: np.ndarray, ids: np.ndarray, listas: Optional[np.ndarray] = None,
+                        centroides: Optional[np.ndarray] = None) -> int:
+        """Escribe la instantánea como la versión siguiente (sin publicarla todavía; con bloqueo() tomado)"""
+        return self.reservar_galeria(self.escribir_galeria(matriz, ids, listas, centroides))
+
+    def escribir_galeria(self, matriz: np.ndarray, ids: np.ndarray, listas: Optional[np.ndarray] = None,
+                         centroides: Optional[np.ndarray] = None) -> Path:
+        """Escribe la instantánea en una carpeta temporal propia; no necesita bloqueo()"""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        temporal = Path(tempfile.mkdtemp(prefix="galeria_tmp", dir=self.directorio))
+        arrays = {"matriz": np.ascontiguousarray(matriz, dtype=np.float32), "ids": ids,
+                  "listas": listas, "centroides": centroides}
+        for nombre, array in arrays.items():
+            if array is not None:
+                np.save(temporal / f"{nombre}.npy", array)
+        return temporal
+
+    def reservar_galeria(self, temporal: Path) -> int:
+        """Renombra una instantánea escrita como la versión siguiente (con bloqueo() tomado)"""
+        version = self.puntero()["galeria"] + 1
+        destino = self.directorio / f"galeria_v{version}"
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporal, destino)
+        return version
+
+    def abrir_galeria(self, version: int) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """(matriz, ids, listas, centroides) de la versión, mapeados en memoria de solo lectura"""
+        carpeta = self.directorio / f"galeria_v{version}"
+        opcional = lambda nombre: (np.load(carpeta / f"{nombre}.npy", mmap_mode="r")
+                                   if (carpeta / f"{nombre}.npy").exists() else None)
+        return (np.load(carpeta / "matriz.npy", mmap_mode="r"), np.load(carpeta / "ids.npy", mmap_mode="r"),
+                opcional("listas"), opcional("centroides"))
+
+    # --- Cambios (deltas) sobre la instantánea ---
+    def guardar_cambio(self, version_db: int, cambios: Sequence[Tuple[int, Optional[np.ndarray]]]):
+        """Escribe los usuarios (id, filas) o bajas (id, None) de la versión ``version_db`` de la base"""
+        carpeta = self.directorio / "cambios"
+        carpeta.mkdir(parents=True, exist_ok=True)
+        filas = [np.asarray(bloque, dtype=np.float32) for _, bloque in cambios if bloque is not None]
+        arrays = {
+            "ids": np.array([usuario_id for usuario_id, _ in cambios], dtype=np.int64),
+            "longitudes": np.array([-1 if bloque is None else len(bloque) for _, bloque in cambios], dtype=np.int64),
+            "filas": np.concatenate(filas) if filas else np.empty((0, 0), dtype=np.float32),
+        }
+        self._escribir_atomico(carpeta / f"{version_db}.npz", lambda f: np.savez(f, **arrays))
+
+    def leer_cambio(self, version_db: int) -> List[Tuple[int, Optional[np.ndarray]]]:
+        """[(id, filas o None si es una baja)]; FileNotFoundError si ya se compactó"""
+        with np.load(self.directorio / "cambios" / f"{version_db}.npz") as datos:
+            ids, longitudes, filas = datos["ids"], datos["longitudes"], datos["filas"]
+        cambios, inicio = [], 0
+        for usuario_id, longitud in zip(ids.tolist(), longitudes.tolist()):
+            if longitud < 0:
+                cambios.append((usuario_id, None))
+            else:
+                cambios.append((usuario_id, filas[inicio:inicio + longitud]))
+                inicio += longitud
+        return cambios
+
+    def _limpiar(self, puntero: dict):
+        """Borra las versiones viejas; los workers que aún las tengan mapeadas conservan sus páginas"""
+        for prefijo, vigente in (("modelo_v", puntero["modelo"]), ("galeria_v", puntero["galeria"])):
+            for carpeta in self.directorio.glob(f"{prefijo}*"):
+                sufijo = carpeta.name[len(prefijo):]
+                if sufijo.isdigit() and int(sufijo) <= vigente - self.conservar:
+                    shutil.rmtree(carpeta, ignore_errors=True)
+        # Los deltas ya incluidos en la instantánea vigente (un worker atrasado abre la instantánea)
+        for archivo in (self.directorio / "cambios").glob("*.npz"):
+            if archivo.stem.isdigit() and int(archivo.stem) <= puntero["galeria_base_db"]:
+                archivo.unlink(missing_ok=True)
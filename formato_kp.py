@@ -0,0 +1,67 @@
+import json
+import struct
+from typing import Optional
+
+import numpy as np
+
+# === FORMATO BINARIO DE LA COLUMNA kp ===
+# Cabecera de 8 bytes: "KP", versión, tipo de dato, dimensión (uint16), cantidad (uint16),
+# seguida de la matriz (cantidad x dimensión) en little-endian. Las filas antiguas en JSON
+# se siguen leyendo mientras dure la migración (ver migrar_kp.py). La versión 2 agrega después
+# de la cabecera un float32 con la dispersión de los prototipos del usuario (ver prototipos.py).
+MAGIA = b"KP"
+VERSION = 1
+VERSION_DISPERSION = 2
+CABECERA = struct.Struct("<2sBBHH")
+DISPERSION = struct.Struct("<f")
+TIPOS = {"f32": (1, np.dtype("<f4")), "f16": (2, np.dtype("<f2"))}
+TIPOS_POR_CODIGO = {codigo: dtype for codigo, dtype in TIPOS.values()}
+
+def codificar_kp(embeddings, formato: str = "f32", dispersion: Optional[float] = None):
+    """Serializa una matriz (n_variaciones x dim) como binario versionado ("f32"/"f16") o JSON ("json").
+
+    La dispersión de los prototipos solo se guarda en binario.
+    """
+    matriz = np.asarray(embeddings, dtype=np.float32)
+    if matriz.ndim == 1:
+        matriz = matriz.reshape(1, -1)
+    if formato == "json":
+        return json.dumps(matriz.tolist())
+    codigo, dtype = TIPOS[formato]
+    cantidad, dim = matriz.shape
+    if dispersion is None:
+        return CABECERA.pack(MAGIA, VERSION, codigo, dim, cantidad) + matriz.astype(dtype).tobytes()
+    return (CABECERA.pack(MAGIA, VERSION_DISPERSION, codigo, dim, cantidad) + DISPERSION.pack(dispersion)
+            + matriz.astype(dtype).tobytes())
+
+def es_binario(kp) -> bool:
+    return isinstance(kp, (bytes, bytearray, memoryview)) and bytes(kp[:2]) == MAGIA
+
+def decodificar_kp(kp) -> np.ndarray:
+    """Convierte el contenido de la columna kp (binario o JSON) en una matriz (n_variaciones x dim).
+
+    En float32 la matriz es una vista de solo lectura sobre los bytes, sin copiarlos.
+    """
+    if es_binario(kp):
+        magia, version, codigo, dim, cantidad = CABECERA.unpack_from(kp)
+        if version not in (VERSION, VERSION_DISPERSION) or codigo not in TIPOS_POR_CODIGO:
+            raise ValueError(f"Formato kp no soportado (versión {version}, tipo {codigo})")
+        inicio = CABECERA.size + (DISPERSION.size if version == VERSION_DISPERSION else 0)
+        matriz = np.frombuffer(kp, dtype=TIPOS_POR_CODIGO[codigo], count=cantidad * dim,
+                               offset=inicio).reshape(cantidad, dim)
+        return matriz if matriz.dtype == np.float32 else matriz.astype(np.float32)
+
+    if isinstance(kp, (bytes, bytearray, memoryview)):
+        kp = bytes(kp).decode("utf-8")
+    if isinstance(kp, str):
+        kp = json.loads(kp)
+    matriz = np.asarray(kp, dtype=np.float32)
+    if matriz.ndim == 1:
+        matriz = matriz.reshape(1, -1)
+    return matriz
+
+def dispersion_kp(kp) -> Optional[float]:
+    """Dispersión de los prototipos guardada en kp, o None si kp tiene las variaciones completas"""
+    if not es_binario(kp) or CABECERA.unpack_from(kp)[1] != VERSION_DISPERSION:
+        return None
+    return DISPERSION.unpack_from(kp, CABECERA.size)[0]
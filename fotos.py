@@ -0,0 +1,74 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# === FOTOS DE USUARIO FUERA DE LA TABLA usuario ===
+# Las fotos viven en usuario_foto (usuario_id, hash, foto) para que usuario quede liviana.
+# ``hash`` es el SHA-256 del contenido y sirve como ETag y clave de caché de miniaturas.
+SQL_CREAR_TABLA_FOTOS = """CREATE TABLE IF NOT EXISTS usuario_foto (
+    usuario_id INT PRIMARY KEY,
+    hash CHAR(64) NOT NULL,
+    foto LONGBLOB NOT NULL
+)"""
+
+TAMANO_MINIMO = 16
+TAMANO_MAXIMO = 1024
+
+class EsquemaDesactualizado(RuntimeError):
+    """La base no tiene los cambios de esquema que necesita esta versión de la API"""
+
+def verificar_columna_foto(obligatoria: Optional[bool]):
+    """Los registros ya no escriben usuario.foto: si sigue siendo NOT NULL todos fallarían"""
+    if obligatoria:
+        raise EsquemaDesactualizado("❌ usuario.foto es NOT NULL y los registros ya no la escriben: "
+                                    "correr migrar_fotos.py antes de iniciar la API")
+
+def hash_foto(foto: bytes) -> str:
+    return hashlib.sha256(foto).hexdigest()
+
+def generar_miniatura(foto: bytes, tamano: int, calidad: int = 85) -> bytes:
+    """JPEG con el lado mayor reducido a ``tamano`` (respetando la orientación EXIF)"""
+    imagen = Image.open(io.BytesIO(foto))
+    imagen.draft("RGB", (tamano, tamano))  # decodificación JPEG reducida cuando es posible
+    imagen = ImageOps.exif_transpose(imagen).convert("RGB")
+    imagen.thumbnail((tamano, tamano))
+    salida = io.BytesIO()
+    imagen.save(salida, format="JPEG", quality=calidad)
+    return salida.getvalue()
+
+def guardar_foto(cursor, usuario_id: int, foto: bytes) -> str:
+    """Inserta o reemplaza la foto del usuario dentro de la transacción del cursor"""
+    hash_contenido = hash_foto(foto)
+    cursor.execute("REPLACE INTO usuario_foto (usuario_id, hash, foto) VALUES (%s, %s, %s)",
+                   (usuario_id, hash_contenido, foto))
+    return hash_contenido
+
+class CacheMiniaturas:
+    """Caché LRU de miniaturas por (hash, tamaño), limitada en bytes"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._datos: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: Tuple[str, int]) -> Optional[bytes]:
+        with self._lock:
+            datos = self._datos.get(clave)
+            if datos is not None:
+                self._datos.move_to_end(clave)
+            return datos
+
+    def guardar(self, clave: Tuple[str, int], datos: bytes):
+        with self._lock:
+            if clave in self._datos:
+                return
+            self._datos[clave] = datos
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes and self._datos:
+                _, eliminado = self._datos.popitem(last=False)
+                self._bytes -= len(eliminado)
@@ -0,0 +1,302 @@
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from formato_kp import decodificar_kp
+from indice_ann import IndiceIVF
+
+DIMENSION_EMBEDDING = 128
+
+# Pesos de la similitud combinada (coseno + euclidiana)
+PESO_COSENO = 0.7
+PESO_EUCLIDIANA = 0.3
+
+def normalizar_filas(matriz: np.ndarray) -> np.ndarray:
+    """Normalización L2 por fila (misma fórmula que normalizar_embedding)"""
+    norma = np.linalg.norm(matriz, axis=1, keepdims=True)
+    return (matriz / (norma + 1e-8)).astype(np.float32, copy=False)
+
+# === MOTOR DE SIMILITUD VECTORIZADO ===
+def similitudes_combinadas(consultas: np.ndarray, matriz: np.ndarray, normas: np.ndarray,
+                           inicios: np.ndarray) -> np.ndarray:
+    """Puntaje 0.7 * coseno + 0.3 * euclidiana de cada consulta contra cada usuario.
+
+    Equivale a llamar comparar_embeddings_robustos(consulta, embeddings_del_usuario) para
+    todas las combinaciones, pero con un solo producto matricial: el coseno y la distancia
+    euclidiana salen de la misma matriz de Gram (||a - b||² = ||a||² + ||b||² - 2 a·b).
+    Devuelve una matriz (n_consultas x n_usuarios); ``inicios`` marca la primera fila de
+    cada usuario en ``matriz`` y ``normas`` la norma L2 de cada fila.
+    """
+    consultas = normalizar_filas(np.asarray(consultas, dtype=np.float32).reshape(-1, matriz.shape[1]))
+    normas_q = np.linalg.norm(consultas, axis=1)[:, None]
+    normas_g = normas[None, :]
+
+    gram = consultas @ matriz.T
+    coseno = gram / (np.maximum(normas_q, 1e-8) * np.maximum(normas_g, 1e-8))
+    distancia2 = normas_q ** 2 + normas_g ** 2 - 2.0 * gram
+
+    # El máximo de cada métrica por usuario (la euclidiana es monótona en la distancia)
+    max_coseno = np.maximum.reduceat(coseno, inicios, axis=1)
+    min_distancia = np.sqrt(np.maximum(np.minimum.reduceat(distancia2, inicios, axis=1), 0.0))
+    max_euclidiana = 1.0 / (1.0 + min_distancia)
+
+    return PESO_COSENO * max_coseno + PESO_EUCLIDIANA * max_euclidiana
+
+# === GALERÍA DE EMBEDDINGS EN MEMORIA ===
+class _Estado:
+    """Instantánea inmutable de la galería (con los centroides IVF con que se calcularon sus listas)"""
+    __slots__ = ("matriz", "ids", "normas", "inicios", "listas", "centroides", "_invertidas")
+
+    def __init__(self, matriz: np.ndarray, ids: np.ndarray, listas: Optional[np.ndarray] = None,
+                 centroides: Optional[np.ndarray] = None):
+        self.matriz = np.ascontiguousarray(matriz, dtype=np.float32)   # filas x dim
+        self.ids = ids                                                 # usuario.id de cada fila
+        self.normas = np.linalg.norm(self.matriz, axis=1)              # norma L2 de cada fila
+        if ids.size:                                                   # primera fila de cada usuario
+            self.inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        else:
+            self.inicios = np.empty(0, dtype=np.int64)
+        self.listas = listas                                           # lista IVF de cada fila
+        self.centroides = centroides                                   # None = sin índice entrenado
+        self._invertidas = None
+
+    @property
+    def finales(self) -> np.ndarray:
+        return np.r_[self.inicios[1:], self.ids.size]
+
+class _Capas:
+    """La galería publicada: una instantánea base (mapeada desde disco y compartida entre workers,
+    nunca se copia), los usuarios dados de alta o reemplazados después y las bajas sobre la base"""
+    __slots__ = ("base", "cambios", "bajas")
+
+    def __init__(self, base: _Estado, cambios: _Estado, bajas: Optional[np.ndarray] = None):
+        self.base = base          # ordenada por id, con el índice IVF
+        self.cambios = cambios    # pocas filas, ordenadas por id, búsqueda exacta
+        self.bajas = bajas        # un bool por usuario de la base (None = ninguna baja)
+
+class GaleriaEmbeddings:
+    """Matriz contigua float32 con los embeddings L2-normalizados de todos los usuarios.
+
+    Las filas de cada usuario son contiguas y ``ids`` guarda el usuario.id de cada fila.
+    Las altas, reemplazos y bajas no tocan la matriz base: van a una matriz chica aparte y a
+    una máscara de bajas, que solo se funden con la base al exportarla (ver _Capas). Cada
+    modificación publica las capas nuevas de una sola vez, de modo que los lectores trabajan
+    siempre sobre una instantánea consistente sin bloquear.
+    """
+
+    def __init__(self, dim: int = DIMENSION_EMBEDDING, indice: Optional[IndiceIVF] = None):
+        self.dim = dim
+        self.indice = indice  # None = búsqueda exacta
+        self._lock = threading.Lock()
+        self._capas = _Capas(self._vacio(), self._vacio())
+        self.cargada = False
+        self.version = 0      # instantánea de estado_compartido cargada (0 = construida en este proceso)
+
+    def _vacio(self) -> _Estado:
+        return _Estado(np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64))
+
+    # --- Lectura ---
+    def instantanea(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve (matriz, ids); sin cambios pendientes no se copian y no deben modificarse"""
+        matriz, ids, _ = self._fundida(self._capas)
+        return matriz, ids
+
+    def __len__(self) -> int:
+        """Número de usuarios en la galería"""
+        capas = self._capas
+        bajas = int(capas.bajas.sum()) if capas.bajas is not None else 0
+        return int(capas.base.inicios.size) - bajas + int(capas.cambios.inicios.size)
+
+    def puntuar(self, consultas) -> Tuple[np.ndarray, np.ndarray]:
+        """Mejor puntaje combinado de cada usuario frente a todas las consultas.
+
+        Devuelve (ids_usuarios, puntajes) en el orden de la galería. Con un índice ANN
+        entrenado solo se devuelven los usuarios preseleccionados, puntuados de forma exacta.
+        """
+        ids_usuarios, puntajes = self._puntajes(consultas)
+        return ids_usuarios, puntajes.max(axis=0)
+
+    def puntuar_lote(self, consultas, inicios_consultas) -> Tuple[np.ndarray, np.ndarray]:
+        """Como puntuar, pero para varias personas a la vez en un solo producto matricial.
+
+        ``consultas`` apila las variaciones de todas las personas e ``inicios_consultas`` marca
+        la primera fila de cada una. Devuelve (ids_usuarios, puntajes n_personas x n_usuarios).
+        """
+        ids_usuarios, puntajes = self._puntajes(consultas)
+        if ids_usuarios.size == 0:
+            return ids_usuarios, np.empty((len(inicios_consultas), 0), dtype=np.float32)
+        return ids_usuarios, np.maximum.reduceat(puntajes, inicios_consultas, axis=0)
+
+    def mas_similares(self, consultas, k: int, umbral: float = -np.inf) -> Tuple[np.ndarray, np.ndarray]:
+        """Los ``k`` usuarios con mejor puntaje por encima de ``umbral``, de mayor a menor.
+
+        Con un índice ANN entrenado solo se puntúan los usuarios preseleccionados.
+        """
+        ids_usuarios, puntajes = self.puntuar(consultas)
+        if puntajes.size > k:
+            posiciones = np.argpartition(-puntajes, k - 1)[:k]
+        else:
+            posiciones = np.arange(puntajes.size)
+        posiciones = posiciones[np.argsort(-puntajes[posiciones], kind="stable")]
+        posiciones = posiciones[puntajes[posiciones] > umbral]
+        return ids_usuarios[posiciones], puntajes[posiciones]
+
+    def _puntajes(self, consultas) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids_usuarios, puntajes n_consultas x n_usuarios) sobre la instantánea actual.
+
+        Primero los usuarios vigentes de la base y después los cambiados (cada grupo ordenado por id).
+        """
+        capas = self._capas
+        base, cambios = capas.base, capas.cambios
+        consultas = normalizar_filas(np.asarray(consultas, dtype=np.float32).reshape(-1, self.dim))
+        posiciones, puntajes = self._puntajes_base(base, consultas)
+        if capas.bajas is not None and posiciones.size:
+            vigentes = ~capas.bajas[posiciones]
+            posiciones, puntajes = posiciones[vigentes], puntajes[:, vigentes]
+        ids_usuarios = base.ids[base.inicios[posiciones]]
+        if cambios.inicios.size == 0:
+            return ids_usuarios, puntajes
+        extra = similitudes_combinadas(consultas, cambios.matriz, cambios.normas, cambios.inicios)
+        return (np.concatenate([ids_usuarios, cambios.ids[cambios.inicios]]),
+                np.concatenate([puntajes, extra], axis=1))
+
+    def _puntajes_base(self, estado: _Estado, consultas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(posiciones de los usuarios puntuados en ``estado``, puntajes n_consultas x usuarios)"""
+        if estado.inicios.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty((len(consultas), 0), dtype=np.float32)
+
+        if self.indice is None or estado.listas is None or estado.centroides is None:
+            puntajes = similitudes_combinadas(consultas, estado.matriz, estado.normas, estado.inicios)
+            return np.arange(estado.inicios.size), puntajes
+
+        filas, inicios_locales, posiciones = self._preseleccion(estado, consultas)
+        if posiciones.size == 0:
+            return posiciones, np.empty((len(consultas), 0), dtype=np.float32)
+        return posiciones, similitudes_combinadas(consultas, estado.matriz[filas], estado.normas[filas],
+                                                  inicios_locales)
+
+    def _preseleccion(self, estado: _Estado, consultas: np.ndarray):
+        """Filas completas de los usuarios con al menos una fila en las listas sondeadas"""
+        if estado._invertidas is None:
+            estado._invertidas = self.indice.listas_invertidas(estado.listas, len(estado.centroides))
+        candidatas = self.indice.preseleccionar(consultas, estado.centroides, *estado._invertidas)
+        posiciones = np.unique(np.searchsorted(estado.inicios, candidatas, side="right") - 1)
+
+        longitudes = estado.finales[posiciones] - estado.inicios[posiciones]
+        inicios_locales = np.cumsum(longitudes) - longitudes
+        filas = (np.arange(longitudes.sum()) - np.repeat(inicios_locales, longitudes)
+                 + np.repeat(estado.inicios[posiciones], longitudes))
+        return filas, inicios_locales, posiciones
+
+    # --- Escritura ---
+    def _bloque(self, embeddings) -> np.ndarray:
+        bloque = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        return normalizar_filas(bloque)
+
+    def _indexado(self, matriz: np.ndarray, ids: np.ndarray) -> _Estado:
+        """Instantánea con el índice IVF entrenado sobre ``matriz`` (si hay índice y filas suficientes)"""
+        centroides = self.indice.entrenar(matriz) if self.indice is not None else None
+        if centroides is None:
+            return _Estado(matriz, ids)
+        return _Estado(matriz, ids, self.indice.asignar(matriz, centroides), centroides)
+
+    def _fundida(self, capas: _Capas) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """(matriz, ids, listas) de la base con las bajas y los cambios aplicados, ordenados por id"""
+        base, cambios = capas.base, capas.cambios
+        if capas.bajas is None and cambios.ids.size == 0:
+            return base.matriz, base.ids, base.listas
+        vigentes = np.ones(base.ids.size, dtype=bool)
+        if capas.bajas is not None:
+            vigentes = ~np.repeat(capas.bajas, base.finales - base.inicios)
+        ids = np.concatenate([base.ids[vigentes], cambios.ids])
+        orden = np.argsort(ids, kind="stable")
+        listas = None
+        if base.centroides is not None:
+            # Las filas nuevas se asignan a los centroides existentes, sin reentrenar
+            listas = np.concatenate([base.listas[vigentes], self.indice.asignar(cambios.matriz, base.centroides)])[orden]
+        return np.concatenate([base.matriz[vigentes], cambios.matriz])[orden], ids[orden], listas
+
+    def _crecido(self, capas: _Capas) -> _Capas:
+        """Entrena el índice cuando la galería llega a min_filas creciendo con registros"""
+        filas = len(capas.base.matriz) + len(capas.cambios.matriz)
+        if self.indice is None or capas.base.centroides is not None or filas < self.indice.min_filas:
+            return capas
+        matriz, ids, _ = self._fundida(capas)
+        return _Capas(self._indexado(matriz, ids), self._vacio())
+
+    def cargar(self, filas: Iterable[Tuple[int, object]]):
+        """Reconstruye la galería completa a partir de filas (id, kp) ordenadas por id"""
+        bloques: List[np.ndarray] = []
+        ids: List[np.ndarray] = []
+        for usuario_id, kp in filas:
+            if kp is None or len(kp) == 0:
+                continue
+            try:
+                bloque = self._bloque(decodificar_kp(kp))
+            except (ValueError, TypeError) as e:
+                print(f"⚠️ Embeddings inválidos para el usuario {usuario_id}: {e}")
+                continue
+            bloques.append(bloque)
+            ids.append(np.full(len(bloque), usuario_id, dtype=np.int64))
+
+        if bloques:
+            estado = self._indexado(np.concatenate(bloques), np.concatenate(ids))
+        else:
+            estado = self._vacio()
+
+        with self._lock:
+            self._capas = _Capas(estado, self._vacio())
+            self.cargada = True
+            self.version = 0
+
+    def cargar_instantanea(self, matriz: np.ndarray, ids: np.ndarray, listas: Optional[np.ndarray] = None,
+                           centroides: Optional[np.ndarray] = None, version: int = 0):
+        """Publica arrays ya normalizados y ordenados por id (p. ej. mapeados desde disco) sin copiarlos"""
+        if self.indice is None:
+            estado = _Estado(matriz, ids)
+        elif listas is None or centroides is None or (np.asarray(listas) < 0).any():
+            # Instantánea guardada sin índice entrenado (p. ej. con menos de min_filas filas)
+            estado = self._indexado(matriz, ids)
+        else:
+            estado = _Estado(matriz, ids, listas, np.asarray(centroides))
+        with self._lock:
+            self._capas = _Capas(estado, self._vacio())
+            self.cargada = True
+            self.version = version
+
+    def exportar(self) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """(matriz, ids, listas, centroides) con los cambios fundidos en la base, para guardarla en disco"""
+        capas = self._capas
+        return (*self._fundida(capas), capas.base.centroides)
+
+    def aplicar_cambios(self, cambios: Iterable[Tuple[int, Optional[object]]]):
+        """Aplica altas o reemplazos (id, embeddings) y bajas (id, None).
+
+        La base no se copia: sus usuarios afectados se marcan como bajas y las filas nuevas se
+        agregan a la matriz de cambios, así que el costo es O(filas cambiadas), no O(galería).
+        """
+        cambios = list(cambios)
+        if not cambios:
+            return
+        bloques = [(usuario_id, self._bloque(embeddings)) for usuario_id, embeddings in cambios
+                   if embeddings is not None]
+        nuevas = np.concatenate([bloque for _, bloque in bloques] or [np.empty((0, self.dim), dtype=np.float32)])
+        nuevos_ids = np.concatenate([np.full(len(bloque), usuario_id, dtype=np.int64) for usuario_id, bloque in bloques]
+                                    or [np.empty(0, dtype=np.int64)])
+        tocados = np.unique(np.array([usuario_id for usuario_id, _ in cambios], dtype=np.int64))
+        with self._lock:
+            capas = self._capas
+            base, previos = capas.base, capas.cambios
+            usuarios_base = base.ids[base.inicios]
+            posiciones = np.minimum(np.searchsorted(usuarios_base, tocados), max(usuarios_base.size - 1, 0))
+            en_base = posiciones[usuarios_base[posiciones] == tocados] if usuarios_base.size else posiciones[:0]
+            bajas = capas.bajas
+            if en_base.size:
+                bajas = np.zeros(usuarios_base.size, dtype=bool) if bajas is None else bajas.copy()
+                bajas[en_base] = True
+            conservar = ~np.isin(previos.ids, tocados)
+            ids = np.concatenate([previos.ids[conservar], nuevos_ids])
+            orden = np.argsort(ids, kind="stable")
+            matriz = np.concatenate([previos.matriz[conservar], nuevas])[orden]
+            self._capas = self._crecido(_Capas(base, _Estado(matriz, ids[orden]), bajas))
@@ -0,0 +1,90 @@
+import argparse
+import sys
+import time
+from typing import Iterator
+
+import cv2
+import numpy as np
+
+# === PRUEBA SIN CONEXIÓN DE LA IDENTIFICACIÓN EN VIDEO ===
+# Reproduce un archivo de video (o una secuencia sintética a partir de una foto) contra el
+# endpoint /ws/identificar dentro del mismo proceso, sin cámara ni servidor aparte. Usa la misma
+# configuración (DB_*, detector, modelo) que main.py para cargar la galería y los perfiles.
+
+def cuadros_de_video(ruta: str, max_cuadros: int) -> Iterator[np.ndarray]:
+    captura = cv2.VideoCapture(ruta)
+    if not captura.isOpened():
+        raise SystemExit(f"❌ No se pudo abrir el video {ruta}")
+    try:
+        for _ in range(max_cuadros):
+            ok, bgr = captura.read()
+            if not ok:
+                break
+            yield bgr
+    finally:
+        captura.release()
+
+def cuadros_sinteticos(ruta_foto: str, cantidad: int, ancho: int = 640, alto: int = 480) -> Iterator[np.ndarray]:
+    """La foto desplazándose lentamente sobre un fondo gris, como una persona frente a la cámara"""
+    foto = cv2.imread(ruta_foto)
+    if foto is None:
+        raise SystemExit(f"❌ No se pudo leer la foto {ruta_foto}")
+    escala = min(1.0, 0.8 * alto / foto.shape[0], 0.6 * ancho / foto.shape[1])
+    foto = cv2.resize(foto, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+    fh, fw = foto.shape[:2]
+    for i in range(cantidad):
+        cuadro = np.full((alto, ancho, 3), 128, dtype=np.uint8)
+        x = int((ancho - fw) * (0.5 + 0.3 * np.sin(i / 15)))
+        y = (alto - fh) // 2
+        cuadro[y:y + fh, x:x + fw] = foto
+        yield cuadro
+
+def main():
+    parser = argparse.ArgumentParser(description="Identificación en video sin conexión (archivo local)")
+    parser.add_argument("video", nargs="?", help="archivo de video (mp4, avi, ...)")
+    parser.add_argument("--sintetico", metavar="FOTO", help="generar la secuencia a partir de una foto")
+    parser.add_argument("--max-cuadros", type=int, default=300)
+    parser.add_argument("--detalle", action="store_true", help="mostrar cada cuadro")
+    args = parser.parse_args()
+    if not args.video and not args.sintetico:
+        parser.error("indique un video o --sintetico FOTO")
+
+    from fastapi.testclient import TestClient
+    import main as api
+
+    cuadros = (cuadros_sinteticos(args.sintetico, args.max_cuadros) if args.sintetico
+               else cuadros_de_video(args.video, args.max_cuadros))
+    latencias = {"deteccion": [], "seguimiento": []}
+    estado_anterior = None
+    with TestClient(api.app) as cliente, cliente.websocket_connect("/ws/identificar?descartar=false") as ws:
+        inicio = time.perf_counter()
+        for bgr in cuadros:
+            ok, jpeg = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            t = time.perf_counter()
+            ws.send_bytes(jpeg.tobytes())
+            r = ws.receive_json()
+            latencias["deteccion" if r.get("deteccion") else "seguimiento"].append((time.perf_counter() - t) * 1000)
+            if "error" in r:
+                print(f"⚠️ cuadro {r['cuadro']}: {r['error']}")
+                continue
+            if args.detalle or r["estado"] != estado_anterior or "usuario" in r:
+                print(f"🎞️ cuadro {r['cuadro']:>4} | {r['estado']:<12} | similitud {r['similitud']:.4f} "
+                      f"| detector {'sí' if r['deteccion'] else 'no'} | aumentación {'sí' if r.get('aumentacion') else 'no'}")
+            if "usuario" in r:
+                u = r["usuario"]
+                print(f"   ✅ {u['nombre']} {u['apellido']} ({u['codigo']})" + (f" {r['notificacion']}" if r["alerta"] else ""))
+            estado_anterior = r["estado"]
+        ws.send_text("fin")
+        resumen = ws.receive_json()["resumen"]
+        duracion = time.perf_counter() - inicio
+
+    print(f"📊 {resumen['cuadros']} cuadros en {duracion:.1f} s ({resumen['cuadros'] / max(duracion, 1e-9):.1f} cuadros/s) "
+          f"| detector en {resumen['detecciones']} | sin aumentación {resumen['cuadros_sin_aumentacion']}")
+    for tipo, valores in latencias.items():
+        if valores:
+            print(f"   {tipo:<12} p50 {np.percentile(valores, 50):.1f} ms | p95 {np.percentile(valores, 95):.1f} ms")
+    print(f"   identificaciones: {resumen['identificaciones'] or 'ninguna'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import io
+
+from PIL import Image, ImageOps
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+# === DECODIFICACIÓN ACOTADA DE IMÁGENES SUBIDAS ===
+# Una foto de celular de 12 MP ocupa ~36 MB en RGB, pero el rostro termina en 100x100. Los JPEG se
+# decodifican con reducción DCT (draft: 1/2, 1/4 u 1/8 del tamaño) hasta quedar cerca de max_lado y
+# luego se reducen al tamaño exacto; la orientación EXIF se aplica sobre la imagen ya reducida.
+
+def decodificar_imagen(datos: bytes, max_lado: int = 1600, max_pixeles: int = 50_000_000) -> Image.Image:
+    """Imagen RGB con el lado mayor <= max_lado (0 = sin reducir) y la orientación EXIF aplicada.
+
+    Lanza ValueError si la imagen declara más de max_pixeles (se revisa antes de decodificarla).
+    """
+    imagen = Image.open(io.BytesIO(datos))
+    ancho, alto = imagen.size
+    if ancho * alto > max_pixeles:
+        raise ValueError(f"Imagen de {ancho}x{alto} píxeles (máximo {max_pixeles})")
+    if max_lado and max(ancho, alto) > max_lado:
+        escala = max_lado / max(ancho, alto)
+        destino = (max(1, round(ancho * escala)), max(1, round(alto * escala)))
+        imagen.draft("RGB", destino)  # JPEG: decodifica ya reducido, sin bajar del destino
+        imagen.thumbnail(destino, Image.Resampling.BILINEAR, reducing_gap=None)
+    ImageOps.exif_transpose(imagen, in_place=True)
+    if imagen.mode != "RGB":
+        imagen = imagen.convert("RGB")
+    return imagen
+
+# === LÍMITE DE TAMAÑO DE LAS SUBIDAS ===
+
+class MiddlewareLimiteSubida:
+    """Responde 413 a las solicitudes con un cuerpo mayor que max_bytes antes de leerlo.
+
+    Se revisa el Content-Length declarado y, si no viene, los bytes recibidos a medida que llegan.
+    Las rutas de ``excluir`` (prefijos) tienen sus propios límites.
+    """
+
+    def __init__(self, app, max_bytes: int, excluir=()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.excluir = tuple(excluir)
+
+    def _detalle(self) -> str:
+        return f"❌ La subida supera el máximo de {self.max_bytes / 2**20:.0f} MB"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes or scope["path"].startswith(self.excluir):
+            await self.app(scope, receive, send)
+            return
+        longitud = dict(scope["headers"]).get(b"content-length")
+        if longitud is not None and longitud.isdigit() and int(longitud) > self.max_bytes:
+            await JSONResponse({"detail": self._detalle()}, status_code=413)(scope, receive, send)
+            return
+        recibidos = 0
+
+        async def recibir():
+            nonlocal recibidos
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                recibidos += len(mensaje.get("body", b""))
+                if recibidos > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=self._detalle())
+            return mensaje
+
+        await self.app(scope, recibir, send)
@@ -0,0 +1,75 @@
+from typing import Optional
+
+import numpy as np
+
+# === K-MEANS ESFÉRICO ===
+def kmeans_esferico(datos: np.ndarray, k: int, iteraciones: int = 10, semilla: int = 0) -> np.ndarray:
+    """Centroides L2-normalizados agrupando por similitud coseno (datos ya normalizados)"""
+    rng = np.random.default_rng(semilla)
+    centroides = datos[rng.choice(len(datos), size=k, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignacion = np.argmax(datos @ centroides.T, axis=1)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignacion, datos)
+        conteos = np.bincount(asignacion, minlength=k)
+        # Los centroides sin puntos se reinician en una fila al azar
+        vacios = conteos == 0
+        if vacios.any():
+            sumas[vacios] = datos[rng.choice(len(datos), size=int(vacios.sum()), replace=False)]
+        norma = np.linalg.norm(sumas, axis=1, keepdims=True)
+        centroides = (sumas / (norma + 1e-8)).astype(np.float32)
+    return centroides
+
+# === ÍNDICE IVF (LISTAS INVERTIDAS) ===
+class IndiceIVF:
+    """Índice aproximado estilo IVF sobre las filas de la galería.
+
+    Cada fila se asigna al centroide más cercano. En la búsqueda se sondean las
+    ``n_sondeos`` listas más prometedoras para el conjunto de consultas y se devuelve
+    la preselección de filas; la galería vuelve a puntuar de forma exacta solo a los
+    usuarios de esa preselección. El índice solo guarda la configuración: los centroides
+    viajan con cada instantánea de la galería, junto con las listas que se calcularon con ellos.
+    """
+
+    # Puntos de entrenamiento por centroide (muestra para k-means)
+    PUNTOS_POR_LISTA = 64
+    BLOQUE_ASIGNACION = 65536
+
+    def __init__(self, n_listas: int = 0, n_sondeos: int = 16, min_filas: int = 20000):
+        self.n_listas = n_listas          # 0 = automático (raíz cuadrada del número de filas)
+        self.n_sondeos = n_sondeos
+        self.min_filas = min_filas        # por debajo de este tamaño se usa búsqueda exacta
+
+    def entrenar(self, matriz: np.ndarray, semilla: int = 0) -> Optional[np.ndarray]:
+        """Centroides calculados con una muestra de la galería; None por debajo de min_filas"""
+        if len(matriz) < self.min_filas or len(matriz) == 0:
+            return None
+        k = self.n_listas or int(np.sqrt(len(matriz)))
+        k = max(1, min(k, len(matriz)))
+        rng = np.random.default_rng(semilla)
+        n_muestra = min(len(matriz), k * self.PUNTOS_POR_LISTA)
+        muestra = matriz[rng.choice(len(matriz), size=n_muestra, replace=False)]
+        return kmeans_esferico(muestra, k, semilla=semilla)
+
+    def asignar(self, matriz: np.ndarray, centroides: np.ndarray) -> np.ndarray:
+        """Lista (centroide más cercano) de cada fila"""
+        listas = np.empty(len(matriz), dtype=np.int32)
+        for inicio in range(0, len(matriz), self.BLOQUE_ASIGNACION):
+            bloque = matriz[inicio:inicio + self.BLOQUE_ASIGNACION]
+            listas[inicio:inicio + len(bloque)] = np.argmax(bloque @ centroides.T, axis=1)
+        return listas
+
+    @staticmethod
+    def listas_invertidas(listas: np.ndarray, n_listas: int):
+        """(orden, desplazamientos): filas agrupadas por lista para recuperarlas por rango"""
+        orden = np.argsort(listas, kind="stable")
+        desplazamientos = np.searchsorted(listas[orden], np.arange(n_listas + 1))
+        return orden, desplazamientos
+
+    def preseleccionar(self, consultas: np.ndarray, centroides: np.ndarray, orden: np.ndarray,
+                       desplazamientos: np.ndarray) -> np.ndarray:
+        """Filas candidatas de las listas más cercanas a cualquiera de las consultas"""
+        puntaje_listas = (consultas @ centroides.T).max(axis=0)
+        n_sondeos = min(self.n_sondeos, len(centroides))
+        sondeadas = np.argpartition(-puntaje_listas, n_sondeos - 1)[:n_sondeos]
+        return np.concatenate([orden[desplazamientos[l]:desplazamientos[l + 1]] for l in sondeadas])
@@ -1,19 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import torch
-from torchvision import transforms
+from fastapi.responses import StreamingResponse
 from PIL import Image, ImageEnhance, ImageFilter
+import hashlib
 import io
 import json
-import mysql.connector
-from torch.nn.functional import cosine_similarity
-import pickle
+import asyncio
 import os
 from pathlib import Path
-import subprocess
+import shutil
+import threading
+import time
 import numpy as np
-import cv2
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
+from base_datos import PoolMySQL
+from galeria import GaleriaEmbeddings, normalizar_filas, similitudes_combinadas
+from aumentacion import PRESUPUESTOS_TTA, VARIACIONES
+from estado_compartido import (SQL_CREAR_TABLA_VERSION, SQL_INICIAR_VERSION, EstadoCompartido,
+                               incrementar_version, leer_version)
+from formato_kp import codificar_kp, dispersion_kp
+from fotos import (SQL_CREAR_TABLA_FOTOS, TAMANO_MAXIMO, TAMANO_MINIMO, CacheMiniaturas, EsquemaDesactualizado,
+                   generar_miniatura, guardar_foto, verificar_columna_foto)
+from indice_ann import IndiceIVF
+from prototipos import METODOS as METODOS_PROTOTIPOS, comprimir_embeddings, umbral_con_dispersion
+from reentrenamiento import ReentrenadorModelo
+from microlotes import AgrupadorInferencia
+from ejecucion import EjecutorCPU, Saturado, configurar_hilos_torch
+from seguimiento import SeguidorRostro, VentanaIdentidad
+from registro_masivo import (ItemRegistro, LoteInvalido, construir_items, duplicados_internos, leer_zip,
+                             marcar_repetidos)
+from detectores import crear_detector, detectar_rostros
+from imagenes import MiddlewareLimiteSubida, decodificar_imagen
+from metricas import BUCKETS_REENTRENAMIENTO, MiddlewareMetricas, RegistroMetricas
+from perfilador import perfilar
+from tiempos import etapa
+import tiempos
 
 app = FastAPI()
 
@@ -26,6 +47,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# === MÉTRICAS (GET /metrics, formato Prometheus) ===
+# Las etapas son las de tiempos.etapa(); los medidores de estado se leen al exportar
+metricas = RegistroMetricas()
+metrica_solicitudes = metricas.contador("solicitudes_total", "Solicitudes HTTP por ruta y código", ("ruta", "codigo"))
+metrica_duracion = metricas.histograma("solicitud_segundos", "Duración de las solicitudes HTTP", ("ruta",))
+metrica_etapas = metricas.histograma("etapa_segundos", "Duración de cada etapa de la solicitud", ("ruta", "etapa"))
+metrica_identificaciones = metricas.contador(
+    "identificaciones_total", "Resultados de /comparar_rostro (coincidencia, sin_coincidencia, sin_rostro)", ("resultado",))
+metrica_espera_db = metricas.histograma("db_espera_segundos", "Espera hasta obtener una conexión del pool")
+metrica_reentrenamiento = metricas.histograma(
+    "reentrenamiento_segundos", "Duración de cada reentrenamiento", ("modo", "estado"), buckets=BUCKETS_REENTRENAMIENTO)
+metricas.medidor("galeria_usuarios", "Usuarios en la galería en memoria", funcion=lambda: len(galeria))
+metricas.medidor("galeria_version", "Instantánea de la galería cargada (0 = construida en el proceso)",
+                 funcion=lambda: galeria.version)
+metricas.medidor("modelo_version", "Versión del modelo en uso", funcion=lambda: modelo_version)
+metricas.medidor("modelo_cargado", "1 si el modelo ya está en memoria", funcion=lambda: reconocimiento is not None)
+metricas.medidor("db_conexiones_en_uso", "Conexiones del pool tomadas", funcion=lambda: db.en_uso)
+metricas.contador("db_reconexiones_total", "Conexiones restablecidas por el pool", funcion=lambda: db.reconexiones)
+metricas.medidor("cpu_solicitudes_en_curso", "Solicitudes admitidas en el pool de CPU", funcion=lambda: ejecutor_cpu.en_curso)
+metricas.contador("cpu_rechazadas_total", "Solicitudes rechazadas con 503 por saturación",
+                  funcion=lambda: ejecutor_cpu.rechazadas)
+
+# === LÍMITES DE LAS IMÁGENES SUBIDAS ===
+# SUBIDA_MAX_MB: cuerpo máximo de cada solicitud (413 antes de leerlo; el registro por lotes tiene
+# sus propios límites). IMAGEN_MAX_LADO: lado mayor al que se decodifican las fotos (0 = completo);
+# IMAGEN_MAX_PIXELES: fotos más grandes se rechazan sin decodificarlas.
+SUBIDA_MAX_MB = int(os.environ.get('SUBIDA_MAX_MB', 10))
+IMAGEN_MAX_LADO = int(os.environ.get('IMAGEN_MAX_LADO', 1600))
+IMAGEN_MAX_PIXELES = int(os.environ.get('IMAGEN_MAX_PIXELES', 50_000_000))
+app.add_middleware(MiddlewareLimiteSubida, max_bytes=SUBIDA_MAX_MB * 1024 * 1024,
+                   excluir=("/registrar_usuarios_lote",))
+app.add_middleware(MiddlewareMetricas, duracion=metrica_duracion, solicitudes=metrica_solicitudes)
+
+def informar_tiempos(ruta: str, tiempos_etapas: dict, imprimir: bool = True):
+    """Suma los tiempos por etapa de la solicitud a /metrics y los imprime"""
+    for nombre, ms in tiempos_etapas.items():
+        metrica_etapas.observar(ms / 1000, ruta=ruta, etapa=nombre)
+    if imprimir:
+        print(tiempos.resumen(ruta, tiempos_etapas))
+
 # Configuración MySQL
 config = {
        'user': os.environ.get('DB_USER'),
@@ -34,207 +95,703 @@ config = {
        'port': os.environ.get('DB_PORT'),
        'database': os.environ.get('DB_NAME')
    }
+# Pool compartido por todas las rutas; DB_POOL_TAMANO limita también las consultas simultáneas
+db = PoolMySQL(config, tamano=int(os.environ.get('DB_POOL_TAMANO', 5)), observar_espera=metrica_espera_db.observar)
+
+# Formato de la columna kp al escribir (KP_FORMATO): f32 | f16 (binarios) | json (formato anterior).
+# La lectura acepta cualquiera de ellos; migrar_kp.py convierte las filas JSON existentes. Sin
+# definir, asegurar_tablas elige f32 si usuario.kp ya es BLOB (ver migrar_kp.py) y json mientras
+# siga siendo la columna de texto original
+KP_FORMATO_CONFIGURADO = os.environ.get('KP_FORMATO')
+KP_FORMATO = KP_FORMATO_CONFIGURADO or 'json'
+
+# === Galería de embeddings en memoria ===
+# BUSQUEDA_MODO: "exacta" (por defecto) o "ann" (índice IVF + re-ranking exacto)
+BUSQUEDA_MODO = os.environ.get('BUSQUEDA_MODO', 'exacta').lower()
+indice_ann = None
+if BUSQUEDA_MODO == 'ann':
+    indice_ann = IndiceIVF(
+        n_listas=int(os.environ.get('ANN_LISTAS', 0)),
+        n_sondeos=int(os.environ.get('ANN_SONDEOS', 16)),
+        min_filas=int(os.environ.get('ANN_MIN_FILAS', 20000)),
+    )
+galeria = GaleriaEmbeddings(indice=indice_ann)
+
+# === Estado compartido entre workers (uvicorn --workers N) ===
+# El modelo y la galería vigentes se publican en ESTADO_DIR (ver estado_compartido.py). Cada
+# worker revisa estado.json con un stat: en cada solicitud que usa la galería y, para cargar
+# los modelos nuevos, en un hilo de fondo cada ESTADO_INTERVALO_S segundos.
+estado_compartido = EstadoCompartido(os.environ.get('ESTADO_DIR', 'estado'),
+                                     conservar=int(os.environ.get('ESTADO_CONSERVAR', 3)))
+ESTADO_INTERVALO_S = float(os.environ.get('ESTADO_INTERVALO_S', 1.0))
+
+def cargar_galeria() -> int:
+    """Construye la galería con los embeddings de todos los usuarios; devuelve la versión de la base leída"""
+    with db.conexion() as conn, etapa("carga_galeria"):
+        cursor = conn.cursor()
+        version_db = leer_version(cursor)  # misma transacción: coherente con las filas leídas
+        cursor.execute("SELECT id, kp FROM usuario ORDER BY id")
+        galeria.cargar(cursor.fetchall())
+        cursor.close()
+    print(f"✅ Galería cargada con {len(galeria)} usuarios")
+    return version_db
+
+# === Fotos de usuario (tabla usuario_foto, fuera de la tabla usuario) ===
+miniaturas = CacheMiniaturas(max_bytes=int(os.environ.get('MINIATURAS_CACHE_MB', 32)) * 1024 * 1024)
+
+def elegir_formato_kp(tipo_columna: Optional[str]):
+    """Fija KP_FORMATO según el tipo de usuario.kp: el binario no entra en una columna de texto"""
+    global KP_FORMATO
+    binaria = tipo_columna is not None and "blob" in tipo_columna
+    if KP_FORMATO_CONFIGURADO is None:
+        KP_FORMATO = 'f32' if binaria else 'json'
+        if not binaria:
+            print(f"⚠️ usuario.kp es {tipo_columna}: los embeddings se guardan en JSON hasta correr migrar_kp.py")
+    elif KP_FORMATO_CONFIGURADO != 'json' and not binaria:
+        print(f"⚠️ KP_FORMATO={KP_FORMATO_CONFIGURADO} pero usuario.kp es {tipo_columna}: "
+              "correr migrar_kp.py antes de registrar usuarios")
+
+def asegurar_tablas():
+    """Crea usuario_foto y galeria_version si no existen, elige el formato de kp y verifica que
+    usuario.foto ya admita NULL (EsquemaDesactualizado si no)"""
+    with db.conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SQL_CREAR_TABLA_FOTOS)
+        cursor.execute(SQL_CREAR_TABLA_VERSION)
+        cursor.execute(SQL_INICIAR_VERSION)
+        conn.commit()
+        elegir_formato_kp(db.tipo_columna(cursor, "usuario", "kp"))
+        obligatoria = db.columna_obligatoria(cursor, "usuario", "foto")
+        cursor.close()
+    verificar_columna_foto(obligatoria)
+
+# Orden de los bloqueos: estado_compartido.bloqueo() -> lock_modelo -> lock_galeria. Nunca se toma
+# bloqueo() con una conexión de db en la mano (el que lo tiene puede necesitar una conexión).
+lock_galeria = threading.Lock()
+
+# Versión de la base que alcanza la galería de este worker: la de su instantánea más los deltas
+# aplicados (galeria.version es solo la instantánea). Se modifica con lock_galeria tomado.
+galeria_db = -1
+# Deltas acumulados sobre la instantánea antes de escribirla completa (en vigilar_estado)
+GALERIA_COMPACTAR = int(os.environ.get('GALERIA_COMPACTAR', 64))
+
+def abrir_galeria(puntero: dict):
+    """Pasa a usar la instantánea publicada, mapeada en memoria y compartida con los demás workers,
+    con los cambios publicados después en la matriz de cambios de la galería (la base no se copia)"""
+    global galeria_db
+    version = puntero["galeria"]
+    galeria.cargar_instantanea(*estado_compartido.abrir_galeria(version), version=version)
+    galeria_db = puntero["galeria_base_db"]
+    aplicar_cambios_publicados(puntero)
+
+def aplicar_cambios_publicados(puntero: dict):
+    """Aplica los deltas de la base entre galeria_db y la versión publicada (FileNotFoundError si
+    ya se compactaron: entonces hay que abrir la instantánea nueva)"""
+    global galeria_db
+    for version_db in range(galeria_db + 1, puntero["galeria_db"] + 1):
+        galeria.aplicar_cambios(estado_compartido.leer_cambio(version_db))
+        galeria_db = version_db
+
+def publicar_galeria(version_db: int):
+    """Guarda la galería de este worker como instantánea vigente (con bloqueo() tomado)"""
+    puntero = estado_compartido.puntero()
+    version = estado_compartido.guardar_galeria(*galeria.exportar())
+    abrir_galeria(estado_compartido.actualizar(galeria=version, galeria_db=version_db, galeria_base_db=version_db,
+                                               galeria_modelo=max(modelo_version, puntero["galeria_modelo"])))
+
+def galeria_desactualizada(puntero: dict) -> bool:
+    if puntero["galeria"] == 0 or (puntero["galeria"], puntero["galeria_db"]) == (galeria.version, galeria_db):
+        return False
+    # Embeddings de un modelo que este worker todavía no cargó: se abren junto con él
+    return reconocimiento is None or puntero["galeria_modelo"] <= modelo_version
+
+def sincronizar_galeria():
+    """Pasa a la última galería publicada por cualquier worker; sin cambios cuesta un stat"""
+    if not galeria_desactualizada(estado_compartido.puntero()):
+        return
+    with lock_galeria:
+        puntero = estado_compartido.puntero()  # otro hilo pudo publicar mientras se esperaba el lock
+        if galeria_desactualizada(puntero):
+            try:
+                if puntero["galeria"] == galeria.version and galeria_db >= puntero["galeria_base_db"]:
+                    aplicar_cambios_publicados(puntero)  # misma instantánea: solo los deltas nuevos
+                else:
+                    abrir_galeria(puntero)
+            except FileNotFoundError:
+                pass  # ya reemplazada por otra más nueva; la próxima revisión la toma
+
+def asegurar_galeria():
+    """Carga la galería si todavía no está en memoria y la mantiene al día con la publicada.
+
+    Al iniciar se reutiliza la galería publicada si corresponde a la versión actual de la
+    base; si no (cambios hechos con la API detenida, o una publicación interrumpida), se
+    reconstruye desde la base y se publica.
+    """
+    if galeria.cargada:
+        sincronizar_galeria()
+        return
+    with estado_compartido.bloqueo():
+        if galeria.cargada:
+            return
+        puntero = estado_compartido.puntero()
+        with db.conexion() as conn:
+            cursor = conn.cursor()
+            version_db = leer_version(cursor)
+            cursor.close()
+        if puntero["galeria"] and puntero["galeria_db"] == version_db:
+            try:
+                with lock_galeria:
+                    abrir_galeria(puntero)
+                print(f"✅ Galería v{puntero['galeria']} abierta desde {estado_compartido.directorio} "
+                      f"con {len(galeria)} usuarios")
+                return
+            except FileNotFoundError:
+                pass
+        with lock_galeria:
+            publicar_galeria(cargar_galeria())
+
+def publicar_cambio_galeria(version_db: int, cambios: Optional[Sequence[Tuple[int, Optional[np.ndarray]]]]):
+    """Aplica a la galería un cambio ya confirmado en la base y lo publica para los demás workers.
+
+    ``version_db`` es la versión de galeria_version de esa transacción y ``cambios`` los usuarios
+    (id, filas de la galería) o bajas (id, None) que confirmó; None reconstruye desde la base. El
+    cambio se publica como un delta (O(usuarios cambiados)); la instantánea completa la escribe
+    compactar_galeria en segundo plano. Si la galería publicada no llega a la versión anterior (otro
+    worker confirmó un cambio y todavía no lo publicó), se reconstruye desde la base.
+    """
+    global galeria_db
+    with estado_compartido.bloqueo():
+        asegurar_galeria()
+        puntero = estado_compartido.puntero()
+        if puntero["galeria_db"] >= version_db:
+            return  # ya incluido: otro worker reconstruyó la galería desde la base
+        with lock_galeria:
+            if (cambios is not None and puntero["galeria_db"] == version_db - 1
+                    and (galeria.version, galeria_db) == (puntero["galeria"], puntero["galeria_db"])):
+                galeria.aplicar_cambios(cambios)
+                galeria_db = version_db
+                try:
+                    estado_compartido.guardar_cambio(version_db, cambios)
+                    estado_compartido.actualizar(galeria_db=version_db)
+                except OSError as e:
+                    # El cambio ya está en la base y en este worker; el próximo cambio (o el
+                    # próximo arranque) ve la versión atrasada y reconstruye desde la base
+                    print(f"⚠️ No se pudo publicar la galería en {estado_compartido.directorio}: {e}")
+            else:
+                publicar_galeria(cargar_galeria())
+
+def compactar_galeria():
+    """Escribe la instantánea completa cuando hay GALERIA_COMPACTAR deltas sobre la vigente.
+
+    La escritura (O(N)) se hace sin bloqueo(): la instantánea corresponde a galeria_db y los deltas
+    posteriores siguen valiendo sobre ella. Con bloqueo() solo se renombra y se publica.
+    """
+    puntero = estado_compartido.puntero()
+    if puntero["galeria"] == 0 or puntero["galeria_db"] - puntero["galeria_base_db"] < GALERIA_COMPACTAR:
+        return
+    with estado_compartido.bloqueo("compactacion"):
+        with lock_galeria:
+            if galeria.version != puntero["galeria"] or galeria_db <= puntero["galeria_base_db"]:
+                return  # este worker no está al día; lo compacta otro o la próxima revisión
+            instantanea, base_db = galeria.exportar(), galeria_db
+        temporal = estado_compartido.escribir_galeria(*instantanea)
+        with estado_compartido.bloqueo():
+            actual = estado_compartido.puntero()
+            if actual["galeria"] != puntero["galeria"] or actual["galeria_db"] < base_db:
+                shutil.rmtree(temporal, ignore_errors=True)  # se publicó otra instantánea mientras tanto
+                return
+            version = estado_compartido.reservar_galeria(temporal)
+            estado_compartido.actualizar(galeria=version, galeria_base_db=base_db)
+    print(f"✅ Galería v{version} compactada ({base_db - puntero['galeria_base_db']} cambios)")
+    sincronizar_galeria()
 
 # === FUNCIONES DE PREPROCESAMIENTO MEJORADO ===
+# Detector cargado una sola vez por proceso: DETECTOR_ROSTROS=haar (por defecto) | yunet
+detector_rostros = crear_detector(
+    os.environ.get('DETECTOR_ROSTROS', 'haar'),
+    ruta_yunet=os.environ.get('DETECTOR_YUNET_MODELO', 'modelos/face_detection_yunet_2023mar.onnx'),
+)
+# La detección corre sobre una copia con el lado mayor reducido a este tamaño (0 = sin reducir)
+DETECTOR_MAX_LADO = int(os.environ.get('DETECTOR_MAX_LADO', 640))
+
 def detectar_y_recortar_rostro(imagen: Image.Image) -> Image.Image:
     """Detecta y recorta el rostro principal de la imagen"""
     try:
-        # Convertir a numpy array
-        img_array = np.array(imagen)
-        
-        # Convertir a escala de grises para detección
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        
-        # Cargar clasificador Haar para rostros (usar ruta alternativa)
-        cascade_path = 'haarcascade_frontalface_default.xml'
-        if not os.path.exists(cascade_path):
-            # Si no existe, usar la imagen original
+        if detector_rostros is None:
+            # Sin detector disponible, usar la imagen original
             return imagen
         
-        face_cascade = cv2.CascadeClassifier(cascade_path)
+        # Vista numpy de la imagen (sin copia extra) para el detector
+        img_array = np.asarray(imagen)
         
-        # Detectar rostros
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        # Detectar rostros sobre una copia reducida (cajas devueltas a resolución completa)
+        with etapa("deteccion"):
+            faces = detectar_rostros(detector_rostros, img_array, DETECTOR_MAX_LADO)
         
         if len(faces) > 0:
-            # Tomar el rostro más grande
-            x, y, w, h = max(faces, key=lambda x: x[2] * x[3])
-            
-            # Agregar margen del 20%
-            margin = int(min(w, h) * 0.2)
-            x = max(0, x - margin)
-            y = max(0, y - margin)
-            w = min(img_array.shape[1] - x, w + 2 * margin)
-            h = min(img_array.shape[0] - y, h + 2 * margin)
-            
-            # Recortar y convertir de vuelta a PIL
-            rostro_recortado = img_array[y:y+h, x:x+w]
-            return Image.fromarray(rostro_recortado)
+            # Tomar el rostro más grande y recortarlo directamente de la imagen PIL
+            x, y, w, h = caja_con_margen(max(faces, key=lambda x: x[2] * x[3]), *imagen.size)
+            return imagen.crop((x, y, x + w, y + h))
         
         return imagen  # Si no detecta rostro, devolver imagen original
     except Exception:
         return imagen
 
-def aplicar_aumentacion(imagen: Image.Image) -> List[Image.Image]:
-    """Aplica técnicas de data augmentation para generar múltiples variaciones"""
-    variaciones = [imagen]
+def caja_con_margen(caja, ancho: int, alto: int):
+    """La caja (x, y, w, h) con un margen del 20%, dentro de una imagen de ancho x alto"""
+    x, y, w, h = (int(v) for v in caja)
+    x, y = max(0, x), max(0, y)
+    
+    # Agregar margen del 20%
+    margin = int(min(w, h) * 0.2)
+    x = max(0, x - margin)
+    y = max(0, y - margin)
+    return x, y, min(ancho - x, w + 2 * margin), min(alto - y, h + 2 * margin)
+
+def recortar_rostro(img_array: np.ndarray, caja) -> Image.Image:
+    """Recorta la caja (x, y, w, h) con un margen del 20% y la devuelve como PIL"""
+    x, y, w, h = caja_con_margen(caja, img_array.shape[1], img_array.shape[0])
+    
+    # Recortar y convertir de vuelta a PIL
+    return Image.fromarray(img_array[y:y+h, x:x+w])
+
+# === TEST-TIME AUGMENTATION ===
+# Variaciones y presupuestos en aumentacion.py (compartidos con entrenar_modelo.py)
+
+def aplicar_aumentacion(imagen: Image.Image, nombres: Sequence[str] = VARIACIONES) -> List[Image.Image]:
+    """Aplica técnicas de data augmentation para generar las variaciones pedidas"""
+    generadores = {"original": lambda: imagen}
     
     # 1. Rotación ligera
     for angulo in [-5, 5, -10, 10]:
-        variaciones.append(imagen.rotate(angulo, expand=False))
+        generadores[f"rotacion{angulo}"] = lambda a=angulo: imagen.rotate(a, expand=False)
     
     # 2. Cambios de brillo
     for factor in [0.8, 1.2]:
-        enhancer = ImageEnhance.Brightness(imagen)
-        variaciones.append(enhancer.enhance(factor))
+        generadores[f"brillo{factor}"] = lambda f=factor: ImageEnhance.Brightness(imagen).enhance(f)
     
     # 3. Cambios de contraste
     for factor in [0.9, 1.1]:
-        enhancer = ImageEnhance.Contrast(imagen)
-        variaciones.append(enhancer.enhance(factor))
+        generadores[f"contraste{factor}"] = lambda f=factor: ImageEnhance.Contrast(imagen).enhance(f)
     
     # 4. Suavizado ligero
-    variaciones.append(imagen.filter(ImageFilter.GaussianBlur(radius=0.5)))
+    generadores["suavizado"] = lambda: imagen.filter(ImageFilter.GaussianBlur(radius=0.5))
     
     # 5. Nitidez
-    variaciones.append(imagen.filter(ImageFilter.UnsharpMask(radius=1, percent=150)))
+    generadores["nitidez"] = lambda: imagen.filter(ImageFilter.UnsharpMask(radius=1, percent=150))
     
-    return variaciones
-
-def normalizar_embedding(embedding: torch.Tensor) -> torch.Tensor:
-    """Normaliza el embedding para mejorar la comparación"""
-    # Normalización L2
-    norm = torch.norm(embedding, p=2, dim=1, keepdim=True)
-    return embedding / (norm + 1e-8)
-
-# Modelo y extractor
-class CNNClasificador(torch.nn.Module):
-    def __init__(self, num_classes):
-        super().__init__()
-        self.features = torch.nn.Sequential(
-            torch.nn.Conv2d(3, 16, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
-            torch.nn.Conv2d(16, 32, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
-            torch.nn.Conv2d(32, 64, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2)
-        )
-        self.flatten = torch.nn.Flatten()
-        self.fc1 = torch.nn.Linear(64 * 12 * 12, 128)
-        self.relu = torch.nn.ReLU()
-        self.output = torch.nn.Linear(128, len(clases))
-
-    def forward(self, x):
-        x = self.features(x)
-        x = self.flatten(x)
-        x = self.fc1(x)
-        x = self.relu(x)
-        return self.output(x)
-
-class ExtractorEmbeddings(torch.nn.Module):
-    def __init__(self, modelo_entrenado):
-        super().__init__()
-        self.features = modelo_entrenado.features
-        self.flatten = modelo_entrenado.flatten
-        self.fc1 = modelo_entrenado.fc1
-        self.relu = modelo_entrenado.relu
-
-    def forward(self, x):
-        x = self.features(x)
-        x = self.flatten(x)
-        x = self.fc1(x)
-        x = self.relu(x)
-        return x
-
-# === Cargar modelo entrenado y clases ===
-try:
-    with open("clases.pkl", "rb") as f:
-        clases = pickle.load(f)
-
-    if len(clases) == 0:
-        print("⚠️ No hay clases disponibles. El modelo está vacío.")
-        clases = []
-        model = CNNClasificador(num_classes=0)
-        model.eval()
-        extractor = ExtractorEmbeddings(model)
-        extractor.eval()
-    else:
-        model = CNNClasificador(num_classes=len(clases))
-        model.load_state_dict(torch.load("cnn_model.pth", map_location=torch.device("cpu")))
-        model.eval()
-        extractor = ExtractorEmbeddings(model)
-        extractor.eval()
-        print(f"✅ Modelo cargado con {len(clases)} clases: {clases}")
-        
-except FileNotFoundError:
-    print("⚠️ Archivos de modelo no encontrados. Creando modelo vacío.")
-    clases = []
-    model = CNNClasificador(num_classes=0)
-    model.eval()
-    extractor = ExtractorEmbeddings(model)
-    extractor.eval()
-except Exception as e:
-    print(f"❌ Error al cargar modelo: {e}")
-    clases = []
-    model = CNNClasificador(num_classes=0)
-    model.eval()
-    extractor = ExtractorEmbeddings(model)
-    extractor.eval()
-
-transform = transforms.Compose([
-    transforms.Resize((100, 100)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-])
+    return [generadores[nombre]() for nombre in nombres]
+
+# === MODELO (CARGA DIFERIDA) ===
+# PyTorch, torchvision y el modelo (reconocimiento.py) no se importan con main.py: al iniciar, un
+# hilo de fondo carga la galería y el modelo y corre una pasada de prueba (PRECALENTAR=1, por
+# defecto); con PRECALENTAR=0 se cargan en la primera solicitud que los necesita. Las rutas que
+# solo consultan la base responden desde el primer momento. GET /listo informa el estado de la carga.
+PRECALENTAR = os.environ.get('PRECALENTAR', '1') == '1'
+reconocimiento = None  # módulo reconocimiento.py, una vez importado y con el modelo cargado
+clases: List[str] = []
+model = None
+extractor = None
+motor_informe = None
+lock_carga = threading.Lock()
+carga = {"modelo_s": None, "galeria_s": None, "error_modelo": None, "error_galeria": None}
+
+def asegurar_modelo():
+    """Importa PyTorch, carga el modelo y hace una pasada de prueba la primera vez; devuelve el módulo"""
+    global reconocimiento, clases, model, extractor, motor_informe, modelo_version
+    if reconocimiento is not None:
+        return reconocimiento
+    with lock_carga, etapa("carga_modelo"):  # aparece en los tiempos de la solicitud que la espera
+        if reconocimiento is None:
+            inicio = time.perf_counter()
+            import reconocimiento as modulo
+            configurar_hilos_torch(CPU_HILOS, TORCH_HILOS)
+            # La última versión publicada por cualquier worker (la 1 es la de la carpeta de trabajo)
+            modelo_version = estado_compartido.puntero()["modelo"]
+            try:
+                clases, model, extractor, motor_informe = modulo.cargar_modelo(
+                    detectar_y_recortar_rostro, directorio_modelo(modelo_version))
+                if len(clases) == 0:
+                    print("⚠️ No hay clases disponibles. El modelo está vacío.")
+                else:
+                    print(f"✅ Modelo cargado con {len(clases)} clases: {clases}")
+            except FileNotFoundError:
+                print("⚠️ Archivos de modelo no encontrados. Creando modelo vacío.")
+                clases, model, extractor, motor_informe = modulo.modelo_vacio()
+            except Exception as e:
+                print(f"❌ Error al cargar modelo: {e}")
+                clases, model, extractor, motor_informe = modulo.modelo_vacio()
+            modulo.pasada_de_prueba(extractor)
+            carga["modelo_s"] = round(time.perf_counter() - inicio, 3)
+            # Se publica al final: las solicitudes que llegan mientras tanto esperan el lock
+            reconocimiento = modulo
+    return reconocimiento
+
+def calentar():
+    """Carga la galería y, con PRECALENTAR=1, el modelo, en segundo plano al iniciar el proceso"""
+    try:
+        inicio = time.perf_counter()
+        asegurar_galeria()
+        carga["galeria_s"] = round(time.perf_counter() - inicio, 3)
+    except Exception as e:
+        carga["error_galeria"] = str(e)
+        print(f"⚠️ No se pudo cargar la galería al iniciar: {e}")
+        print("💡 Se intentará cargar en la primera comparación")
+    if PRECALENTAR:
+        try:
+            asegurar_modelo()
+        except Exception as e:
+            carga["error_modelo"] = str(e)
+            print(f"❌ Error al cargar el modelo: {e}")
+
+def vigilar_estado():
+    """Carga el modelo o la galería que publicó otro worker (revisa estado.json cada ESTADO_INTERVALO_S)
+    y publica las métricas de este worker para el /metrics de los demás"""
+    while True:
+        time.sleep(ESTADO_INTERVALO_S)
+        try:
+            sincronizar_modelo()
+            if galeria.cargada:
+                sincronizar_galeria()
+                compactar_galeria()
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el estado publicado: {e}")
+        try:
+            metricas.publicar(DIRECTORIO_METRICAS)
+        except OSError:
+            pass  # /metrics de los demás workers sigue mostrando los últimos valores publicados
+
+@app.on_event("startup")
+def iniciar():
+    try:
+        asegurar_tablas()
+    except EsquemaDesactualizado:
+        raise  # no iniciar: cada registro fallaría
+    except Exception as e:
+        print(f"⚠️ No se pudieron crear las tablas usuario_foto y galeria_version al iniciar: {e}")
+    threading.Thread(target=calentar, name="precalentamiento", daemon=True).start()
+    threading.Thread(target=vigilar_estado, name="estado_compartido", daemon=True).start()
+
+# Versión del modelo en uso: la publicada en estado.json al cargarlo; aumenta con cada reentrenamiento
+modelo_version = 1
+lock_modelo = threading.Lock()
+
+def directorio_modelo(version: int) -> str:
+    ruta = estado_compartido.ruta_modelo(version)
+    return str(ruta) if ruta else "."
+
+def recargar_modelo(modo: str = "incremental") -> int:
+    """Carga el modelo recién entrenado, lo publica para todos los workers y devuelve la nueva versión.
+
+    Los dos modos de reentrenamiento cambian el extractor, así que se recalculan los embeddings
+    de todos los usuarios con el nuevo y se publican junto con el modelo, para que la galería
+    sea coherente con él.
+    """
+    global clases, model, extractor, motor_informe, modelo_version
+    nuevas_clases, nuevo_modelo, nuevo_extractor, nuevo_informe = asegurar_modelo().cargar_modelo(
+        detectar_y_recortar_rostro)
+    if len(nuevas_clases) == 0:
+        raise RuntimeError("el modelo reentrenado está vacío; se mantiene el modelo actual")
+    escritos = reembeber_usuarios(nuevo_extractor)
+    with estado_compartido.bloqueo():
+        version = estado_compartido.guardar_modelo("cnn_model.pth", "clases.pkl")
+        with lock_modelo, lock_galeria:
+            clases, model, extractor, motor_informe = nuevas_clases, nuevo_modelo, nuevo_extractor, nuevo_informe
+            modelo_version = version
+            # Registros y PUT confirmados con el extractor anterior desde la última pasada; de
+            # aquí en adelante este worker ya registra con el nuevo
+            reembeber_usuarios(nuevo_extractor, escritos)
+            version_db = cargar_galeria()
+            galeria_nueva = estado_compartido.guardar_galeria(*galeria.exportar())
+            abrir_galeria(estado_compartido.actualizar(modelo=version, galeria=galeria_nueva,
+                                                       galeria_db=version_db, galeria_base_db=version_db,
+                                                       galeria_modelo=version))
+    print(f"✅ Modelo recargado con {len(clases)} clases (v{version}, reentrenamiento {modo})")
+    return version
+
+def sincronizar_modelo():
+    """Carga el modelo publicado por otro worker si es más nuevo que el de este proceso"""
+    global clases, model, extractor, motor_informe, modelo_version
+    version = estado_compartido.puntero()["modelo"]
+    if reconocimiento is None or version <= modelo_version:
+        return  # sin modelo todavía, asegurar_modelo() cargará directamente la última versión
+    nuevos = reconocimiento.cargar_modelo(detectar_y_recortar_rostro, directorio_modelo(version))
+    with lock_modelo:
+        clases, model, extractor, motor_informe = nuevos
+        modelo_version = version
+        sincronizar_galeria()  # la galería publicada con este modelo, si la hay
+    print(f"🔄 Modelo v{version} publicado por otro worker cargado ({len(clases)} clases)")
+
+# Variaciones como operaciones de tensor sobre el rostro ya redimensionado (por defecto).
+# AUMENTACION_TENSORIAL=0 vuelve a las variaciones PIL a resolución completa: ~10x más lento y
+# con embeddings prácticamente iguales (ver benchmarks/bench_extraccion.py)
+AUMENTACION_TENSORIAL = os.environ.get('AUMENTACION_TENSORIAL', '1') == '1'
 
 # === FUNCIÓN MEJORADA PARA EXTRAER EMBEDDINGS ===
-def extraer_embeddings_robustos(imagen: Image.Image) -> List[torch.Tensor]:
-    """Extrae múltiples embeddings de una imagen usando técnicas de augmentation"""
-    embeddings = []
-    
+def preparar_variaciones(imagen: Image.Image, nombres: Sequence[str] = VARIACIONES):
+    """Detecta el rostro y devuelve sus variaciones apiladas y normalizadas en un lote"""
     # 1. Preprocesamiento: detectar y recortar rostro
-    rostro_recortado = detectar_y_recortar_rostro(imagen)
-    
-    # 2. Aplicar augmentation
-    variaciones = aplicar_aumentacion(rostro_recortado)
-    
-    # 3. Extraer embeddings de cada variación
-    for variacion in variaciones:
+    return variaciones_de_rostro(detectar_y_recortar_rostro(imagen), nombres)
+
+def variaciones_de_rostro(rostro_recortado: Image.Image, nombres: Sequence[str] = VARIACIONES):
+    modulo = asegurar_modelo()
+    # 2. Aplicar augmentation y apilar las variaciones en un solo lote
+    with etapa("aumentacion"):
+        if AUMENTACION_TENSORIAL:
+            return modulo.lote_tensorial(rostro_recortado, nombres)
+        return modulo.lote_de_imagenes(aplicar_aumentacion(rostro_recortado, nombres))
+
+def inferir_embeddings(lote, modelo_extractor=None):
+    """Embeddings L2-normalizados de un lote en una sola pasada del extractor"""
+    modulo = asegurar_modelo()
+    # Referencia local: un reentrenamiento puede publicar otro extractor mientras tanto
+    return modulo.inferir_embeddings(lote, modelo_extractor or extractor)
+
+def inferir_lotes(lotes) -> List[np.ndarray]:
+    """Embeddings de varios lotes en una sola pasada, separados por lote"""
+    modulo = asegurar_modelo()
+    return modulo.inferir_lotes(lotes, extractor)
+
+def extraer_embeddings_robustos(imagen: Image.Image, modelo_extractor=None) -> List:
+    """Extrae múltiples embeddings de una imagen usando técnicas de augmentation"""
+    try:
+        return list(inferir_embeddings(preparar_variaciones(imagen), modelo_extractor))
+    except Exception:
+        return []
+
+# Pool de CPU para decodificar, detectar, aumentar e inferir fuera del event loop.
+# CPU_HILOS: hilos del pool; TORCH_HILOS: hilos de PyTorch por pasada (0 = núcleos / CPU_HILOS);
+# CPU_MAX_PENDIENTES: solicitudes admitidas a la vez antes de responder 503 (medir con
+# benchmarks/bench_ejecucion.py)
+CPU_HILOS = int(os.environ.get('CPU_HILOS', 2))
+TORCH_HILOS = int(os.environ.get('TORCH_HILOS', 0))  # se aplica al cargar el modelo
+ejecutor_cpu = EjecutorCPU(hilos=CPU_HILOS, max_pendientes=int(os.environ.get('CPU_MAX_PENDIENTES', 4 * CPU_HILOS)))
+
+# Con MICROLOTE_VENTANA_MS > 0 además se agrupan en una sola pasada las variaciones de solicitudes
+# concurrentes (medir antes de activarlo con benchmarks/bench_microlotes.py: en CPU la pasada
+# escala casi lineal con el tamaño del lote)
+agrupador = AgrupadorInferencia(
+    inferir_embeddings,
+    ventana_ms=float(os.environ.get('MICROLOTE_VENTANA_MS', 0)),
+    max_lote=int(os.environ.get('MICROLOTE_MAX', 128)),
+    executor=ejecutor_cpu.executor,
+)
+
+# Variaciones por uso: completa (11) | media (5) | minima (solo el original). TTA_IDENTIFICACION
+# admite además "adaptativa": primero el rostro original y el resto de las variaciones solo si el
+# mejor puntaje cae en UMBRAL_IDENTIFICACION ± TTA_BANDA (medir con benchmarks/bench_tta.py). Con
+# este modelo los puntajes quedan casi siempre por encima de 0.95, lejos del umbral: la adaptativa
+# solo alcanza la precisión de "media" con una banda que calcula siempre las 11 variaciones
+TTA_REGISTRO = os.environ.get('TTA_REGISTRO', 'completa')
+TTA_IDENTIFICACION = os.environ.get('TTA_IDENTIFICACION', 'media')
+TTA_BANDA = float(os.environ.get('TTA_BANDA', 0.05))
+UMBRAL_IDENTIFICACION = 0.70
+# Registro: un rostro con puntaje mayor contra algún usuario es un duplicado (más estricto que la
+# identificación); DUPLICADOS_K usuarios más parecidos se informan en la respuesta
+UMBRAL_DUPLICADO = 0.75
+DUPLICADOS_K = int(os.environ.get('DUPLICADOS_K', 3))
+if TTA_REGISTRO not in PRESUPUESTOS_TTA or TTA_IDENTIFICACION not in (*PRESUPUESTOS_TTA, "adaptativa"):
+    raise ValueError(f"Presupuesto TTA inválido: TTA_REGISTRO={TTA_REGISTRO}, TTA_IDENTIFICACION={TTA_IDENTIFICACION}")
+
+def rostro_desde_bytes(image_bytes: bytes) -> Image.Image:
+    with etapa("decodificacion"):
+        imagen = decodificar_imagen(image_bytes, IMAGEN_MAX_LADO, IMAGEN_MAX_PIXELES)
+    return detectar_y_recortar_rostro(imagen)
+
+def preparar_variaciones_desde_bytes(image_bytes: bytes, nombres: Optional[Sequence[str]] = None):
+    return variaciones_de_rostro(rostro_desde_bytes(image_bytes), nombres or PRESUPUESTOS_TTA[TTA_REGISTRO])
+
+async def extraer_embeddings_robustos_async(image_bytes: bytes,
+                                            nombres: Optional[Sequence[str]] = None) -> Optional[np.ndarray]:
+    """Como extraer_embeddings_robustos, pero desde los bytes subidos y en el pool de CPU.
+
+    Devuelve los embeddings (variaciones x 128) o None si la imagen no se pudo procesar. Usa el
+    presupuesto TTA_REGISTRO salvo que se indiquen otras variaciones. Lanza Saturado si ya hay
+    demasiadas solicitudes en proceso.
+    """
+    async with ejecutor_cpu.turno():
         try:
-            img_tensor = transform(variacion)
-            img_tensor = img_tensor.unsqueeze(0)  # Agregar dimensión de batch
-            with torch.no_grad():
-                embedding = extractor(img_tensor).float()
-                embedding_norm = normalizar_embedding(embedding)
-                embeddings.append(embedding_norm.squeeze())
+            lote = await ejecutor_cpu.ejecutar(preparar_variaciones_desde_bytes, image_bytes, nombres)
+            with etapa("inferencia"):
+                return (await agrupador.inferir(lote)).numpy()
         except Exception:
-            continue
-    
-    return embeddings
+            return None
 
-# === FUNCIÓN MEJORADA PARA COMPARAR EMBEDDINGS ===
-def comparar_embeddings_robustos(embedding_actual: torch.Tensor, embeddings_almacenados: List[torch.Tensor]) -> Tuple[float, float]:
-    """Compara embeddings usando múltiples métricas"""
-    embedding_actual_norm = normalizar_embedding(embedding_actual.unsqueeze(0)).squeeze()
-    
-    similitudes_cosine = []
-    similitudes_euclidean = []
-    
-    for emb_almacenado in embeddings_almacenados:
-        # Similitud coseno
-        sim_cos = cosine_similarity(embedding_actual_norm.unsqueeze(0), emb_almacenado.unsqueeze(0)).item()
-        similitudes_cosine.append(sim_cos)
-        
-        # Distancia euclidiana normalizada
-        dist_euc = torch.norm(embedding_actual_norm - emb_almacenado).item()
-        sim_euc = 1.0 / (1.0 + dist_euc)  # Convertir distancia a similitud
-        similitudes_euclidean.append(sim_euc)
-    
-    # Combinar métricas (promedio ponderado)
-    max_cosine = max(similitudes_cosine)
-    max_euclidean = max(similitudes_euclidean)
-    
-    # Peso mayor para similitud coseno (más robusta)
-    similitud_final = 0.7 * max_cosine + 0.3 * max_euclidean
-    
-    return similitud_final, max_cosine
+async def inferir_variaciones(rostro: Image.Image, nombres: Sequence[str]) -> np.ndarray:
+    lote = await ejecutor_cpu.ejecutar(variaciones_de_rostro, rostro, nombres)
+    with etapa("inferencia"):
+        return (await agrupador.inferir(lote)).numpy()
+
+async def identificar_async(image_bytes: bytes, presupuesto: Optional[str] = None):
+    """Puntajes de la foto contra la galería con el presupuesto TTA de identificación.
+
+    Devuelve (ids_usuarios, puntajes, variaciones usadas), o None si la imagen no se pudo procesar.
+    """
+    presupuesto = presupuesto or TTA_IDENTIFICACION
+    adaptativa = presupuesto == "adaptativa"
+    nombres = PRESUPUESTOS_TTA["minima" if adaptativa else presupuesto]
+    async with ejecutor_cpu.turno():
+        try:
+            rostro = await ejecutor_cpu.ejecutar(rostro_desde_bytes, image_bytes)
+            embeddings = await inferir_variaciones(rostro, nombres)
+        except Exception:
+            return None
+        with etapa("busqueda"):
+            ids_usuarios, puntajes = galeria.puntuar(embeddings)
+
+        # Solo los casos dudosos (cerca del umbral) pagan el resto de las variaciones
+        if adaptativa and puntajes.size and abs(float(puntajes.max()) - UMBRAL_IDENTIFICACION) <= TTA_BANDA:
+            resto = [nombre for nombre in VARIACIONES if nombre not in nombres]
+            embeddings = np.concatenate([embeddings, await inferir_variaciones(rostro, resto)])
+            with etapa("busqueda"):
+                ids_usuarios, puntajes = galeria.puntuar(embeddings)
+        return ids_usuarios, puntajes, len(embeddings)
+
+def respuesta_saturado(e: Saturado) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"⏳ {e}", headers={"Retry-After": "2"})
+
+# === PROTOTIPOS POR USUARIO (opcional) ===
+# PROTOTIPOS=0 guarda todas las variaciones del registro (por defecto). Con 1 a 3 se guardan esos
+# prototipos (PROTOTIPOS_METODO=media | medoides) y su dispersión en kp: la galería y la búsqueda
+# son hasta 11 veces más chicas a cambio de algo de precisión (ver benchmarks/bench_prototipos.py).
+# Las consultas y la verificación de duplicados siguen usando las variaciones completas.
+# La dispersión guardada es cuánto se alejan las variaciones de sus prototipos: la identificación
+# baja el umbral de ese usuario en PROTOTIPOS_MARGEN veces su dispersión, hasta PROTOTIPOS_MARGEN_MAX.
+PROTOTIPOS = int(os.environ.get('PROTOTIPOS', 0))
+PROTOTIPOS_METODO = os.environ.get('PROTOTIPOS_METODO', 'media')
+PROTOTIPOS_MARGEN = float(os.environ.get('PROTOTIPOS_MARGEN', 1.0))
+PROTOTIPOS_MARGEN_MAX = float(os.environ.get('PROTOTIPOS_MARGEN_MAX', 0.05))
+if not 0 <= PROTOTIPOS <= 3 or PROTOTIPOS_METODO not in METODOS_PROTOTIPOS:
+    raise ValueError(f"Prototipos inválidos: PROTOTIPOS={PROTOTIPOS}, PROTOTIPOS_METODO={PROTOTIPOS_METODO}")
+
+def umbral_usuario(kp) -> float:
+    """Umbral de identificación de un usuario según la dispersión de sus prototipos guardada en kp"""
+    return umbral_con_dispersion(UMBRAL_IDENTIFICACION, dispersion_kp(kp), PROTOTIPOS_MARGEN, PROTOTIPOS_MARGEN_MAX)
+
+def embeddings_a_guardar(embeddings) -> Tuple[np.ndarray, bytes]:
+    """(filas para la galería, valor de la columna kp) a partir de las variaciones de un registro"""
+    if not PROTOTIPOS:
+        return embeddings, codificar_kp(embeddings, KP_FORMATO)
+    prototipos, dispersion = comprimir_embeddings(embeddings, PROTOTIPOS, PROTOTIPOS_METODO)
+    return prototipos, codificar_kp(prototipos, KP_FORMATO, dispersion)
+
+# === RECÁLCULO DE EMBEDDINGS TRAS UN REENTRENAMIENTO COMPLETO ===
+# Usuarios por transacción y pasadas máximas (cada pasada toma los registrados o modificados
+# durante la anterior)
+REEMBEBIDO_LOTE = int(os.environ.get('REEMBEBIDO_LOTE', 100))
+REEMBEBIDO_PASADAS = 5
+
+def huella_kp(kp) -> Optional[bytes]:
+    if kp is None:
+        return None
+    return hashlib.blake2b(kp.encode() if isinstance(kp, str) else bytes(kp), digest_size=16).digest()
+
+def reembeber_ids(ids: List[int], modelo_extractor, escritos: dict, fallidos: set):
+    """Recalcula el kp de ``ids`` por lotes; solo se escribe si el kp no cambió mientras tanto"""
+    variaciones = PRESUPUESTOS_TTA[TTA_REGISTRO]  # las mismas que guarda el registro
+    for inicio in range(0, len(ids), REEMBEBIDO_LOTE):
+        lote = ids[inicio:inicio + REEMBEBIDO_LOTE]
+        with db.conexion() as conn:
+            cursor = conn.cursor()
+            # usuario.foto solo tiene datos en filas aún no migradas con migrar_fotos.py
+            cursor.execute(f"""SELECT u.id, COALESCE(f.foto, u.foto), u.kp FROM usuario u
+                               LEFT JOIN usuario_foto f ON f.usuario_id = u.id
+                               WHERE u.id IN ({", ".join(["%s"] * len(lote))})""", lote)
+            filas = cursor.fetchall()
+            cursor.close()
+
+        nuevos = []
+        for usuario_id, foto, anterior in filas:
+            try:
+                if not foto:
+                    raise ValueError("sin foto")
+                imagen = decodificar_imagen(foto, IMAGEN_MAX_LADO, IMAGEN_MAX_PIXELES)
+                embeddings = inferir_embeddings(preparar_variaciones(imagen, variaciones), modelo_extractor)
+            except Exception as e:
+                fallidos.add(usuario_id)
+                print(f"⚠️ Usuario {usuario_id} omitido en el recálculo de embeddings: {e}")
+                continue
+            nuevos.append((usuario_id, anterior, embeddings_a_guardar(embeddings.numpy())[1]))
+
+        with db.conexion() as conn:
+            cursor = conn.cursor()
+            for usuario_id, anterior, kp in nuevos:
+                if anterior is None:
+                    cursor.execute("UPDATE usuario SET kp=%s WHERE id=%s AND kp IS NULL", (kp, usuario_id))
+                elif huella_kp(anterior) == huella_kp(kp):
+                    escritos[usuario_id] = huella_kp(kp)  # sin cambios: MySQL informaría 0 filas
+                    continue
+                else:
+                    cursor.execute("UPDATE usuario SET kp=%s WHERE id=%s AND kp=%s", (kp, usuario_id, anterior))
+                # 0 filas: un PUT (o una baja) llegó primero; la pasada siguiente lo vuelve a revisar
+                if cursor.rowcount:
+                    escritos[usuario_id] = huella_kp(kp)
+            incrementar_version(cursor)
+            conn.commit()
+            cursor.close()
+
+def reembeber_usuarios(modelo_extractor, escritos: Optional[dict] = None) -> dict:
+    """Recalcula el kp de los usuarios con el extractor nuevo y las variaciones de TTA_REGISTRO.
+
+    Sin ``escritos`` se procesan todos los usuarios; con ellos (id -> huella del kp que escribió
+    una llamada anterior) solo los registrados o modificados después. Cada usuario se actualiza
+    con su propia condición sobre el kp leído, así que un PUT concurrente no se pisa: ese usuario
+    y los registrados mientras tanto se procesan en la pasada siguiente. Las fotos que no se
+    pueden procesar se informan y se omiten. Devuelve las huellas escritas.
+    """
+    inicio = time.perf_counter()
+    escritos = {} if escritos is None else escritos
+    fallidos = set()
+    procesados = set()
+    for _ in range(REEMBEBIDO_PASADAS):
+        with db.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, kp FROM usuario ORDER BY id")
+            pendientes = [usuario_id for usuario_id, kp in cursor.fetchall() if usuario_id not in fallidos
+                          and (usuario_id not in escritos or escritos[usuario_id] != huella_kp(kp))]
+            cursor.close()
+        if not pendientes:
+            break
+        reembeber_ids(pendientes, modelo_extractor, escritos, fallidos)
+        procesados.update(pendientes)
+    else:
+        print(f"⚠️ Quedaron usuarios modificados sin recalcular tras {REEMBEBIDO_PASADAS} pasadas")
+    print(f"✅ Embeddings recalculados para {len(procesados - fallidos)} usuarios "
+          f"({len(fallidos)} omitidos) en {time.perf_counter() - inicio:.2f} s")
+    return escritos
+
+def registrar_reentrenamiento(trabajo):
+    if trabajo.inicio and trabajo.fin:
+        metrica_reentrenamiento.observar(trabajo.fin - trabajo.inicio, modo=trabajo.modo, estado=trabajo.estado)
+
+reentrenador = ReentrenadorModelo(
+    al_terminar=recargar_modelo,
+    al_finalizar=registrar_reentrenamiento,
+    bloqueo=lambda: estado_compartido.bloqueo("entrenamiento"),  # un entrenamiento a la vez entre workers
+    ventana_s=float(os.environ.get('REENTRENAMIENTO_VENTANA_S', 10)),
+)
+# Modo usado tras cada registro: incremental (ajuste de pocas épocas desde el modelo actual) o
+# completo (desde cero); en los dos se recalculan los kp de todos los usuarios al recargar
+REENTRENAMIENTO_MODO = os.environ.get('REENTRENAMIENTO_MODO', 'incremental')
+
+def guardar_en_dataset(nombre: str, apellido: str, image_bytes: bytes):
+    """Copia la foto en dataset_augmented/<NombreApellido>/ para el próximo entrenamiento"""
+    nombre_usuario = f"{nombre}{apellido}".replace(" ", "")
+    carpeta_usuario = Path("dataset_augmented") / nombre_usuario
+    carpeta_usuario.mkdir(parents=True, exist_ok=True)
+    img_path = carpeta_usuario / f"{nombre_usuario}.jpg"
+    with open(img_path, "wb") as f:
+        f.write(image_bytes)
+
+def consultar_coincidencias(cursor, ids_usuarios: np.ndarray, similitudes: np.ndarray) -> List[dict]:
+    """Código y nombre de los usuarios parecidos, en el orden de ``ids_usuarios``"""
+    marcadores = ", ".join(["%s"] * len(ids_usuarios))
+    cursor.execute(f"SELECT id, codigo, nombre, apellido FROM usuario WHERE id IN ({marcadores})",
+                   [int(i) for i in ids_usuarios])
+    usuarios = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+    return [{"codigo": usuarios[int(i)][0], "nombre": usuarios[int(i)][1], "apellido": usuarios[int(i)][2],
+             "similitud": round(float(similitud), 4)}
+            for i, similitud in zip(ids_usuarios, similitudes) if int(i) in usuarios]
 
 # === Ruta: Registrar nuevo usuario ===
 @app.post("/registrar_usuario")
@@ -247,119 +804,375 @@ async def registrar_usuario(
     imagen: UploadFile = File(...)
 ):
     try:
-        nombre_usuario = f"{nombre}{apellido}".replace(" ", "")
-        carpeta_usuario = Path("dataset_augmented") / nombre_usuario
-        carpeta_usuario.mkdir(parents=True, exist_ok=True)
-
-        image_bytes = await imagen.read()
-        img_path = carpeta_usuario / f"{nombre_usuario}.jpg"
-        with open(img_path, "wb") as f:
-            f.write(image_bytes)
-
-        # Solo reentrenar si hay imágenes válidas
-        try:
-            subprocess.run(["python", "entrenar_modelo.py"], check=True, capture_output=True, text=True)
-            print("✅ Modelo reentrenado exitosamente")
-        except subprocess.CalledProcessError as e:
-            print(f"⚠️ Error al reentrenar modelo: {e}")
-            print("💡 Continuando con el modelo actual...")
-
-        # Recargar modelo
-        global clases, model, extractor
-        try:
-            with open("clases.pkl", "rb") as f:
-                clases = pickle.load(f)
-                
-                if len(clases) > 0:
-                    model = CNNClasificador(num_classes=len(clases))
-                    model.load_state_dict(torch.load("cnn_model.pth", map_location="cpu"))
-                    model.eval()
-                    extractor = ExtractorEmbeddings(model)
-                    extractor.eval()
-                    print(f"✅ Modelo recargado con {len(clases)} clases")
-                else:
-                    print("⚠️ Modelo vacío, usando embeddings básicos")
-        except Exception as e:
-            print(f"⚠️ Error al recargar modelo: {e}")
-            print("💡 Continuando con embeddings básicos...")
+        tiempos_etapas = tiempos.iniciar()
+        with etapa("lectura"):
+            image_bytes = await imagen.read()
 
         # Extraer múltiples embeddings robustos
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        embeddings = extraer_embeddings_robustos(img)
+        embeddings = await extraer_embeddings_robustos_async(image_bytes)
         
-        if not embeddings:
+        if embeddings is None:
             raise HTTPException(status_code=400, detail="❌ No se pudieron extraer características faciales válidas")
         
-        # Guardar múltiples embeddings como JSON
-        embeddings_json = json.dumps([emb.tolist() for emb in embeddings])
+        # Guardar las variaciones (o sus prototipos) en el formato configurado
+        guardados, embeddings_kp = embeddings_a_guardar(embeddings)
+
+        def guardar_usuario():
+            asegurar_galeria()  # antes de tomar la conexión: puede necesitar otra para cargarla
+            with db.conexion() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM usuario WHERE codigo = %s OR correo = %s", (codigo, correo))
+                if cursor.fetchone()[0] > 0:
+                    raise HTTPException(status_code=400, detail="⚠️ Código o correo ya registrados")
+
+                # Los usuarios más parecidos de la galería (con índice ANN, solo los preseleccionados)
+                with etapa("duplicados"):
+                    ids_similares, similitudes = galeria.mas_similares(embeddings, DUPLICADOS_K, UMBRAL_DUPLICADO)
+                if ids_similares.size:
+                    raise HTTPException(status_code=400, detail={
+                        "mensaje": f"❌ Rostro ya registrado con similitud {similitudes[0]:.4f}",
+                        "coincidencias": consultar_coincidencias(cursor, ids_similares, similitudes),
+                    })
+
+                with etapa("insercion"):
+                    sql = """INSERT INTO usuario (nombre, apellido, codigo, correo, requisitoriado, kp)
+                             VALUES (%s, %s, %s, %s, %s, %s)"""
+                    cursor.execute(sql, (nombre, apellido, codigo, correo, requisitoriado, embeddings_kp))
+                    usuario_id = cursor.lastrowid
+                    guardar_foto(cursor, usuario_id, image_bytes)
+                    version_db = incrementar_version(cursor)
+                    conn.commit()
+                cursor.close()
+            with etapa("publicacion"):
+                publicar_cambio_galeria(version_db, [(usuario_id, guardados)])
+
+        await db.ejecutar(guardar_usuario)
+
+        # Guardar la imagen en el dataset y programar el reentrenamiento en segundo plano
+        guardar_en_dataset(nombre, apellido, image_bytes)
+        trabajo_id = reentrenador.solicitar(REENTRENAMIENTO_MODO)
+        informar_tiempos("registrar_usuario", tiempos_etapas)
 
-        conn = mysql.connector.connect(**config)
+        return {
+            "mensaje": "✅ Usuario registrado; reentrenamiento del modelo programado",
+            "reentrenamiento": trabajo_id,
+        }
+
+    except Saturado as e:
+        raise respuesta_saturado(e)
+    except HTTPException:
+        raise  # los 400 de arriba no deben convertirse en 500
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"❌ Error general: {e}")
+
+# === REGISTRO MASIVO ===
+# Límites del lote: personas por solicitud, tamaño de cada imagen y fotos por pasada del modelo
+LOTE_MAX_PERSONAS = int(os.environ.get('LOTE_MAX_PERSONAS', 500))
+LOTE_MAX_MB_IMAGEN = int(os.environ.get('LOTE_MAX_MB_IMAGEN', 10))
+LOTE_FOTOS_POR_PASADA = int(os.environ.get('LOTE_FOTOS_POR_PASADA', 8))
+
+def linea_ndjson(datos: dict) -> bytes:
+    return (json.dumps(datos, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def extraer_lote(items: List[ItemRegistro]):
+    """Embeddings de varias fotos: preprocesamiento en paralelo y una pasada del modelo por grupo"""
+    for inicio in range(0, len(items), LOTE_FOTOS_POR_PASADA):
+        grupo = items[inicio:inicio + LOTE_FOTOS_POR_PASADA]
+        lotes = await asyncio.gather(*(ejecutor_cpu.ejecutar(preparar_variaciones_desde_bytes, item.imagen)
+                                       for item in grupo), return_exceptions=True)
+        validos = []
+        for item, lote in zip(grupo, lotes):
+            if isinstance(lote, Exception):
+                item.fallar("error", f"❌ Imagen inválida: {lote}")
+            else:
+                validos.append((item, lote))
+        if validos:
+            with etapa("inferencia"):
+                salida = await ejecutor_cpu.ejecutar(inferir_lotes, [lote for _, lote in validos])
+            for (item, _), embeddings in zip(validos, salida):
+                item.embeddings = embeddings
+        yield grupo
+
+def verificar_duplicados_lote(items: List[ItemRegistro]):
+    """Compara todo el lote contra la galería y contra sí mismo con dos productos matriciales"""
+    asegurar_galeria()
+    consultas = np.concatenate([item.embeddings for item in items])
+    longitudes = np.array([len(item.embeddings) for item in items])
+    inicios = np.cumsum(longitudes) - longitudes
+
+    with etapa("duplicados"):
+        _, puntajes = galeria.puntuar_lote(consultas, inicios)
+        propias = normalizar_filas(consultas)
+        internos = np.maximum.reduceat(
+            similitudes_combinadas(propias, propias, np.linalg.norm(propias, axis=1), inicios), inicios, axis=0)
+    np.fill_diagonal(internos, -np.inf)
+
+    for item, fila in zip(items, puntajes):
+        if fila.size and fila.max() > UMBRAL_DUPLICADO:
+            item.fallar("duplicado", "❌ Rostro ya registrado", float(fila.max()))
+    candidatos = [i for i, item in enumerate(items) if item.estado == "pendiente"]
+    previas = duplicados_internos(internos[np.ix_(candidatos, candidatos)], UMBRAL_DUPLICADO)
+    for i, previa in zip(candidatos, previas):
+        if previa is not None:
+            original = items[candidatos[previa]]
+            items[i].fallar("duplicado", f"❌ Misma persona que {original.archivo} en el lote",
+                            float(internos[i, candidatos[previa]]))
+
+def insertar_lote(items: List[ItemRegistro]):
+    """Inserta todas las personas aceptadas en una sola transacción y las agrega a la galería"""
+    guardados = [embeddings_a_guardar(item.embeddings) for item in items]
+    with db.conexion() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM usuario WHERE codigo = %s OR correo = %s", (codigo, correo))
-        if cursor.fetchone()[0] > 0:
-            raise HTTPException(status_code=400, detail="⚠️ Código o correo ya registrados")
-
-        # Verificar duplicados con múltiples embeddings (solo si hay usuarios existentes)
-        cursor.execute("SELECT COUNT(*) FROM usuario")
-        count_result = cursor.fetchone()
-        if count_result and count_result[0] > 0:
-            cursor.execute("SELECT kp FROM usuario")
-            for row in cursor.fetchall():
-                kp_json = row[0]
-                if kp_json:  # Verificar que no sea None
-                    try:
-                        embeddings_almacenados = [torch.tensor(emb, dtype=torch.float32) for emb in json.loads(str(kp_json))]
-                        for embedding_actual in embeddings:
-                            similitud, _ = comparar_embeddings_robustos(embedding_actual, embeddings_almacenados)
-                            if similitud > 0.75:  # Threshold más estricto
-                                raise HTTPException(status_code=400, detail=f"❌ Rostro ya registrado con similitud {similitud:.4f}")
-                    except Exception as e:
-                        print(f"⚠️ Error al verificar duplicados: {e}")
-                        continue
-
-        sql = """INSERT INTO usuario (nombre, apellido, codigo, correo, requisitoriado, foto, kp)
-                 VALUES (%s, %s, %s, %s, %s, %s, %s)"""
-        cursor.execute(sql, (nombre, apellido, codigo, correo, requisitoriado, image_bytes, embeddings_json))
+        cursor.executemany(
+            """INSERT INTO usuario (nombre, apellido, codigo, correo, requisitoriado, kp)
+               VALUES (%s, %s, %s, %s, %s, %s)""",
+            [(item.nombre, item.apellido, item.codigo, item.correo, item.requisitoriado, kp)
+             for item, (_, kp) in zip(items, guardados)])
+        marcadores = ", ".join(["%s"] * len(items))
+        cursor.execute(f"SELECT id, codigo FROM usuario WHERE codigo IN ({marcadores})",
+                       [item.codigo for item in items])
+        ids = {codigo: usuario_id for usuario_id, codigo in cursor.fetchall()}
+        for item in items:
+            guardar_foto(cursor, ids[item.codigo], item.imagen)
+        version_db = incrementar_version(cursor)
         conn.commit()
         cursor.close()
-        conn.close()
-        return {"mensaje": "✅ Usuario registrado y modelo actualizado"}
+    publicar_cambio_galeria(version_db, [(ids[item.codigo], filas) for item, (filas, _) in zip(items, guardados)])
+
+async def procesar_lote(items: List[ItemRegistro]):
+    """Genera el progreso del registro masivo como líneas NDJSON"""
+    tiempos_etapas = tiempos.iniciar()
+    inicio = time.perf_counter()
+    yield linea_ndjson({"total": len(items)})
+    try:
+        async with ejecutor_cpu.turno():
+            # 1. Datos incompletos y códigos/correos repetidos (en el lote y en la base)
+            for item in items:
+                if item.imagen is None:
+                    item.fallar("error", "❌ Imagen no encontrada en el lote")
+                elif not item.nombre or not item.codigo:
+                    item.fallar("error", "❌ Faltan nombre o código")
+            marcar_repetidos(items)
+            pendientes = [item for item in items if item.estado == "pendiente"]
+            if pendientes:
+                existentes = await db.ejecutar(consultar_existentes, pendientes)
+                for item in pendientes:
+                    if item.codigo.lower() in existentes or item.correo.lower() in existentes:
+                        item.fallar("error", "⚠️ Código o correo ya registrados")
+            for item in items:
+                if item.estado != "pendiente":
+                    yield linea_ndjson(item.resultado())
 
-    except subprocess.CalledProcessError:
-        raise HTTPException(status_code=500, detail="❌ Error al reentrenar el modelo")
+            # 2. Embeddings por grupos; los errores se informan a medida que aparecen
+            async for grupo in extraer_lote([item for item in items if item.estado == "pendiente"]):
+                for item in grupo:
+                    if item.estado != "pendiente":
+                        yield linea_ndjson(item.resultado())
+
+            # 3. Duplicados contra la galería y dentro del lote, 4. una sola transacción
+            aceptados = [item for item in items if item.estado == "pendiente" and item.embeddings is not None]
+            if aceptados:
+                await db.ejecutar(verificar_duplicados_lote, aceptados)
+                for item in aceptados:
+                    if item.estado == "duplicado":
+                        yield linea_ndjson(item.resultado())
+                aceptados = [item for item in aceptados if item.estado == "pendiente"]
+            if aceptados:
+                await db.ejecutar(insertar_lote, aceptados)
+                for item in aceptados:
+                    guardar_en_dataset(item.nombre, item.apellido, item.imagen)
+                    item.estado = "registrado"
+                    yield linea_ndjson(item.resultado())
+    except Saturado as e:
+        yield linea_ndjson({"error": f"⏳ {e}"})
+        return
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"❌ Error general: {e}")
+        yield linea_ndjson({"error": f"❌ Error general: {e}"})
+        return
+
+    # 5. Un solo reentrenamiento para todo el lote
+    registrados = sum(item.estado == "registrado" for item in items)
+    trabajo_id = reentrenador.solicitar(REENTRENAMIENTO_MODO) if registrados else None
+    informar_tiempos("registrar_usuarios_lote", tiempos_etapas)
+    yield linea_ndjson({"resumen": {
+        "registrados": registrados,
+        "duplicados": sum(item.estado == "duplicado" for item in items),
+        "errores": sum(item.estado == "error" for item in items),
+        "duracion_s": round(time.perf_counter() - inicio, 2),
+    }, "reentrenamiento": trabajo_id})
+
+def consultar_existentes(items: List[ItemRegistro]) -> set:
+    """Códigos y correos del lote que ya están en la base (en minúsculas)"""
+    codigos = [item.codigo for item in items]
+    correos = [item.correo for item in items]
+    with db.conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT codigo, correo FROM usuario WHERE codigo IN ({', '.join(['%s'] * len(codigos))}) "
+            f"OR correo IN ({', '.join(['%s'] * len(correos))})", codigos + correos)
+        existentes = {valor.lower() for fila in cursor.fetchall() for valor in fila if valor}
+        cursor.close()
+    return existentes
+
+# === Ruta: Registrar varios usuarios (ZIP o manifiesto CSV + imágenes) ===
+@app.post("/registrar_usuarios_lote")
+async def registrar_usuarios_lote(
+    archivo: Optional[UploadFile] = File(None),
+    manifiesto: Optional[UploadFile] = File(None),
+    imagenes: Optional[List[UploadFile]] = File(None),
+    dominio_correo: str = Form("percepcion.local"),
+):
+    """Registra un lote y devuelve el resultado de cada persona como NDJSON a medida que avanza"""
+    max_bytes = LOTE_MAX_MB_IMAGEN * 1024 * 1024
+    try:
+        if archivo is not None:
+            items = leer_zip(await archivo.read(), dominio_correo, LOTE_MAX_PERSONAS, max_bytes)
+        elif imagenes:
+            if len(imagenes) > LOTE_MAX_PERSONAS:
+                raise LoteInvalido(f"El lote tiene más de {LOTE_MAX_PERSONAS} imágenes")
+            contenido = {imagen.filename: await imagen.read() for imagen in imagenes}
+            texto = (await manifiesto.read()).decode("utf-8-sig") if manifiesto is not None else None
+            items = construir_items(contenido, texto, dominio_correo, LOTE_MAX_PERSONAS)
+        else:
+            raise LoteInvalido("Envíe un ZIP en 'archivo' o las fotos en 'imagenes' (con 'manifiesto' opcional)")
+    except (LoteInvalido, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"❌ {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="❌ El lote no contiene imágenes")
+    if ejecutor_cpu.en_curso >= ejecutor_cpu.max_pendientes:
+        raise respuesta_saturado(Saturado("Servidor ocupado, reintente en unos segundos"))
+    return StreamingResponse(procesar_lote(items), media_type="application/x-ndjson")
+
+# === Ruta: Estado del modelo y del reentrenamiento ===
+@app.get("/estado_modelo")
+def estado_modelo():
+    return {
+        "version": modelo_version,
+        "clases": len(clases),
+        "motor": motor_informe,
+        "galeria_version": galeria.version,
+        "publicado": estado_compartido.puntero(),
+        "reentrenamiento": reentrenador.estado(),
+    }
+
+# === Ruta: Métricas para Prometheus (todos los workers) ===
+DIRECTORIO_METRICAS = estado_compartido.directorio / "metricas"
+
+@app.get("/metrics")
+def exponer_metricas():
+    return Response(metricas.texto(DIRECTORIO_METRICAS), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# === Ruta: Perfil por muestreo de este worker (PERFILADOR=1) ===
+PERFILADOR = os.environ.get('PERFILADOR', '0') == '1'
+lock_perfilador = threading.Lock()
+
+@app.get("/perfil")
+async def perfil(segundos: float = 10.0, intervalo_ms: float = 10.0):
+    """Pilas de todos los hilos muestreadas durante ``segundos``, en formato plegado (flamegraph)"""
+    if not PERFILADOR:
+        raise HTTPException(status_code=404, detail="❌ Perfilador deshabilitado; inicie con PERFILADOR=1")
+    if not (0 < segundos <= 60 and intervalo_ms >= 1):
+        raise HTTPException(status_code=400, detail="❌ Use 0 < segundos <= 60 e intervalo_ms >= 1")
+    if not lock_perfilador.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="⏳ Ya hay un perfil en curso")
+    try:
+        texto = await asyncio.to_thread(perfilar, segundos, intervalo_ms)
+    finally:
+        lock_perfilador.release()
+    return Response(texto, media_type="text/plain; charset=utf-8")
+
+# === Ruta: Disponibilidad del proceso (para el balanceador o el orquestador) ===
+@app.get("/listo")
+def listo(response: Response):
+    """200 cuando el modelo y la galería están en memoria; 503 mientras se cargan"""
+    estado = {"modelo": reconocimiento is not None, "galeria": galeria.cargada, **carga}
+    if not (estado["modelo"] and estado["galeria"]):
+        response.status_code = 503
+    return estado
+
+# === Ruta: Solicitar un reentrenamiento manual ===
+@app.post("/reentrenar")
+def reentrenar(modo: str = Form("completo")):
+    if modo not in ("incremental", "completo"):
+        raise HTTPException(status_code=400, detail="❌ Modo inválido: use 'incremental' o 'completo'")
+    return {"mensaje": f"✅ Reentrenamiento {modo} programado", "reentrenamiento": reentrenador.solicitar(modo)}
 
 # === Ruta: Listar todos los usuarios ===
 @app.get("/usuarios")
-def listar_usuarios():
-    try:
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, nombre, apellido, codigo, correo, requisitoriado FROM usuario")
-        resultado = cursor.fetchall()
-        cursor.close()
-        conn.close()
+async def listar_usuarios():
+    def consultar():
+        with db.conexion() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT id, nombre, apellido, codigo, correo, requisitoriado FROM usuario")
+            resultado = cursor.fetchall()
+            cursor.close()
         return resultado
+
+    try:
+        return await db.ejecutar(consultar)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # === Ruta: Consultar usuario por código ===
 @app.get("/usuario/{codigo}")
-def obtener_usuario(codigo: str):
+async def obtener_usuario(codigo: str):
+    def consultar():
+        with db.conexion() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT id, nombre, apellido, codigo, correo, requisitoriado FROM usuario WHERE codigo = %s", (codigo,))
+            usuario = cursor.fetchone()
+            cursor.close()
+        return usuario
+
     try:
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, nombre, apellido, codigo, correo, requisitoriado FROM usuario WHERE codigo = %s", (codigo,))
-        usuario = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        usuario = await db.ejecutar(consultar)
         if usuario:
             return usuario
         raise HTTPException(status_code=404, detail="❌ Usuario no encontrado")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# === Ruta: Foto o miniatura del usuario ===
+@app.get("/usuario/{codigo}/foto")
+def obtener_foto_usuario(codigo: str, request: Request, tam: int = 0):
+    """Foto original (tam=0) o miniatura JPEG con el lado mayor igual a ``tam``; usa el hash como ETag"""
+    if tam:
+        tam = min(max(tam, TAMANO_MINIMO), TAMANO_MAXIMO)
+    with db.conexion() as conn:
+        cursor = conn.cursor()
+        # Primero solo el hash: si el cliente o la caché ya tienen la imagen no se lee el BLOB
+        cursor.execute("""SELECT u.id, f.hash FROM usuario u
+                          LEFT JOIN usuario_foto f ON f.usuario_id = u.id WHERE u.codigo = %s""", (codigo,))
+        fila = cursor.fetchone()
+        if not fila:
+            raise HTTPException(status_code=404, detail="❌ Usuario no encontrado")
+        usuario_id, hash_contenido = fila
+        etag = f'"{hash_contenido}-{tam}"' if hash_contenido else None
+        cabeceras = {"ETag": etag, "Cache-Control": "private, max-age=86400"} if etag else {}
+        if etag and request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=cabeceras)
+        if hash_contenido and tam:
+            miniatura = miniaturas.obtener((hash_contenido, tam))
+            if miniatura is not None:
+                return Response(content=miniatura, media_type="image/jpeg", headers=cabeceras)
+
+        cursor.execute("""SELECT COALESCE(f.foto, u.foto) FROM usuario u
+                          LEFT JOIN usuario_foto f ON f.usuario_id = u.id WHERE u.id = %s""", (usuario_id,))
+        foto = cursor.fetchone()[0]
+        cursor.close()
+    if not foto:
+        raise HTTPException(status_code=404, detail="❌ El usuario no tiene foto")
+    foto = bytes(foto)
+    if not tam:
+        return Response(content=foto, media_type=Image.MIME.get(Image.open(io.BytesIO(foto)).format, "image/jpeg"),
+                        headers=cabeceras)
+    miniatura = generar_miniatura(foto, tam)
+    if hash_contenido:
+        miniaturas.guardar((hash_contenido, tam), miniatura)
+    return Response(content=miniatura, media_type="image/jpeg", headers=cabeceras)
+
 # === Ruta: Editar usuario existente ===
 @app.put("/usuario/{codigo}")
 async def actualizar_usuario(
@@ -371,62 +1184,91 @@ async def actualizar_usuario(
     imagen: UploadFile = File(None)
 ):
     try:
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor()
-
+        embeddings = None
         if imagen:
             image_bytes = await imagen.read()
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
             
             # Extraer múltiples embeddings robustos
-            embeddings = extraer_embeddings_robustos(img)
+            embeddings = await extraer_embeddings_robustos_async(image_bytes)
             
-            if not embeddings:
+            if embeddings is None:
                 raise HTTPException(status_code=400, detail="❌ No se pudieron extraer características faciales válidas")
             
-            # Guardar múltiples embeddings como JSON
-            embeddings_json = json.dumps([emb.tolist() for emb in embeddings])
+            # Guardar las variaciones (o sus prototipos) en el formato configurado
+            guardados, embeddings_kp = embeddings_a_guardar(embeddings)
 
-            sql = """UPDATE usuario SET nombre=%s, apellido=%s, correo=%s,
-                     requisitoriado=%s, foto=%s, kp=%s WHERE codigo=%s"""
-            cursor.execute(sql, (nombre, apellido, correo, requisitoriado,
-                                 image_bytes, embeddings_json, codigo))
-        else:
-            sql = """UPDATE usuario SET nombre=%s, apellido=%s, correo=%s,
-                     requisitoriado=%s WHERE codigo=%s"""
-            cursor.execute(sql, (nombre, apellido, correo, requisitoriado, codigo))
+        def guardar_cambios():
+            with db.conexion() as conn:
+                cursor = conn.cursor()
+                usuario_id = None
+                if embeddings is not None:
+                    cursor.execute("SELECT id FROM usuario WHERE codigo = %s", (codigo,))
+                    fila = cursor.fetchone()
+                    usuario_id = fila[0] if fila else None
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+                    sql = """UPDATE usuario SET nombre=%s, apellido=%s, correo=%s,
+                             requisitoriado=%s, foto=NULL, kp=%s WHERE codigo=%s"""
+                    cursor.execute(sql, (nombre, apellido, correo, requisitoriado,
+                                         embeddings_kp, codigo))
+                    if usuario_id is not None:
+                        guardar_foto(cursor, usuario_id, image_bytes)
+                        version_db = incrementar_version(cursor)
+                else:
+                    sql = """UPDATE usuario SET nombre=%s, apellido=%s, correo=%s,
+                             requisitoriado=%s WHERE codigo=%s"""
+                    cursor.execute(sql, (nombre, apellido, correo, requisitoriado, codigo))
+
+                conn.commit()
+                cursor.close()
+            if usuario_id is not None:
+                publicar_cambio_galeria(version_db, [(usuario_id, guardados)])
+
+        await db.ejecutar(guardar_cambios)
         return {"mensaje": "✅ Usuario actualizado correctamente"}
+    except Saturado as e:
+        raise respuesta_saturado(e)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # === Ruta: Eliminar usuario por código ===
 @app.delete("/usuario/{codigo}")
-def eliminar_usuario(codigo: str):
+async def eliminar_usuario(codigo: str):
+    def borrar():
+        with db.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM usuario WHERE codigo = %s", (codigo,))
+            ids = [fila[0] for fila in cursor.fetchall()]
+            cursor.execute("DELETE FROM usuario WHERE codigo = %s", (codigo,))
+            cursor.executemany("DELETE FROM usuario_foto WHERE usuario_id = %s", [(usuario_id,) for usuario_id in ids])
+            version_db = incrementar_version(cursor) if ids else None
+            conn.commit()
+            cursor.close()
+        if version_db is not None:
+            publicar_cambio_galeria(version_db, [(usuario_id, None) for usuario_id in ids])
+
     try:
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM usuario WHERE codigo = %s", (codigo,))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await db.ejecutar(borrar)
         return {"mensaje": "✅ Usuario eliminado correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # === Ruta: Reiniciar base de usuarios ===
 @app.delete("/reiniciar_usuarios")
-def reiniciar_usuarios():
+async def reiniciar_usuarios():
+    def vaciar():
+        with db.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("TRUNCATE TABLE usuario")
+            cursor.execute("TRUNCATE TABLE usuario_foto")
+            version_db = incrementar_version(cursor)
+            conn.commit()
+            cursor.close()
+        publicar_cambio_galeria(version_db, None)  # la base vacía: reconstruir no cuesta nada
+
     try:
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor()
-        cursor.execute("TRUNCATE TABLE usuario")
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await db.ejecutar(vaciar)
         return {"mensaje": "✅ Tabla 'usuario' reiniciada correctamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {e}")
@@ -435,45 +1277,43 @@ def reiniciar_usuarios():
 @app.post("/comparar_rostro")
 async def comparar_rostro(imagen: UploadFile = File(...)):
     try:
-        image_bytes = await imagen.read()
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        tiempos_etapas = tiempos.iniciar()
+        with etapa("lectura"):
+            image_bytes = await imagen.read()
         
-        # Extraer múltiples embeddings robustos
-        embeddings_actuales = extraer_embeddings_robustos(img)
+        await db.ejecutar(asegurar_galeria)
+
+        # Extraer embeddings según el presupuesto TTA y puntuarlos contra toda la galería
+        identificacion = await identificar_async(image_bytes)
         
-        if not embeddings_actuales:
+        if identificacion is None:
+            metrica_identificaciones.inc(resultado="sin_rostro")
             raise HTTPException(status_code=400, detail="❌ No se pudieron extraer características faciales válidas")
-
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM usuario")
-        usuarios = cursor.fetchall()
+        ids_usuarios, puntajes, _ = identificacion
 
         mejor_similitud = 0.0
+        umbral = UMBRAL_IDENTIFICACION
         usuario_encontrado = None
-        
-        for usuario in usuarios:
-            kp_json = usuario.get("kp")
-            if kp_json:  # Verificar que no sea None
-                try:
-                    embeddings_almacenados = [torch.tensor(emb, dtype=torch.float32) for emb in json.loads(str(kp_json))]
-                    # Comparar con cada embedding actual
-                    for embedding_actual in embeddings_actuales:
-                        similitud, sim_cosine = comparar_embeddings_robustos(embedding_actual, embeddings_almacenados)
-                        if similitud > mejor_similitud and similitud > 0.70:
-                            mejor_similitud = similitud
-                            usuario_encontrado = usuario
-                except Exception:
-                    continue
-
-        cursor.close()
-        conn.close()
+        if puntajes.size:
+            mejor = int(np.argmax(puntajes))
+            mejor_similitud = float(puntajes[mejor])
+            # Solo se consulta la base de datos por el perfil (y el umbral) del mejor candidato
+            if mejor_similitud > UMBRAL_IDENTIFICACION - PROTOTIPOS_MARGEN_MAX:
+                with etapa("perfil"):
+                    perfil = await db.ejecutar(consultar_perfil, int(ids_usuarios[mejor]))
+                if perfil:
+                    umbral = umbral_usuario(perfil["kp"])
+                    if mejor_similitud > umbral:
+                        usuario_encontrado = perfil
+        metrica_identificaciones.inc(resultado="sin_coincidencia" if usuario_encontrado is None else "coincidencia")
+        informar_tiempos("comparar_rostro", tiempos_etapas)
 
         if usuario_encontrado:
             alerta = usuario_encontrado["requisitoriado"] == 1
             return {
                 "mensaje": "✅ Usuario identificado con éxito",
                 "similitud": mejor_similitud,
+                "umbral": umbral,
                 "usuario": {
                     "nombre": usuario_encontrado["nombre"],
                     "apellido": usuario_encontrado["apellido"],
@@ -482,13 +1322,210 @@ async def comparar_rostro(imagen: UploadFile = File(...)):
                     "requisitoriado": bool(usuario_encontrado["requisitoriado"]),
                 },
                 "alerta": alerta,
-                "notificacion": "🚨 ¡ALERTA DE SEGURIDAD! Usuario requisitoriado detectado. Notificación enviada a la Policía (simulada)" if alerta else None
+                "notificacion": NOTIFICACION_ALERTA if alerta else None
             }
 
         return {
             "mensaje": "❌ No se encontró coincidencia con ningún usuario registrado",
-            "similitud_maxima": mejor_similitud
+            "similitud_maxima": mejor_similitud,
+            "umbral": umbral
         }
 
+    except Saturado as e:
+        raise respuesta_saturado(e)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"❌ Error en la comparación facial: {e}")
+
+# === IDENTIFICACIÓN EN VIDEO ===
+# VIDEO_DETECTAR_CADA: cuadros seguidos por correlación antes de volver a correr el detector;
+# VIDEO_VENTANA / VIDEO_MIN_CUADROS: cuadros promediados y mínimo de cuadros antes de decidir
+VIDEO_DETECTAR_CADA = int(os.environ.get('VIDEO_DETECTAR_CADA', 10))
+VIDEO_VENTANA = int(os.environ.get('VIDEO_VENTANA', 8))
+VIDEO_MIN_CUADROS = int(os.environ.get('VIDEO_MIN_CUADROS', 3))
+NOTIFICACION_ALERTA = "🚨 ¡ALERTA DE SEGURIDAD! Usuario requisitoriado detectado. Notificación enviada a la Policía (simulada)"
+
+def detectar_en_cuadro(rgb: np.ndarray) -> np.ndarray:
+    if detector_rostros is None:
+        # Sin detector disponible, usar el cuadro completo
+        return np.array([[0, 0, rgb.shape[1], rgb.shape[0]]])
+    with etapa("deteccion"):
+        return detectar_rostros(detector_rostros, rgb, DETECTOR_MAX_LADO)
+
+class SesionVideo:
+    """Estado de una conexión de video: seguimiento del rostro y ventana de puntajes"""
+
+    def __init__(self):
+        self.seguidor = SeguidorRostro(detectar_en_cuadro, detectar_cada=VIDEO_DETECTAR_CADA)
+        self.ventana = VentanaIdentidad(tamano=VIDEO_VENTANA, minimo=VIDEO_MIN_CUADROS,
+                                        umbral=UMBRAL_IDENTIFICACION)
+        self.cuadros = 0
+        self.detecciones = 0
+        self.sin_aumentacion = 0
+        self.descartados = 0
+        self.usuario_id: Optional[int] = None   # identidad anunciada actualmente
+        self.perfiles = {}
+        self.identificaciones: List[str] = []
+
+    def resumen(self) -> dict:
+        return {
+            "cuadros": self.cuadros,
+            "detecciones": self.detecciones,
+            "cuadros_sin_aumentacion": self.sin_aumentacion,
+            "descartados": self.descartados,
+            "identificaciones": self.identificaciones,
+        }
+
+def procesar_cuadro(sesion: SesionVideo, datos: bytes) -> dict:
+    """Sigue el rostro en un cuadro, lo puntúa contra la galería y actualiza la ventana.
+
+    Mientras el seguimiento es estable se usa una sola vista del rostro en lugar de las
+    variaciones de aumentación: la ventana de cuadros ya aporta la robustez.
+    """
+    tiempos_etapas = tiempos.iniciar()
+    sesion.cuadros += 1
+    with etapa("decodificacion"):
+        # Sin reducir: la caja que se devuelve está en las coordenadas del cuadro enviado
+        rgb = np.asarray(decodificar_imagen(datos, 0, IMAGEN_MAX_PIXELES))
+    caja, detecto = sesion.seguidor.actualizar(rgb)
+    sesion.detecciones += detecto
+    resultado = {"cuadro": sesion.cuadros, "rostro": caja is not None, "deteccion": detecto}
+
+    if caja is None:
+        # Un cuadro sin rostro cuenta como 0 para todos: la ventana se vacía si la persona se va
+        sesion.ventana.agregar(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    else:
+        rostro = recortar_rostro(rgb, caja)
+        aumentar = not sesion.seguidor.estable
+        if aumentar:
+            lote = variaciones_de_rostro(rostro)
+        else:
+            with etapa("aumentacion"):
+                lote = asegurar_modelo().lote_de_imagenes([rostro])
+            sesion.sin_aumentacion += 1
+        with etapa("inferencia"):
+            embeddings = inferir_embeddings(lote)
+        with etapa("busqueda"):
+            ids_usuarios, puntajes = galeria.puntuar(embeddings.numpy())
+        sesion.ventana.agregar(ids_usuarios, puntajes)
+        resultado.update({"caja": [int(v) for v in caja], "aumentacion": aumentar})
+
+    usuario_id, puntaje, suficiente = sesion.ventana.resultado()
+    if not suficiente:
+        resultado["estado"] = "buscando"
+    elif usuario_id is not None and puntaje > UMBRAL_IDENTIFICACION - PROTOTIPOS_MARGEN_MAX:
+        resultado["estado"] = "identificado"  # anunciar_identidad lo confirma con el umbral del usuario
+        resultado["usuario_id"] = usuario_id
+    else:
+        resultado["estado"] = "desconocido"
+    resultado["similitud"] = round(puntaje, 4)
+    resultado["tiempos_ms"] = {nombre: round(ms, 1) for nombre, ms in tiempos_etapas.items()}
+    informar_tiempos("ws_identificar", tiempos_etapas, imprimir=False)
+    return resultado
+
+def consultar_perfil(usuario_id: int):
+    with db.conexion() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT nombre, apellido, codigo, correo, requisitoriado, kp FROM usuario WHERE id = %s",
+                       (usuario_id,))
+        usuario = cursor.fetchone()
+        cursor.close()
+    return usuario
+
+async def anunciar_identidad(sesion: SesionVideo, resultado: dict):
+    """Agrega el perfil (y la alerta) la primera vez que la ventana confirma a una persona"""
+    usuario_id = resultado.pop("usuario_id", None)
+    if resultado["estado"] != "identificado":
+        if resultado["estado"] == "desconocido":
+            sesion.usuario_id = None
+        return
+    if usuario_id not in sesion.perfiles:
+        sesion.perfiles[usuario_id] = await db.ejecutar(consultar_perfil, usuario_id)
+    perfil = sesion.perfiles[usuario_id]
+    if perfil is None:
+        return
+    if resultado["similitud"] <= umbral_usuario(perfil["kp"]):
+        resultado["estado"] = "desconocido"
+        sesion.usuario_id = None
+        return
+    resultado["codigo"] = perfil["codigo"]
+    if usuario_id != sesion.usuario_id:
+        sesion.usuario_id = usuario_id
+        sesion.identificaciones.append(perfil["codigo"])
+        alerta = perfil["requisitoriado"] == 1
+        resultado.update({
+            "mensaje": "✅ Usuario identificado con éxito",
+            "usuario": {
+                "nombre": perfil["nombre"],
+                "apellido": perfil["apellido"],
+                "codigo": perfil["codigo"],
+                "correo": perfil["correo"],
+                "requisitoriado": bool(perfil["requisitoriado"]),
+            },
+            "alerta": alerta,
+            "notificacion": NOTIFICACION_ALERTA if alerta else None,
+        })
+
+# === Ruta: Identificación continua por WebSocket ===
+@app.websocket("/ws/identificar")
+async def identificar_video(websocket: WebSocket, descartar: bool = True):
+    """Recibe cuadros JPEG/PNG como mensajes binarios y responde un JSON por cuadro procesado.
+
+    Con descartar=true (cámaras en vivo) solo se procesa el cuadro más reciente y los que
+    llegan mientras tanto se descartan; con descartar=false (un archivo de video) se procesan
+    todos en orden. El mensaje de texto "fin" cierra la sesión con un resumen.
+    """
+    await websocket.accept()
+    await db.ejecutar(asegurar_galeria)
+    sesion = SesionVideo()
+    envio = asyncio.Lock()
+    ultimo: List[bytes] = []
+    hay_cuadro = asyncio.Event()
+
+    async def responder(datos: bytes):
+        async with envio:
+            try:
+                async with ejecutor_cpu.turno():
+                    resultado = await ejecutor_cpu.ejecutar(procesar_cuadro, sesion, datos)
+                await anunciar_identidad(sesion, resultado)
+            except Saturado:
+                sesion.descartados += 1
+                return
+            except Exception as e:
+                resultado = {"cuadro": sesion.cuadros, "error": f"❌ {e}"}
+            resultado["descartados"] = sesion.descartados
+            await websocket.send_json(resultado)
+
+    async def procesar_ultimo():
+        while True:
+            await hay_cuadro.wait()
+            hay_cuadro.clear()
+            if ultimo:
+                await responder(ultimo.pop())
+
+    tarea = asyncio.create_task(procesar_ultimo()) if descartar else None
+    try:
+        while True:
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                break
+            if mensaje.get("bytes"):
+                if tarea is None:
+                    await responder(mensaje["bytes"])
+                    continue
+                if ultimo:
+                    sesion.descartados += 1
+                    ultimo.clear()
+                ultimo.append(mensaje["bytes"])
+                hay_cuadro.set()
+            elif mensaje.get("text") == "fin":
+                async with envio:
+                    await websocket.send_json({"resumen": sesion.resumen()})
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if tarea is not None:
+            tarea.cancel()
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# === MÉTRICAS EN FORMATO PROMETHEUS ===
+# Contadores, histogramas y medidores en memoria, expuestos en /metrics con el formato de texto
+# de Prometheus, sin dependencias. Con varios workers cada proceso escribe sus valores en
+# <directorio>/metricas_<pid>.json (ver publicar) y /metrics suma los contadores e histogramas de
+# todos los procesos vivos; los medidores se informan por proceso, con la etiqueta worker.
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_REENTRENAMIENTO = (10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 funcion: Optional[Callable[[], float]] = None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion  # valor leído al exportar (sin etiquetas), p. ej. un contador de otra clase
+        self._valores: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas: dict) -> Tuple[str, ...]:
+        return tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+
+    def valores(self) -> Dict[Tuple[str, ...], object]:
+        if self.funcion is not None:
+            return {(): float(self.funcion())}
+        with self._lock:
+            return {clave: (list(valor[0]), valor[1]) if isinstance(valor, list) else valor
+                    for clave, valor in self._valores.items()}
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1.0, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            datos = self._valores.get(clave)
+            if datos is None:
+                datos = self._valores[clave] = [[0] * (len(self.buckets) + 1), 0.0]  # [conteos, suma]
+            datos[0][bisect_left(self.buckets, valor)] += 1  # el último cuenta solo para +Inf
+            datos[1] += valor
+
+# === REGISTRO ===
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence, **extra) -> str:
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in [*zip(nombres, valores), *extra.items()]]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class RegistroMetricas:
+    """Métricas del proceso, exportables a JSON (entre workers) y a texto de Prometheus"""
+
+    def __init__(self, prefijo: str = "percepcion"):
+        self.prefijo = prefijo
+        self._metricas: Dict[str, _Metrica] = {}
+
+    def _agregar(self, metrica: _Metrica):
+        self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), funcion=None) -> Contador:
+        return self._agregar(Contador(f"{self.prefijo}_{nombre}", ayuda, etiquetas, funcion))
+
+    def medidor(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), funcion=None) -> Medidor:
+        return self._agregar(Medidor(f"{self.prefijo}_{nombre}", ayuda, etiquetas, funcion))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                   buckets: Sequence[float] = BUCKETS_LATENCIA) -> Histograma:
+        return self._agregar(Histograma(f"{self.prefijo}_{nombre}", ayuda, etiquetas, buckets))
+
+    def exportar(self) -> dict:
+        """Valores actuales como {nombre: [[etiquetas, valor], ...]} (serializable a JSON)"""
+        exportado = {}
+        for nombre, metrica in self._metricas.items():
+            try:
+                exportado[nombre] = [[list(clave), valor] for clave, valor in metrica.valores().items()]
+            except Exception:
+                exportado[nombre] = []  # una función de medición que falla no debe tumbar /metrics
+        return exportado
+
+    def publicar(self, directorio: Path):
+        """Escribe los valores de este proceso para que /metrics de cualquier worker los sume"""
+        directorio.mkdir(parents=True, exist_ok=True)
+        ruta = directorio / f"metricas_{os.getpid()}.json"
+        temporal = ruta.with_name(f"{ruta.name}.tmp")
+        temporal.write_text(json.dumps(self.exportar()), encoding="utf-8")
+        os.replace(temporal, ruta)
+
+    def _otros_procesos(self, directorio: Optional[Path]) -> Dict[int, dict]:
+        """Últimos valores publicados por los demás workers vivos; borra los de procesos terminados"""
+        if directorio is None or os.name == "nt":  # os.kill(pid, 0) no sirve para consultar en Windows
+            return {}
+        otros = {}
+        for ruta in directorio.glob("metricas_*.json"):
+            sufijo = ruta.stem[len("metricas_"):]
+            if not sufijo.isdigit() or int(sufijo) == os.getpid():
+                continue
+            pid = int(sufijo)
+            if not _proceso_vivo(pid):
+                ruta.unlink(missing_ok=True)
+                continue
+            try:
+                otros[pid] = json.loads(ruta.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+        return otros
+
+    def texto(self, directorio: Optional[Path] = None) -> str:
+        """Formato de exposición de texto de Prometheus (version 0.0.4)"""
+        procesos = {os.getpid(): self.exportar(), **self._otros_procesos(directorio)}
+        lineas = []
+        for nombre, metrica in self._metricas.items():
+            lineas.append(f"# HELP {nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre} {metrica.tipo}")
+            if isinstance(metrica, Medidor):
+                for pid, exportado in sorted(procesos.items()):
+                    for clave, valor in exportado.get(nombre, []):
+                        lineas.append(f"{nombre}{_etiquetas(metrica.etiquetas, clave, worker=pid)} {valor}")
+                continue
+            sumados: Dict[Tuple[str, ...], object] = {}
+            for exportado in procesos.values():
+                for clave, valor in exportado.get(nombre, []):
+                    clave = tuple(clave)
+                    if isinstance(metrica, Histograma):
+                        conteos, suma = sumados.get(clave, ([0] * (len(metrica.buckets) + 1), 0.0))
+                        sumados[clave] = ([a + b for a, b in zip(conteos, valor[0])], suma + valor[1])
+                    else:
+                        sumados[clave] = sumados.get(clave, 0.0) + valor
+            for clave, valor in sorted(sumados.items()):
+                if isinstance(metrica, Histograma):
+                    conteos, suma = valor
+                    acumulado = 0
+                    for limite, conteo in zip(metrica.buckets + (float("inf"),), conteos):
+                        acumulado += conteo
+                        le = "+Inf" if limite == float("inf") else repr(float(limite))
+                        lineas.append(f"{nombre}_bucket{_etiquetas(metrica.etiquetas, clave, le=le)} {acumulado}")
+                    lineas.append(f"{nombre}_sum{_etiquetas(metrica.etiquetas, clave)} {suma}")
+                    lineas.append(f"{nombre}_count{_etiquetas(metrica.etiquetas, clave)} {acumulado}")
+                else:
+                    lineas.append(f"{nombre}{_etiquetas(metrica.etiquetas, clave)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+# === MIDDLEWARE ASGI ===
+class MiddlewareMetricas:
+    """Duración y código de respuesta de cada solicitud HTTP, por plantilla de ruta.
+
+    Se usa la plantilla (/usuario/{codigo}) y no la URL, para no crear una serie por usuario; las
+    rutas inexistentes se agrupan como "otra". La duración incluye el envío del cuerpo completo.
+    """
+
+    def __init__(self, app, duracion: Histograma, solicitudes: Contador):
+        self.app = app
+        self.duracion = duracion
+        self.solicitudes = solicitudes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        codigo = 500
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            ruta = getattr(scope.get("route"), "path", "otra")
+            self.duracion.observar(time.perf_counter() - inicio, ruta=ruta)
+            self.solicitudes.inc(ruta=ruta, codigo=codigo)
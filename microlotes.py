@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import torch
+
+# === AGRUPADOR DINÁMICO DE INFERENCIA ===
+class AgrupadorInferencia:
+    """Junta los lotes de varias solicitudes concurrentes en una sola pasada del modelo.
+
+    Cada solicitud aporta un tensor (n_i x ...). El primer lote que llega abre una ventana
+    de ``ventana_ms`` milisegundos; todo lo que llegue antes de que cierre (o hasta sumar
+    ``max_lote`` filas) se concatena y se procesa con ``funcion`` en ``executor`` (por defecto
+    un hilo propio), sin bloquear el event loop. Cada solicitud recibe solo sus filas del resultado.
+    """
+
+    def __init__(self, funcion: Callable[["torch.Tensor"], "torch.Tensor"], ventana_ms: float = 2.0,
+                 max_lote: int = 128, executor: Optional[Executor] = None):
+        self.funcion = funcion
+        self.ventana_s = ventana_ms / 1000
+        self.max_lote = max_lote
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="inferencia")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cola: Optional[asyncio.Queue] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self.lotes = 0
+        self.solicitudes = 0
+
+    async def inferir(self, lote: "torch.Tensor") -> "torch.Tensor":
+        loop = asyncio.get_running_loop()
+        if self.ventana_s <= 0:
+            self.lotes += 1
+            self.solicitudes += 1
+            return await loop.run_in_executor(self._executor, self.funcion, lote)
+        if self._loop is not loop or self._tarea is None or self._tarea.done():
+            self._loop = loop
+            self._cola = asyncio.Queue()
+            self._tarea = loop.create_task(self._bucle())
+        futuro = loop.create_future()
+        await self._cola.put((lote, futuro))
+        return await futuro
+
+    async def _bucle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pendientes = [await self._cola.get()]
+            filas = len(pendientes[0][0])
+            cierre = loop.time() + self.ventana_s
+            while filas < self.max_lote:
+                restante = cierre - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    pendiente = await asyncio.wait_for(self._cola.get(), restante)
+                except asyncio.TimeoutError:
+                    break
+                pendientes.append(pendiente)
+                filas += len(pendiente[0])
+            await self._procesar(loop, pendientes)
+
+    async def _procesar(self, loop, pendientes: List[Tuple["torch.Tensor", asyncio.Future]]):
+        import torch  # el agrupador se crea al importar main.py, antes de cargar PyTorch
+
+        lotes = [lote for lote, _ in pendientes]
+        try:
+            salida = await loop.run_in_executor(self._executor, self.funcion, torch.cat(lotes))
+        except Exception as e:
+            for _, futuro in pendientes:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        self.lotes += 1
+        self.solicitudes += len(pendientes)
+        for (_, futuro), resultado in zip(pendientes, torch.split(salida, [len(l) for l in lotes])):
+            if not futuro.done():  # la solicitud pudo cancelarse mientras tanto
+                futuro.set_result(resultado)
@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+
+import mysql.connector
+
+from fotos import SQL_CREAR_TABLA_FOTOS, hash_foto
+
+# === Configuración MySQL (la misma que usa main.py) ===
+config = {
+    'user': os.environ.get('DB_USER'),
+    'password': os.environ.get('DB_PASSWORD'),
+    'host': os.environ.get('DB_HOST'),
+    'port': os.environ.get('DB_PORT'),
+    'database': os.environ.get('DB_NAME')
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Mueve las fotos de usuario.foto a la tabla usuario_foto")
+    parser.add_argument("--lote", type=int, default=50, help="fotos por transacción")
+    parser.add_argument("--sin-alterar", action="store_true",
+                        help="no cambiar usuario.foto a columna opcional (si ya lo es)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+
+    print("🔧 Creando tabla usuario_foto...")
+    cursor.execute(SQL_CREAR_TABLA_FOTOS)
+    if not args.sin_alterar:
+        # Los registros nuevos ya no escriben usuario.foto
+        cursor.execute("ALTER TABLE usuario MODIFY foto LONGBLOB NULL")
+    conn.commit()
+
+    inicio = time.perf_counter()
+    ultimo_id, movidas, total_bytes = 0, 0, 0
+    while True:
+        cursor.execute("SELECT id, foto FROM usuario WHERE id > %s AND foto IS NOT NULL ORDER BY id LIMIT %s",
+                       (ultimo_id, args.lote))
+        filas = cursor.fetchall()
+        if not filas:
+            break
+        ultimo_id = filas[-1][0]
+
+        cursor.executemany("REPLACE INTO usuario_foto (usuario_id, hash, foto) VALUES (%s, %s, %s)",
+                           [(usuario_id, hash_foto(bytes(foto)), bytes(foto)) for usuario_id, foto in filas])
+        cursor.executemany("UPDATE usuario SET foto=NULL WHERE id=%s", [(usuario_id,) for usuario_id, _ in filas])
+        conn.commit()
+        movidas += len(filas)
+        total_bytes += sum(len(foto) for _, foto in filas)
+        print(f"🔁 Hasta id {ultimo_id}: {movidas} fotos movidas")
+
+    cursor.close()
+    conn.close()
+    print(f"✅ Migración terminada en {time.perf_counter() - inicio:.1f} s: {movidas} fotos "
+          f"({total_bytes / 1024 / 1024:.1f} MiB) fuera de la tabla usuario")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import time
+
+import mysql.connector
+
+from formato_kp import codificar_kp, decodificar_kp, es_binario
+
+# === Configuración MySQL (la misma que usa main.py) ===
+config = {
+    'user': os.environ.get('DB_USER'),
+    'password': os.environ.get('DB_PASSWORD'),
+    'host': os.environ.get('DB_HOST'),
+    'port': os.environ.get('DB_PORT'),
+    'database': os.environ.get('DB_NAME')
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte la columna usuario.kp de JSON al formato binario")
+    parser.add_argument("--formato", choices=["f32", "f16"], default="f32")
+    parser.add_argument("--lote", type=int, default=500, help="filas por transacción")
+    parser.add_argument("--sin-alterar", action="store_true",
+                        help="no cambiar el tipo de la columna kp a LONGBLOB (si ya lo es)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+
+    if not args.sin_alterar:
+        # Una columna de texto/JSON no puede guardar el formato binario
+        print("🔧 Cambiando usuario.kp a LONGBLOB...")
+        cursor.execute("ALTER TABLE usuario MODIFY kp LONGBLOB")
+        conn.commit()
+
+    inicio = time.perf_counter()
+    ultimo_id, convertidas, omitidas = 0, 0, 0
+    bytes_antes, bytes_despues = 0, 0
+    while True:
+        cursor.execute("SELECT id, kp FROM usuario WHERE id > %s ORDER BY id LIMIT %s", (ultimo_id, args.lote))
+        filas = cursor.fetchall()
+        if not filas:
+            break
+        ultimo_id = filas[-1][0]
+
+        cambios = []
+        for usuario_id, kp in filas:
+            if not kp or es_binario(kp):
+                omitidas += 1
+                continue
+            try:
+                nuevo = codificar_kp(decodificar_kp(kp), args.formato)
+            except (ValueError, TypeError) as e:
+                print(f"⚠️ kp inválido para el usuario {usuario_id}: {e}")
+                omitidas += 1
+                continue
+            bytes_antes += len(kp)
+            bytes_despues += len(nuevo)
+            cambios.append((nuevo, usuario_id))
+
+        if cambios:
+            cursor.executemany("UPDATE usuario SET kp=%s WHERE id=%s", cambios)
+            conn.commit()
+            convertidas += len(cambios)
+        print(f"🔁 Hasta id {ultimo_id}: {convertidas} convertidas, {omitidas} omitidas")
+
+    cursor.close()
+    conn.close()
+    print(f"✅ Migración terminada en {time.perf_counter() - inicio:.1f} s: {convertidas} filas convertidas")
+    if convertidas:
+        print(f"📦 {bytes_antes / 1024:.0f} KiB en JSON → {bytes_despues / 1024:.0f} KiB en {args.formato} "
+              f"({bytes_antes / bytes_despues:.1f}x menos)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import copy
+import json
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+
+from cache_tensores import hash_archivo
+
+# === MOTORES DE INFERENCIA DEL EXTRACTOR ===
+# A partir del extractor eager (float32) se arma una versión optimizada, se verifica que sus
+# embeddings coincidan con los eager (coseno mínimo >= tolerancia) y se guarda como artefacto
+# junto con los metadatos. Al iniciar se carga el artefacto si corresponde a los mismos pesos
+# y a la misma versión de PyTorch, sin volver a construirlo.
+#   eager          el módulo de PyTorch sin cambios
+#   torchscript    trazado, congelado y optimizado para inferencia
+#   int8_dinamico  fc1 cuantizada a int8 (pesos), guardado como TorchScript
+#   int8_estatico  convoluciones y fc1 cuantizadas a int8 con calibración, guardado como TorchScript
+#   onnx           exportado a ONNX y ejecutado con onnxruntime (requiere onnx y onnxruntime)
+
+MOTORES = ("eager", "torchscript", "int8_dinamico", "int8_estatico", "onnx")
+FORMA_ENTRADA = (3, 100, 100)
+
+class MotorONNX:
+    """Sesión de onnxruntime con la misma interfaz que el extractor (tensor -> tensor)"""
+
+    def __init__(self, ruta: str, hilos: Optional[int] = None):
+        import onnxruntime as ort
+
+        opciones = ort.SessionOptions()
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        self.sesion = ort.InferenceSession(ruta, opciones, providers=["CPUExecutionProvider"])
+        self.entrada = self.sesion.get_inputs()[0].name
+
+    def __call__(self, lote: torch.Tensor) -> torch.Tensor:
+        salida = self.sesion.run(None, {self.entrada: lote.detach().numpy().astype(np.float32, copy=False)})[0]
+        return torch.from_numpy(salida)
+
+    def eval(self):
+        return self
+
+def concordancia(referencia, candidato, muestras: torch.Tensor) -> float:
+    """Coseno mínimo entre los embeddings de ambos extractores sobre las mismas muestras"""
+    with torch.no_grad():
+        a = referencia(muestras).float()
+        b = candidato(muestras).float()
+    return float(torch.nn.functional.cosine_similarity(a, b, dim=1, eps=1e-8).min())
+
+def _guardar_atomico(ruta: Path, escribir):
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")  # varios workers pueden compilar a la vez
+    escribir(str(temporal))
+    os.replace(temporal, ruta)
+
+def _rutas(directorio: str, nombre: str) -> Tuple[Path, Path]:
+    extension = "onnx" if nombre == "onnx" else "pt"
+    base = Path(directorio) / f"extractor_{nombre}"
+    return base.with_suffix(f".{extension}"), base.with_suffix(".json")
+
+def _trazar(modulo: torch.nn.Module, muestras: torch.Tensor):
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(modulo, muestras[:2], check_trace=False))
+
+def _optimizar(modulo):
+    # Las optimizaciones de optimize_for_inference (capas oneDNN) no se pueden serializar:
+    # se guarda el módulo congelado y se optimiza después de cada carga
+    with torch.no_grad():
+        return torch.jit.optimize_for_inference(modulo)
+
+def construir(nombre: str, extractor: torch.nn.Module, muestras: torch.Tensor, ruta: Path):
+    """Construye el motor a partir del extractor eager y guarda su artefacto en ``ruta``"""
+    modulo = copy.deepcopy(extractor).eval()
+    if nombre == "torchscript":
+        motor = _trazar(modulo, muestras)
+        _guardar_atomico(ruta, lambda destino: torch.jit.save(motor, destino))
+        return _optimizar(motor)
+    if nombre == "int8_dinamico":
+        from torch.ao.quantization import quantize_dynamic
+
+        motor = _trazar(quantize_dynamic(modulo, {torch.nn.Linear}, dtype=torch.qint8), muestras)
+        _guardar_atomico(ruta, lambda destino: torch.jit.save(motor, destino))
+        return motor
+    if nombre == "int8_estatico":
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        preparado = prepare_fx(modulo, get_default_qconfig_mapping(torch.backends.quantized.engine),
+                               (muestras[:1],))
+        with torch.no_grad():
+            preparado(muestras)  # calibración: rangos de activación de imágenes reales
+        motor = _trazar(convert_fx(preparado), muestras)
+        _guardar_atomico(ruta, lambda destino: torch.jit.save(motor, destino))
+        return motor
+    if nombre == "onnx":
+        _guardar_atomico(ruta, lambda destino: torch.onnx.export(
+            modulo, (muestras[:1],), destino, input_names=["entrada"], output_names=["embedding"],
+            dynamic_axes={"entrada": {0: "lote"}, "embedding": {0: "lote"}}, dynamo=False))
+        return MotorONNX(str(ruta), torch.get_num_threads())
+    raise ValueError(f"Motor desconocido: {nombre} (opciones: {', '.join(MOTORES)})")
+
+def cargar(nombre: str, ruta: Path):
+    if nombre == "onnx":
+        return MotorONNX(str(ruta), torch.get_num_threads())
+    motor = torch.jit.load(str(ruta), map_location="cpu").eval()
+    return _optimizar(motor) if nombre == "torchscript" else motor
+
+def preparar_motor(nombre: str, extractor: torch.nn.Module, ruta_pesos: str, muestras_calibracion,
+                   directorio: str = "modelos", tolerancia: float = 0.99):
+    """Devuelve (motor, informe). Reutiliza el artefacto guardado si corresponde a ``ruta_pesos``.
+
+    ``muestras_calibracion`` es una función que devuelve un lote de rostros ya normalizados; solo
+    se llama si hay que construir el motor. Si el motor no se puede construir o no alcanza la
+    tolerancia se usa el extractor eager.
+    """
+    informe = {"motor": "eager", "solicitado": nombre, "artefacto": None, "concordancia": None}
+    if nombre == "eager":
+        return extractor, informe
+    try:
+        ruta, ruta_meta = _rutas(directorio, nombre)
+        firma = {"motor": nombre, "pesos_sha256": hash_archivo(ruta_pesos), "torch": torch.__version__}
+        if ruta.exists() and ruta_meta.exists():
+            meta = json.loads(ruta_meta.read_text())
+            if all(meta.get(clave) == valor for clave, valor in firma.items()):
+                informe.update(motor=nombre, artefacto=str(ruta), concordancia=meta["concordancia"])
+                return cargar(nombre, ruta), informe
+
+        Path(directorio).mkdir(parents=True, exist_ok=True)
+        muestras = muestras_calibracion()
+        motor = construir(nombre, extractor, muestras, ruta)
+        coseno = concordancia(extractor, motor, muestras)
+        if coseno < tolerancia:
+            print(f"⚠️ Motor {nombre} descartado: coseno mínimo {coseno:.4f} < {tolerancia}; se usa eager")
+            return extractor, informe
+        _guardar_atomico(ruta_meta, lambda destino: Path(destino).write_text(
+            json.dumps({**firma, "concordancia": round(coseno, 6), "muestras": len(muestras)})))
+        informe.update(motor=nombre, artefacto=str(ruta), concordancia=round(coseno, 6))
+        print(f"✅ Motor {nombre} compilado en {ruta} (coseno mínimo vs eager {coseno:.4f})")
+        return motor, informe
+    except Exception as e:
+        print(f"⚠️ Motor {nombre} no disponible ({e}); se usa eager")
+        return extractor, informe
+
+def muestras_aleatorias(cantidad: int = 16) -> torch.Tensor:
+    """Lote de respaldo cuando no hay imágenes para calibrar"""
+    return torch.rand((cantidad,) + FORMA_ENTRADA, generator=torch.Generator().manual_seed(0)) * 2 - 1
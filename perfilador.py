@@ -0,0 +1,58 @@
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# === PERFILADOR POR MUESTREO ===
+# Un hilo toma cada ``intervalo_ms`` la pila de todos los demás hilos (sys._current_frames) y cuenta
+# cuántas veces aparece cada una. Sin instrumentar el código, el costo es proporcional a la
+# frecuencia de muestreo y no a la cantidad de llamadas. El resultado usa el formato "plegado"
+# (una pila por línea: "hilo;función (archivo:línea);... muestras"), que leen flamegraph.pl,
+# speedscope y similares.
+
+class PerfiladorMuestreo:
+    """Muestreo de pilas de todos los hilos del proceso durante un intervalo"""
+
+    def __init__(self, intervalo_ms: float = 10.0):
+        self.intervalo_s = intervalo_ms / 1000
+        self.muestras = 0
+        self._pilas = Counter()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, name="perfilador", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> Counter:
+        self._detener.set()
+        self._hilo.join()
+        return self._pilas
+
+    def _bucle(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo_s):
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            for ident, cuadro in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = []
+                while cuadro is not None:
+                    codigo = cuadro.f_code
+                    pila.append(f"{codigo.co_name} ({Path(codigo.co_filename).name}:{codigo.co_firstlineno})")
+                    cuadro = cuadro.f_back
+                pila.append(nombres.get(ident, str(ident)))
+                self._pilas[";".join(reversed(pila))] += 1
+            self.muestras += 1
+
+def plegado(pilas: Counter) -> str:
+    """Pilas en formato plegado, de la más frecuente a la menos frecuente"""
+    return "".join(f"{pila} {cantidad}\n" for pila, cantidad in pilas.most_common())
+
+def perfilar(segundos: float, intervalo_ms: float = 10.0) -> str:
+    """Muestrea el proceso durante ``segundos`` (bloquea el hilo que llama) y devuelve el plegado"""
+    perfilador = PerfiladorMuestreo(intervalo_ms)
+    perfilador.iniciar()
+    time.sleep(segundos)
+    return plegado(perfilador.detener())
@@ -0,0 +1,52 @@
+from itertools import combinations
+from typing import Optional, Tuple
+
+import numpy as np
+
+from galeria import normalizar_filas
+
+# === PROTOTIPOS POR USUARIO ===
+# Las variaciones de registro (rotaciones de ±5°, contraste 0.9/1.1, ...) dan embeddings casi
+# iguales. En lugar de guardar las 11, se eligen 1 a 3 prototipos: los medoides (variaciones
+# reales que mejor representan al resto) o la media de cada grupo. La dispersión es la distancia
+# coseno media de cada variación a su prototipo más cercano: cuánto se pierde al comprimir, y
+# cuánto se baja el umbral de identificación de ese usuario (umbral_con_dispersion).
+
+METODOS = ("medoides", "media")
+
+def medoides(similitudes: np.ndarray, cantidad: int) -> np.ndarray:
+    """Índices de los ``cantidad`` medoides que minimizan la distancia coseno total (búsqueda exhaustiva).
+
+    Con 11 variaciones y hasta 3 prototipos son a lo sumo 165 combinaciones: se evalúan todas
+    en una sola operación en lugar de iterar como PAM.
+    """
+    distancias = 1.0 - similitudes
+    opciones = np.array(list(combinations(range(len(similitudes)), cantidad)))
+    costos = distancias[:, opciones].min(axis=2).sum(axis=0)
+    return opciones[int(np.argmin(costos))]
+
+def comprimir_embeddings(embeddings, cantidad: int = 1, metodo: str = "medoides") -> Tuple[np.ndarray, float]:
+    """(prototipos cantidad x dim, dispersión) de las variaciones de un registro"""
+    if metodo not in METODOS:
+        raise ValueError(f"Método de prototipos inválido: {metodo} (use {' | '.join(METODOS)})")
+    variaciones = normalizar_filas(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+    cantidad = max(1, min(cantidad, len(variaciones)))
+    similitudes = variaciones @ variaciones.T
+    elegidos = medoides(similitudes, cantidad)
+    if metodo == "media":
+        grupo = np.argmax(similitudes[:, elegidos], axis=1)  # cada variación con su medoide más cercano
+        prototipos = normalizar_filas(np.stack([variaciones[grupo == i].mean(axis=0) for i in range(cantidad)]))
+    else:
+        prototipos = variaciones[elegidos]
+    dispersion = float(np.mean(1.0 - (variaciones @ prototipos.T).max(axis=1)))
+    return prototipos, max(dispersion, 0.0)
+
+def umbral_con_dispersion(umbral: float, dispersion: Optional[float], margen: float = 1.0,
+                          maximo: float = 0.05) -> float:
+    """Umbral de un usuario: ``umbral`` menos ``margen`` veces su dispersión, sin bajar más que ``maximo``.
+
+    Sin dispersión (kp con las variaciones completas) queda el umbral general.
+    """
+    if dispersion is None:
+        return umbral
+    return umbral - min(margen * max(dispersion, 0.0), maximo)
@@ -0,0 +1,197 @@
+import os
+import pickle
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+import torch
+import torchvision.transforms.functional as TF
+from PIL import Image
+from torch.nn.functional import cosine_similarity
+from torchvision import transforms
+
+from motor_inferencia import MOTORES, muestras_aleatorias, preparar_motor
+
+# === MODELO Y TENSORES (PYTORCH) ===
+# Todo lo que necesita PyTorch y torchvision. main.py importa este módulo al calentar el proceso
+# o en la primera solicitud de reconocimiento: importar PyTorch tarda más que todo lo demás, y
+# las rutas que solo consultan la base no lo necesitan.
+
+def aplicar_aumentacion_tensor(imagen: torch.Tensor, nombres: Sequence[str]) -> torch.Tensor:
+    """Las mismas variaciones que aplicar_aumentacion (main.py), como operaciones sobre un tensor [3, H, W] en [0, 1]"""
+    generadores = {"original": lambda: imagen}
+
+    # 1. Rotación ligera
+    for angulo in [-5, 5, -10, 10]:
+        generadores[f"rotacion{angulo}"] = lambda a=angulo: TF.rotate(imagen, a)
+
+    # 2. Cambios de brillo
+    for factor in [0.8, 1.2]:
+        generadores[f"brillo{factor}"] = lambda f=factor: TF.adjust_brightness(imagen, f)
+
+    # 3. Cambios de contraste
+    for factor in [0.9, 1.1]:
+        generadores[f"contraste{factor}"] = lambda f=factor: TF.adjust_contrast(imagen, f)
+
+    # 4. Suavizado ligero
+    generadores["suavizado"] = lambda: TF.gaussian_blur(imagen, kernel_size=3, sigma=0.5)
+
+    # 5. Nitidez (UnsharpMask de PIL: radio 1, 150 %, umbral 3)
+    def nitidez():
+        detalle = imagen - TF.gaussian_blur(imagen, kernel_size=3, sigma=1.0)
+        return (imagen + 1.5 * detalle * (detalle.abs() > 3 / 255)).clamp(0, 1)
+    generadores["nitidez"] = nitidez
+
+    return torch.stack([generadores[nombre]() for nombre in nombres])
+
+def normalizar_embedding(embedding: torch.Tensor) -> torch.Tensor:
+    """Normaliza el embedding para mejorar la comparación"""
+    # Normalización L2
+    norm = torch.norm(embedding, p=2, dim=1, keepdim=True)
+    return embedding / (norm + 1e-8)
+
+transform = transforms.Compose([
+    transforms.Resize((100, 100)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+])
+# Mismo transform en dos pasos, para aumentar sobre el tensor antes de normalizar
+transform_redimensionar = transforms.Compose(transform.transforms[:2])
+transform_normalizar = transform.transforms[2]
+
+def lote_tensorial(rostro: Image.Image, nombres: Sequence[str]) -> torch.Tensor:
+    """Variaciones como operaciones de tensor sobre el rostro ya redimensionado"""
+    return transform_normalizar(aplicar_aumentacion_tensor(transform_redimensionar(rostro), nombres))
+
+def lote_de_imagenes(imagenes: Sequence[Image.Image]) -> torch.Tensor:
+    return torch.stack([transform(imagen) for imagen in imagenes])
+
+# Modelo y extractor
+class CNNClasificador(torch.nn.Module):
+    def __init__(self, num_classes):
+        super().__init__()
+        self.features = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 16, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
+            torch.nn.Conv2d(16, 32, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
+            torch.nn.Conv2d(32, 64, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2)
+        )
+        self.flatten = torch.nn.Flatten()
+        self.fc1 = torch.nn.Linear(64 * 12 * 12, 128)
+        self.relu = torch.nn.ReLU()
+        self.output = torch.nn.Linear(128, num_classes)
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.flatten(x)
+        x = self.fc1(x)
+        x = self.relu(x)
+        return self.output(x)
+
+class ExtractorEmbeddings(torch.nn.Module):
+    def __init__(self, modelo_entrenado):
+        super().__init__()
+        self.features = modelo_entrenado.features
+        self.flatten = modelo_entrenado.flatten
+        self.fc1 = modelo_entrenado.fc1
+        self.relu = modelo_entrenado.relu
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.flatten(x)
+        x = self.fc1(x)
+        x = self.relu(x)
+        return x
+
+# === Motor de inferencia del extractor ===
+# MOTOR_INFERENCIA=eager (por defecto) | torchscript | int8_dinamico | int8_estatico | onnx.
+# El artefacto compilado se guarda en MOTOR_DIR y se reutiliza mientras cnn_model.pth no cambie;
+# si sus embeddings se alejan de los eager más que MOTOR_TOLERANCIA (coseno mínimo) se usa eager.
+MOTOR_INFERENCIA = os.environ.get('MOTOR_INFERENCIA', 'eager')
+MOTOR_DIR = os.environ.get('MOTOR_DIR', 'modelos')
+MOTOR_TOLERANCIA = float(os.environ.get('MOTOR_TOLERANCIA', 0.99))
+MOTOR_MUESTRAS = int(os.environ.get('MOTOR_MUESTRAS', 64))
+if MOTOR_INFERENCIA not in MOTORES:
+    raise ValueError(f"MOTOR_INFERENCIA inválido: {MOTOR_INFERENCIA} (opciones: {', '.join(MOTORES)})")
+
+def muestras_calibracion(recortar: Callable[[Image.Image], Image.Image]) -> torch.Tensor:
+    """Rostros del dataset, recortados y normalizados como en la inferencia, para calibrar y verificar"""
+    rutas = sorted(p for p in Path("dataset_augmented").glob("*/*")
+                   if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    paso = max(1, len(rutas) // MOTOR_MUESTRAS)  # repartidas entre todas las personas
+    muestras = []
+    for ruta in rutas[::paso][:MOTOR_MUESTRAS]:
+        try:
+            muestras.append(transform(recortar(Image.open(ruta).convert("RGB"))))
+        except Exception:
+            continue
+    return torch.stack(muestras) if muestras else muestras_aleatorias()
+
+# === Cargar modelo entrenado y clases ===
+def cargar_modelo(recortar: Callable[[Image.Image], Image.Image], directorio: str = "."):
+    """Carga clases.pkl y cnn_model.pth de ``directorio`` y devuelve (clases, model, extractor, informe del motor)"""
+    ruta_pesos = os.path.join(directorio, "cnn_model.pth")
+    with open(os.path.join(directorio, "clases.pkl"), "rb") as f:
+        clases_cargadas = pickle.load(f)
+
+    modelo = CNNClasificador(num_classes=len(clases_cargadas))
+    if len(clases_cargadas) > 0:
+        modelo.load_state_dict(torch.load(ruta_pesos, map_location=torch.device("cpu")))
+    modelo.eval()
+    extractor_cargado = ExtractorEmbeddings(modelo)
+    extractor_cargado.eval()
+    informe = {"motor": "eager", "solicitado": MOTOR_INFERENCIA, "artefacto": None, "concordancia": None}
+    if len(clases_cargadas) > 0:
+        extractor_cargado, informe = preparar_motor(
+            MOTOR_INFERENCIA, extractor_cargado, ruta_pesos, lambda: muestras_calibracion(recortar),
+            directorio=MOTOR_DIR, tolerancia=MOTOR_TOLERANCIA)
+    return clases_cargadas, modelo, extractor_cargado, informe
+
+def modelo_vacio():
+    """(clases, model, extractor, informe) sin entrenar, para cuando no hay un modelo utilizable"""
+    modelo = CNNClasificador(num_classes=0)
+    modelo.eval()
+    extractor_vacio = ExtractorEmbeddings(modelo)
+    extractor_vacio.eval()
+    return [], modelo, extractor_vacio, {"motor": "eager", "solicitado": MOTOR_INFERENCIA,
+                                         "artefacto": None, "concordancia": None}
+
+def inferir_embeddings(lote: torch.Tensor, extractor) -> torch.Tensor:
+    """Embeddings L2-normalizados de un lote en una sola pasada del extractor"""
+    with torch.no_grad():
+        return normalizar_embedding(extractor(lote).float())
+
+def inferir_lotes(lotes: List[torch.Tensor], extractor) -> List[np.ndarray]:
+    """Una sola pasada para varios lotes; devuelve los embeddings de cada uno por separado"""
+    salida = inferir_embeddings(torch.cat(lotes), extractor)
+    return [embeddings.numpy() for embeddings in torch.split(salida, [len(lote) for lote in lotes])]
+
+def pasada_de_prueba(extractor) -> None:
+    """Una inferencia con un lote en blanco: inicializa los kernels antes de la primera solicitud"""
+    inferir_embeddings(torch.zeros((11, 3, 100, 100)), extractor)
+
+# === FUNCIÓN MEJORADA PARA COMPARAR EMBEDDINGS ===
+def comparar_embeddings_robustos(embedding_actual: torch.Tensor, embeddings_almacenados: List[torch.Tensor]) -> Tuple[float, float]:
+    """Compara embeddings usando múltiples métricas"""
+    embedding_actual_norm = normalizar_embedding(embedding_actual.unsqueeze(0)).squeeze()
+
+    similitudes_cosine = []
+    similitudes_euclidean = []
+
+    for emb_almacenado in embeddings_almacenados:
+        # Similitud coseno
+        sim_cos = cosine_similarity(embedding_actual_norm.unsqueeze(0), emb_almacenado.unsqueeze(0)).item()
+        similitudes_cosine.append(sim_cos)
+
+        # Distancia euclidiana normalizada
+        dist_euc = torch.norm(embedding_actual_norm - emb_almacenado).item()
+        sim_euc = 1.0 / (1.0 + dist_euc)  # Convertir distancia a similitud
+        similitudes_euclidean.append(sim_euc)
+
+    # Combinar métricas (promedio ponderado)
+    max_cosine = max(similitudes_cosine)
+    max_euclidean = max(similitudes_euclidean)
+
+    # Peso mayor para similitud coseno (más robusta)
+    similitud_final = 0.7 * max_cosine + 0.3 * max_euclidean
+
+    return similitud_final, max_cosine
@@ -0,0 +1,145 @@
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+PATRON_EPOCA = re.compile(r"Época (\d+)/(\d+)")
+PREFIJO_REPORTE = "📊 Reporte:"
+
+# === TRABAJO DE REENTRENAMIENTO ===
+class TrabajoReentrenamiento:
+    """Un reentrenamiento que agrupa todas las solicitudes recibidas dentro de la ventana"""
+
+    def __init__(self, trabajo_id: int, ventana_s: float):
+        self.id = trabajo_id
+        self.estado = "pendiente"      # pendiente | entrenando | completado | error
+        self.modo = "incremental"      # incremental | completo (basta una solicitud completa)
+        self.solicitudes = 0
+        self.creado = time.time()
+        self.ejecutar_desde = self.creado + ventana_s
+        self.inicio: Optional[float] = None
+        self.fin: Optional[float] = None
+        self.epoca = 0
+        self.total_epocas = 0
+        self.version_modelo: Optional[int] = None
+        self.reporte: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    def como_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "estado": self.estado,
+            "modo": self.modo,
+            "solicitudes": self.solicitudes,
+            "progreso": f"{self.epoca}/{self.total_epocas}" if self.total_epocas else None,
+            "duracion_s": round(self.fin - self.inicio, 2) if self.inicio and self.fin else None,
+            "version_modelo": self.version_modelo,
+            "reporte": self.reporte,
+            "error": self.error,
+        }
+
+# === COLA DE REENTRENAMIENTO EN SEGUNDO PLANO ===
+class ReentrenadorModelo:
+    """Ejecuta entrenar_modelo.py en un hilo de fondo, de a un entrenamiento a la vez.
+
+    Las solicitudes que llegan mientras hay un trabajo pendiente se agrupan en él; las que
+    llegan durante un entrenamiento crean el siguiente trabajo. Al terminar con éxito se
+    llama a ``al_terminar(modo)`` (que recarga el modelo) y su valor se guarda como versión.
+    ``bloqueo`` devuelve un context manager que excluye a los entrenamientos de otros procesos
+    (workers), que escriben los mismos cnn_model.pth y clases.pkl. ``al_finalizar(trabajo)`` se
+    llama después de cada trabajo, con éxito o con error (métricas).
+    """
+
+    def __init__(self, al_terminar: Callable[[str], int], ventana_s: float = 10.0,
+                 comando=None, historial: int = 10, bloqueo: Callable = nullcontext,
+                 al_finalizar: Optional[Callable[[TrabajoReentrenamiento], None]] = None):
+        self.al_terminar = al_terminar
+        self.al_finalizar = al_finalizar
+        self.bloqueo = bloqueo
+        self.ventana_s = ventana_s
+        self.comando = comando or [sys.executable, "entrenar_modelo.py"]
+        self._cond = threading.Condition()
+        self._pendiente: Optional[TrabajoReentrenamiento] = None
+        self._actual: Optional[TrabajoReentrenamiento] = None
+        self._historial = deque(maxlen=historial)
+        self._siguiente_id = 1
+        self._hilo: Optional[threading.Thread] = None
+
+    def solicitar(self, modo: str = "incremental") -> int:
+        """Programa un reentrenamiento (o se une al pendiente) y devuelve el id del trabajo"""
+        with self._cond:
+            if self._pendiente is None:
+                self._pendiente = TrabajoReentrenamiento(self._siguiente_id, self.ventana_s)
+                self._siguiente_id += 1
+            self._pendiente.solicitudes += 1
+            if modo == "completo":
+                self._pendiente.modo = "completo"
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="reentrenamiento", daemon=True)
+                self._hilo.start()
+            self._cond.notify()
+            return self._pendiente.id
+
+    def estado(self) -> dict:
+        with self._cond:
+            return {
+                "en_curso": self._actual.como_dict() if self._actual else None,
+                "pendiente": self._pendiente.como_dict() if self._pendiente else None,
+                "historial": [t.como_dict() for t in reversed(self._historial)],
+            }
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while self._pendiente is None:
+                    self._cond.wait()
+                # Esperar a que cierre la ventana para agrupar más solicitudes
+                while (espera := self._pendiente.ejecutar_desde - time.time()) > 0:
+                    self._cond.wait(timeout=espera)
+                trabajo, self._pendiente = self._pendiente, None
+                self._actual = trabajo
+            with self.bloqueo():
+                self._ejecutar(trabajo)
+            with self._cond:
+                self._actual = None
+                self._historial.append(trabajo)
+
+    def _ejecutar(self, trabajo: TrabajoReentrenamiento):
+        trabajo.estado = "entrenando"
+        trabajo.inicio = time.time()
+        print(f"🚀 Reentrenamiento #{trabajo.id} iniciado en modo {trabajo.modo} "
+              f"({trabajo.solicitudes} solicitudes agrupadas)")
+        try:
+            proceso = subprocess.Popen(self.comando + ["--modo", trabajo.modo], stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True, bufsize=1)
+            salida = deque(maxlen=20)
+            for linea in proceso.stdout:
+                salida.append(linea.rstrip())
+                coincidencia = PATRON_EPOCA.search(linea)
+                if coincidencia:
+                    trabajo.epoca, trabajo.total_epocas = map(int, coincidencia.groups())
+                elif linea.startswith(PREFIJO_REPORTE):
+                    trabajo.reporte = json.loads(linea[len(PREFIJO_REPORTE):])
+            if proceso.wait() != 0:
+                raise RuntimeError(f"entrenar_modelo.py terminó con código {proceso.returncode}: "
+                                   + " | ".join(salida))
+            if trabajo.reporte:
+                # Un incremental sin modelo previo termina siendo un entrenamiento completo
+                trabajo.modo = trabajo.reporte.get("modo", trabajo.modo)
+            trabajo.version_modelo = self.al_terminar(trabajo.modo)
+            trabajo.estado = "completado"
+            print(f"✅ Reentrenamiento #{trabajo.id} completado (modelo v{trabajo.version_modelo})")
+        except Exception as e:
+            trabajo.estado = "error"
+            trabajo.error = str(e)
+            print(f"⚠️ Error en el reentrenamiento #{trabajo.id}: {e}")
+            print("💡 Continuando con el modelo actual...")
+        finally:
+            trabajo.fin = time.time()
+            if self.al_finalizar is not None:
+                self.al_finalizar(trabajo)
@@ -0,0 +1,81 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import uuid
+import zipfile
+from pathlib import Path
+from urllib import request
+
+from registro_masivo import EXTENSIONES_IMAGEN, NOMBRES_MANIFIESTO
+
+# === CLIENTE DE REGISTRO MASIVO ===
+# Envía una carpeta (como rostros/), un manifiesto CSV o un ZIP a /registrar_usuarios_lote
+# y muestra el resultado de cada persona a medida que el servidor lo informa.
+
+ICONOS = {"registrado": "✅", "duplicado": "🔁", "error": "❌"}
+
+def empaquetar(ruta: Path) -> bytes:
+    """ZIP en memoria con las imágenes (y el manifiesto) de una carpeta o de un CSV"""
+    if ruta.suffix.lower() == ".zip":
+        return ruta.read_bytes()
+    if ruta.suffix.lower() == ".csv":
+        carpeta, archivos = ruta.parent, [(ruta, "manifiesto.csv")]
+        with open(ruta, newline="", encoding="utf-8-sig") as f:
+            for fila in csv.DictReader(f):
+                archivos.append((carpeta / fila["archivo"], Path(fila["archivo"]).name))
+    else:
+        archivos = [(p, p.name) for p in sorted(ruta.iterdir())
+                    if p.suffix.lower() in EXTENSIONES_IMAGEN or p.name.lower() in NOMBRES_MANIFIESTO]
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_STORED) as zip_salida:  # los JPEG ya están comprimidos
+        for origen, nombre in archivos:
+            if origen.exists():
+                zip_salida.write(origen, nombre)
+            else:
+                print(f"⚠️ No existe {origen}; el servidor lo informará como error")
+    return salida.getvalue()
+
+def multipart(campos: dict, nombre_archivo: str, contenido: bytes):
+    limite = uuid.uuid4().hex
+    partes = []
+    for clave, valor in campos.items():
+        partes.append(f'--{limite}\r\nContent-Disposition: form-data; name="{clave}"\r\n\r\n{valor}\r\n'.encode())
+    partes.append(f'--{limite}\r\nContent-Disposition: form-data; name="archivo"; filename="{nombre_archivo}"\r\n'
+                  f'Content-Type: application/zip\r\n\r\n'.encode() + contenido + b"\r\n")
+    partes.append(f"--{limite}--\r\n".encode())
+    return b"".join(partes), f"multipart/form-data; boundary={limite}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Registra muchos usuarios con una sola solicitud")
+    parser.add_argument("ruta", help="carpeta con fotos, manifiesto .csv o archivo .zip")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--dominio-correo", default="percepcion.local",
+                        help="dominio de los correos generados cuando el manifiesto no los trae")
+    args = parser.parse_args()
+
+    cuerpo, tipo = multipart({"dominio_correo": args.dominio_correo}, "lote.zip", empaquetar(Path(args.ruta)))
+    solicitud = request.Request(f"{args.url.rstrip('/')}/registrar_usuarios_lote", data=cuerpo,
+                                headers={"Content-Type": tipo}, method="POST")
+    codigo_salida = 0
+    with request.urlopen(solicitud) as respuesta:
+        for linea in respuesta:
+            evento = json.loads(linea)
+            if "total" in evento:
+                print(f"📦 {evento['total']} personas en el lote")
+            elif "error" in evento:
+                print(evento["error"])
+                codigo_salida = 1
+            elif "resumen" in evento:
+                r = evento["resumen"]
+                print(f"📊 {r['registrados']} registrados, {r['duplicados']} duplicados, {r['errores']} errores "
+                      f"en {r['duracion_s']} s (reentrenamiento: {evento['reentrenamiento']})")
+            else:
+                similitud = f" ({evento['similitud']:.4f})" if "similitud" in evento else ""
+                print(f"{ICONOS.get(evento['estado'], '•')} {evento['archivo']} [{evento['codigo']}] "
+                      f"{evento.get('detalle', '')}{similitud}")
+    return codigo_salida
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import csv
+import io
+import re
+import zipfile
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# === REGISTRO MASIVO DE USUARIOS ===
+# Un lote es un ZIP con imágenes (como la carpeta rostros/) y, opcionalmente, un manifiesto CSV
+# con las columnas archivo,nombre,apellido,codigo,correo,requisitoriado. Sin manifiesto, o para
+# las columnas vacías, los datos salen del nombre del archivo: "AdrianCisneros.jpg" ->
+# nombre "Adrian", apellido "Cisneros", código "AdrianCisneros".
+
+EXTENSIONES_IMAGEN = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+NOMBRES_MANIFIESTO = {"manifiesto.csv", "manifest.csv", "usuarios.csv"}
+VERDADEROS = {"1", "true", "si", "sí", "yes", "x"}
+ETIQUETAS = {"codigo": "Código", "correo": "Correo"}
+
+class LoteInvalido(ValueError):
+    """El archivo subido no se puede interpretar como un lote de registro"""
+
+class ItemRegistro:
+    """Una persona del lote con su foto y, tras procesarla, su resultado"""
+
+    def __init__(self, archivo: str, nombre: str, apellido: str, codigo: str, correo: str,
+                 requisitoriado: bool, imagen: Optional[bytes]):
+        self.archivo = archivo
+        self.nombre = nombre
+        self.apellido = apellido
+        self.codigo = codigo
+        self.correo = correo
+        self.requisitoriado = requisitoriado
+        self.imagen = imagen
+        self.embeddings: Optional[np.ndarray] = None
+        self.estado = "pendiente"     # pendiente | registrado | duplicado | error
+        self.detalle: Optional[str] = None
+        self.similitud: Optional[float] = None
+
+    def resultado(self) -> dict:
+        fila = {"archivo": self.archivo, "codigo": self.codigo, "estado": self.estado}
+        if self.detalle:
+            fila["detalle"] = self.detalle
+        if self.similitud is not None:
+            fila["similitud"] = round(self.similitud, 4)
+        return fila
+
+    def fallar(self, estado: str, detalle: str, similitud: Optional[float] = None):
+        self.estado, self.detalle, self.similitud = estado, detalle, similitud
+        self.imagen = self.embeddings = None  # liberar memoria del lote
+
+def separar_nombre(base: str):
+    """'AdrianCisneros' -> ('Adrian', 'Cisneros'); 'ana_maria_ruiz' -> ('Ana Maria', 'Ruiz')"""
+    partes = [p for p in re.split(r"[_\-\s.]+|(?<=[a-záéíóúñ])(?=[A-ZÁÉÍÓÚÑ])", base) if p]
+    if len(partes) < 2:
+        return base, ""
+    partes = [p[:1].upper() + p[1:] for p in partes]
+    return " ".join(partes[:-1]), partes[-1]
+
+def _es_imagen(ruta: str) -> bool:
+    nombre = PurePosixPath(ruta).name
+    return PurePosixPath(ruta).suffix.lower() in EXTENSIONES_IMAGEN and not nombre.startswith(".")
+
+def construir_items(imagenes: Dict[str, bytes], manifiesto: Optional[str], dominio_correo: str,
+                    max_items: int) -> List[ItemRegistro]:
+    """Combina las imágenes (nombre de archivo -> bytes) con el manifiesto CSV, si lo hay"""
+    por_nombre = {PurePosixPath(ruta).name: datos for ruta, datos in imagenes.items()}
+    if manifiesto is not None:
+        filas = list(csv.DictReader(io.StringIO(manifiesto)))
+        if filas and "archivo" not in filas[0]:
+            raise LoteInvalido("El manifiesto necesita la columna 'archivo'")
+    else:
+        filas = [{"archivo": nombre} for nombre in sorted(por_nombre)]
+    if len(filas) > max_items:
+        raise LoteInvalido(f"El lote tiene {len(filas)} personas; el máximo es {max_items}")
+
+    items = []
+    for fila in filas:
+        fila = {clave.strip().lower(): (valor or "").strip() for clave, valor in fila.items() if clave}
+        archivo = PurePosixPath(fila.get("archivo", "")).name
+        base = PurePosixPath(archivo).stem
+        nombre_archivo, apellido_archivo = separar_nombre(base)
+        codigo = fila.get("codigo") or base
+        items.append(ItemRegistro(
+            archivo=archivo,
+            nombre=fila.get("nombre") or nombre_archivo,
+            apellido=fila.get("apellido") or apellido_archivo,
+            codigo=codigo,
+            correo=fila.get("correo") or f"{codigo.lower()}@{dominio_correo}",
+            requisitoriado=fila.get("requisitoriado", "").lower() in VERDADEROS,
+            imagen=por_nombre.get(archivo),
+        ))
+    return items
+
+def leer_zip(datos: bytes, dominio_correo: str, max_items: int, max_bytes_imagen: int) -> List[ItemRegistro]:
+    """Items de un ZIP con imágenes y un manifiesto CSV opcional"""
+    try:
+        archivo_zip = zipfile.ZipFile(io.BytesIO(datos))
+    except zipfile.BadZipFile as e:
+        raise LoteInvalido(f"ZIP inválido: {e}")
+    imagenes, manifiesto = {}, None
+    with archivo_zip:
+        entradas = [info for info in archivo_zip.infolist() if not info.is_dir() and "__MACOSX" not in info.filename]
+        if sum(_es_imagen(info.filename) for info in entradas) > max_items:
+            raise LoteInvalido(f"El ZIP tiene más de {max_items} imágenes")
+        for info in entradas:
+            if PurePosixPath(info.filename).name.lower() in NOMBRES_MANIFIESTO:
+                manifiesto = archivo_zip.read(info).decode("utf-8-sig")
+            elif _es_imagen(info.filename):
+                if info.file_size > max_bytes_imagen:  # tamaño declarado, antes de descomprimir
+                    raise LoteInvalido(f"{info.filename} supera {max_bytes_imagen // (1024 * 1024)} MB")
+                imagenes[info.filename] = archivo_zip.read(info)
+    return construir_items(imagenes, manifiesto, dominio_correo, max_items)
+
+def marcar_repetidos(items: List[ItemRegistro]):
+    """Marca las personas cuyo código o correo ya apareció antes en el mismo lote"""
+    vistos = {}
+    for item in items:
+        for clave in (("codigo", item.codigo.lower()), ("correo", item.correo.lower())):
+            if item.estado == "pendiente" and clave in vistos:
+                item.fallar("error", f"⚠️ {ETIQUETAS[clave[0]]} repetido en el lote ({vistos[clave]})")
+        if item.estado == "pendiente":
+            vistos[("codigo", item.codigo.lower())] = item.archivo
+            vistos[("correo", item.correo.lower())] = item.archivo
+
+def duplicados_internos(puntajes: np.ndarray, umbral: float) -> List[Optional[int]]:
+    """Para cada persona, la primera anterior del lote con puntaje > umbral (o None).
+
+    ``puntajes`` es la matriz simétrica persona x persona; una persona marcada como duplicada
+    no se usa como referencia para las siguientes.
+    """
+    aceptadas: List[int] = []
+    resultado: List[Optional[int]] = []
+    for i in range(len(puntajes)):
+        previa = next((j for j in aceptadas if puntajes[i, j] > umbral), None)
+        resultado.append(previa)
+        if previa is None:
+            aceptadas.append(i)
+    return resultado
@@ -0,0 +1,134 @@
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# === SEGUIMIENTO DE ROSTROS ENTRE CUADROS DE VIDEO ===
+# El detector corre cada ``detectar_cada`` cuadros o cuando se pierde el rostro; entre medio la
+# caja se sigue por correlación de plantilla sobre una copia reducida de la zona de búsqueda.
+
+Caja = Tuple[int, int, int, int]  # x, y, w, h
+
+LADO_PLANTILLA = 48  # la plantilla se reduce a este ancho: el costo no depende del tamaño del rostro
+
+def iou(a: Caja, b: Caja) -> float:
+    ax2, ay2, bx2, by2 = a[0] + a[2], a[1] + a[3], b[0] + b[2], b[1] + b[3]
+    ancho = max(0, min(ax2, bx2) - max(a[0], b[0]))
+    alto = max(0, min(ay2, by2) - max(a[1], b[1]))
+    interseccion = ancho * alto
+    union = a[2] * a[3] + b[2] * b[3] - interseccion
+    return interseccion / union if union else 0.0
+
+class SeguidorRostro:
+    """Mantiene la caja del rostro principal a lo largo de una secuencia de cuadros RGB"""
+
+    def __init__(self, detectar: Callable[[np.ndarray], np.ndarray], detectar_cada: int = 10,
+                 umbral_correlacion: float = 0.6, cuadros_estable: int = 3):
+        self.detectar = detectar
+        self.detectar_cada = detectar_cada
+        self.umbral_correlacion = umbral_correlacion
+        self.cuadros_estable = cuadros_estable
+        self.caja: Optional[Caja] = None
+        self._plantilla: Optional[np.ndarray] = None
+        self._escala = 1.0
+        self._desde_deteccion = 0
+        self._seguidos = 0
+
+    @property
+    def estable(self) -> bool:
+        """La caja se mantuvo (solapada con la anterior) durante varios cuadros seguidos"""
+        return self.caja is not None and self._seguidos >= self.cuadros_estable
+
+    def reiniciar(self):
+        self.caja, self._plantilla, self._seguidos = None, None, 0
+
+    def actualizar(self, rgb: np.ndarray) -> Tuple[Optional[Caja], bool]:
+        """Caja del rostro en este cuadro (o None) y si hizo falta correr el detector"""
+        gris = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        if self.caja is not None and self._desde_deteccion < self.detectar_cada:
+            caja = self._seguir(gris)
+            if caja is not None:
+                self._aceptar(gris, caja)
+                self._desde_deteccion += 1
+                return caja, False
+
+        caras = self.detectar(rgb)
+        if len(caras) == 0:
+            self.reiniciar()
+            return None, True
+        x, y, w, h = (int(v) for v in max(caras, key=lambda c: c[2] * c[3]))
+        caja = (max(0, x), max(0, y), w, h)
+        self._aceptar(gris, caja)
+        self._desde_deteccion = 0
+        return caja, True
+
+    def _aceptar(self, gris: np.ndarray, caja: Caja):
+        anterior = self.caja
+        self._seguidos = self._seguidos + 1 if anterior is not None and iou(anterior, caja) > 0.5 else 1
+        self.caja = caja
+        x, y, w, h = caja
+        self._escala = min(1.0, LADO_PLANTILLA / max(w, 1))
+        self._plantilla = self._reducir(gris[y:y + h, x:x + w])
+
+    def _reducir(self, region: np.ndarray) -> np.ndarray:
+        if self._escala == 1.0:
+            return region
+        alto, ancho = region.shape[:2]
+        return cv2.resize(region, (max(1, round(ancho * self._escala)), max(1, round(alto * self._escala))),
+                          interpolation=cv2.INTER_AREA)
+
+    def _seguir(self, gris: np.ndarray) -> Optional[Caja]:
+        """Busca la plantilla en una zona del doble de tamaño alrededor de la última caja"""
+        x, y, w, h = self.caja
+        alto_img, ancho_img = gris.shape
+        x0, y0 = max(0, x - w // 2), max(0, y - h // 2)
+        x1, y1 = min(ancho_img, x + w + w // 2), min(alto_img, y + h + h // 2)
+        zona = self._reducir(gris[y0:y1, x0:x1])
+        plantilla = self._plantilla
+        if zona.shape[0] < plantilla.shape[0] or zona.shape[1] < plantilla.shape[1]:
+            return None
+        correlacion = cv2.matchTemplate(zona, plantilla, cv2.TM_CCOEFF_NORMED)
+        _, maximo, _, (px, py) = cv2.minMaxLoc(correlacion)
+        if maximo < self.umbral_correlacion:
+            return None
+        return (x0 + round(px / self._escala), y0 + round(py / self._escala), w, h)
+
+# === AGREGACIÓN DE IDENTIDAD EN UNA VENTANA DESLIZANTE ===
+class VentanaIdentidad:
+    """Promedia, usuario por usuario, los puntajes de los últimos ``tamano`` cuadros.
+
+    Cada cuadro guarda solo sus ``top`` mejores usuarios; un usuario ausente en un cuadro
+    cuenta como 0, así un parecido aislado no alcanza para identificar.
+    """
+
+    def __init__(self, tamano: int = 8, minimo: int = 3, umbral: float = 0.70, top: int = 5):
+        self.minimo = minimo
+        self.umbral = umbral
+        self.top = top
+        self._cuadros: deque = deque(maxlen=tamano)
+
+    def __len__(self) -> int:
+        return len(self._cuadros)
+
+    def reiniciar(self):
+        self._cuadros.clear()
+
+    def agregar(self, ids_usuarios: np.ndarray, puntajes: np.ndarray):
+        if puntajes.size > self.top:
+            mejores = np.argpartition(puntajes, -self.top)[-self.top:]
+            ids_usuarios, puntajes = ids_usuarios[mejores], puntajes[mejores]
+        self._cuadros.append(dict(zip(ids_usuarios.tolist(), puntajes.tolist())))
+
+    def resultado(self) -> Tuple[Optional[int], float, bool]:
+        """(mejor usuario, puntaje medio en la ventana, si ya hay cuadros suficientes para decidir)"""
+        if not self._cuadros:
+            return None, 0.0, False
+        sumas: Dict[int, float] = {}
+        for cuadro in self._cuadros:
+            for usuario_id, puntaje in cuadro.items():
+                sumas[usuario_id] = sumas.get(usuario_id, 0.0) + puntaje
+        if not sumas:
+            return None, 0.0, len(self._cuadros) >= self.minimo
+        mejor = max(sumas, key=sumas.get)
+        return mejor, sumas[mejor] / len(self._cuadros), len(self._cuadros) >= self.minimo
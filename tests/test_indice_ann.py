@@ -0,0 +1,49 @@
+"""Entrenamiento del índice IVF de la galería al crecer y al cargar instantáneas sin índice"""
+import numpy as np
+
+from benchmarks.comun import galeria_sintetica
+from galeria import GaleriaEmbeddings
+from indice_ann import IndiceIVF
+
+MIN_FILAS = 1100  # 100 usuarios de 11 variaciones
+
+def test_el_indice_se_entrena_al_superar_min_filas():
+    bloques = galeria_sintetica(200)
+    galeria = GaleriaEmbeddings(indice=IndiceIVF(min_filas=MIN_FILAS))
+    galeria.cargar((i + 1, bloque) for i, bloque in enumerate(bloques[:50]))
+    assert galeria.exportar()[3] is None  # por debajo de min_filas: búsqueda exacta
+
+    for i in range(50, 190):
+        galeria.aplicar_cambios([(i + 1, bloques[i])])
+    galeria.aplicar_cambios((i + 1, bloques[i]) for i in range(190, 200))
+
+    matriz, ids, listas, centroides = galeria.exportar()
+    assert centroides is not None
+    assert listas is not None and (listas >= 0).all() and (listas < len(centroides)).all()
+    assert len(galeria) == 200
+
+def test_instantanea_sin_indice_se_reindexa_al_cargarla():
+    bloques = galeria_sintetica(200)
+    origen = GaleriaEmbeddings()
+    origen.cargar((i + 1, bloque) for i, bloque in enumerate(bloques))
+    matriz, ids, _, _ = origen.exportar()
+
+    galeria = GaleriaEmbeddings(indice=IndiceIVF(min_filas=MIN_FILAS))
+    galeria.cargar_instantanea(matriz, ids, np.full(len(ids), -1, dtype=np.int32))
+    _, _, listas, centroides = galeria.exportar()
+    assert centroides is not None and (listas >= 0).all()
+
+    # Sin centroides publicados también se reindexa
+    galeria.cargar_instantanea(matriz, ids, listas, None)
+    assert galeria.exportar()[3] is not None
+
+def test_cambios_sobre_la_base_indexada_se_buscan():
+    bloques = galeria_sintetica(200)
+    galeria = GaleriaEmbeddings(indice=IndiceIVF(min_filas=MIN_FILAS, n_sondeos=4))
+    galeria.cargar((i + 1, bloque) for i, bloque in enumerate(bloques[:150]))
+    galeria.aplicar_cambios([(500, bloques[160]), (3, None)])
+
+    ids, puntajes = galeria.puntuar(bloques[160])
+    assert ids[int(np.argmax(puntajes))] == 500
+    assert 3 not in galeria.puntuar(bloques[2])[0]
+    assert len(galeria) == 150
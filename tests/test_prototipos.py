@@ -0,0 +1,36 @@
+"""Prototipos por usuario: compresión de las variaciones y umbral ajustado por la dispersión guardada"""
+import numpy as np
+import pytest
+
+from benchmarks.comun import galeria_sintetica
+from formato_kp import codificar_kp, dispersion_kp
+from prototipos import comprimir_embeddings, umbral_con_dispersion
+
+UMBRAL = 0.70
+
+def test_la_dispersion_baja_el_umbral():
+    assert umbral_con_dispersion(UMBRAL, 0.02) == pytest.approx(0.68)
+    assert umbral_con_dispersion(UMBRAL, 0.02, margen=0.5) == pytest.approx(0.69)
+
+def test_el_ajuste_tiene_tope():
+    assert umbral_con_dispersion(UMBRAL, 1.0, maximo=0.05) == pytest.approx(0.65)
+
+def test_sin_dispersion_queda_el_umbral_general():
+    assert umbral_con_dispersion(UMBRAL, None) == UMBRAL
+    assert umbral_con_dispersion(UMBRAL, 0.0) == UMBRAL
+
+@pytest.mark.parametrize("metodo", ["media", "medoides"])
+def test_dispersion_guardada_en_kp_cambia_la_decision(metodo):
+    variaciones = galeria_sintetica(1)[0]
+    prototipos, dispersion = comprimir_embeddings(variaciones, 1, metodo)
+    assert prototipos.shape == (1, variaciones.shape[1]) and dispersion > 0
+
+    kp = codificar_kp(prototipos, "f32", dispersion)
+    assert dispersion_kp(kp) == pytest.approx(dispersion)
+    assert dispersion_kp(codificar_kp(prototipos, "f32")) is None
+    assert dispersion_kp(codificar_kp(prototipos, "json", dispersion)) is None
+
+    # Un puntaje justo debajo del umbral general identifica al usuario con su umbral propio
+    umbral = umbral_con_dispersion(UMBRAL, dispersion_kp(kp))
+    puntaje = UMBRAL - min(dispersion, 0.05) / 2
+    assert umbral < puntaje <= UMBRAL
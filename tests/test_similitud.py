@@ -0,0 +1,63 @@
+"""El motor vectorizado de la galería frente a comparar_embeddings_robustos (el bucle original)"""
+import numpy as np
+import pytest
+import torch
+
+from benchmarks.comun import galeria_sintetica
+from galeria import GaleriaEmbeddings, similitudes_combinadas
+from reconocimiento import comparar_embeddings_robustos
+
+# La distancia euclidiana sale de la identidad de Gram: con una consulta idéntica a un embedding
+# guardado la raíz de un valor casi nulo deja un error de ~1e-4 en el puntaje
+TOLERANCIA = 1e-3
+
+@pytest.fixture(scope="module")
+def usuarios():
+    usuarios = galeria_sintetica(60)
+    # Caso borde: un usuario con un embedding nulo (ReLU totalmente apagada)
+    usuarios[-1, 0] = 0.0
+    return usuarios
+
+def referencia(consulta: torch.Tensor, usuarios: np.ndarray) -> np.ndarray:
+    """(similitud combinada, máximo coseno) de la consulta contra cada usuario con el bucle original"""
+    return np.array([comparar_embeddings_robustos(consulta, [torch.tensor(e) for e in bloque])
+                     for bloque in usuarios])
+
+def consultas_de_prueba(usuarios: np.ndarray) -> np.ndarray:
+    rng = np.random.default_rng(3)
+    ruidosas = usuarios[7] + 0.05 * rng.random(usuarios[7].shape, dtype=np.float32)
+    # Una consulta idéntica a un embedding guardado: el peor caso numérico de la identidad de Gram
+    return np.concatenate([usuarios[len(usuarios) // 2, :2], ruidosas[:3]])
+
+def test_similitud_combinada_por_consulta(usuarios):
+    galeria = GaleriaEmbeddings()
+    galeria.cargar((i + 1, bloque) for i, bloque in enumerate(usuarios))
+    matriz, ids = galeria.instantanea()
+    inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    consultas = consultas_de_prueba(usuarios)
+
+    obtenido = similitudes_combinadas(consultas, matriz, np.linalg.norm(matriz, axis=1), inicios)
+    for consulta, fila in zip(consultas, obtenido):
+        esperado, _ = referencia(torch.from_numpy(consulta.copy()), usuarios).T
+        np.testing.assert_allclose(fila, esperado, atol=TOLERANCIA)
+
+def test_puntuar_toma_el_maximo_por_usuario(usuarios):
+    galeria = GaleriaEmbeddings()
+    galeria.cargar((i + 1, bloque) for i, bloque in enumerate(usuarios))
+    consultas = consultas_de_prueba(usuarios)
+
+    ids, puntajes = galeria.puntuar(consultas)
+    esperado = np.max([referencia(torch.from_numpy(c.copy()), usuarios)[:, 0] for c in consultas], axis=0)
+
+    assert list(ids) == list(range(1, len(usuarios) + 1))
+    np.testing.assert_allclose(puntajes, esperado, atol=TOLERANCIA)
+    assert int(np.argmax(puntajes)) == int(np.argmax(esperado))
+
+def test_mejor_usuario_con_una_consulta_ruidosa(usuarios):
+    galeria = GaleriaEmbeddings()
+    galeria.cargar((i + 1, bloque) for i, bloque in enumerate(usuarios))
+    consulta = consultas_de_prueba(usuarios)[2]
+
+    ids, puntajes = galeria.puntuar(consulta)
+    esperado = referencia(torch.from_numpy(consulta.copy()), usuarios)[:, 0]
+    assert ids[int(np.argmax(puntajes))] == int(np.argmax(esperado)) + 1 == 8
@@ -0,0 +1,27 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Tiempos por etapa (ms) de la solicitud en curso; None fuera de una solicitud medida
+_tiempos: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("tiempos", default=None)
+
+def iniciar() -> Dict[str, float]:
+    """Empieza a registrar las etapas de la solicitud actual y devuelve el diccionario"""
+    tiempos: Dict[str, float] = {}
+    _tiempos.set(tiempos)
+    return tiempos
+
+@contextmanager
+def etapa(nombre: str):
+    """Suma la duración del bloque a la etapa ``nombre`` de la solicitud actual"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos = _tiempos.get()
+        if tiempos is not None:
+            tiempos[nombre] = tiempos.get(nombre, 0.0) + (time.perf_counter() - inicio) * 1000
+
+def resumen(ruta: str, tiempos: Dict[str, float]) -> str:
+    return f"⏱️ {ruta}: " + " | ".join(f"{nombre} {ms:.1f} ms" for nombre, ms in tiempos.items())